@@ -0,0 +1,81 @@
+"""
+Historical backfill benchmark: the linear first sync (process_user_inbox) against
+the windowed parallel backfill (backfill.py) at several worker counts.
+
+Runs offline over a FakeGmailService with a simulated round-trip latency, so the
+numbers show how much of a multi-year backfill is spent waiting on Gmail and
+how much of it overlapping windows win back, with the backfill limiter at
+--quota units/s. Gmail's real per-user quota is 250 units/s and each message
+costs 5 units for its headers and 5 for its body, so `--quota 250` shows the
+ceiling a real backfill runs into; the linear sync has no limiter and would be
+throttled at that rate. Ingestion only: categorization is queued, as in a real
+backfill.
+
+Usage:
+    python benchmarks/bench_backfill.py [--messages 4000] [--latency 0.05] [--workers 1 4 8] [--quota 100000 250]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+import process_email  # noqa: E402
+from backfill import backfill_user_inbox  # noqa: E402
+from gmail_fetch import QUOTA_UNITS_PER_SECOND, gmail_limiter  # noqa: E402
+from metrics import METRICS  # noqa: E402
+
+from corpus import synthetic_corpus  # noqa: E402
+from fake_gmail import FakeGmailService  # noqa: E402
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def fresh_database(path):
+    for suffix in ('', '-wal', '-shm'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{path}{suffix}")
+    process_email.DB_NAME = str(path)
+    process_email.initialize_db()
+
+
+def run(label, records, db_path, latency, workers=None, quota=QUOTA_UNITS_PER_SECOND):
+    fresh_database(db_path)
+    service = FakeGmailService(records, latency=latency)
+    METRICS.reset()
+    start = time.perf_counter()
+    if workers is None:
+        processed = process_email.process_user_inbox(service, 0)
+    else:
+        processed = backfill_user_inbox(lambda: service, 0, since=START.date().isoformat(), workers=workers,
+                                        limiter=gmail_limiter(workers, quota))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {processed:>9} {elapsed:>8.2f} {processed / elapsed:>8.0f} "
+          f"{service.calls['list']:>6} {service.calls['batch']:>7}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=4000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated Gmail round-trip, seconds.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--quota', type=int, nargs='+', default=[100_000],
+                        help="Gmail quota units per second for the backfill limiter.")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    records = synthetic_corpus(args.messages, start=START)
+    print(f"{args.messages} messages over two years, {args.latency * 1000:.0f} ms per Gmail round-trip\n", flush=True)
+    print(f"{'Run':<22} {'Messages':>9} {'Seconds':>8} {'msg/s':>8} {'lists':>6} {'batches':>7}")
+    with tempfile.TemporaryDirectory(prefix='cashmate-backfill-') as tmp:
+        db_path = Path(tmp) / 'backfill.db'
+        run('linear first sync', records, db_path, args.latency)
+        for quota in args.quota:
+            for workers in args.workers:
+                run(f'backfill x{workers} @{quota}/s', records, db_path, args.latency, workers, quota)
@@ -0,0 +1,98 @@
+"""
+Transaction export benchmark (export.py): streamed CSV, JSON Lines, Arrow and
+Parquet exports against a fetchall() baseline that loads the table first.
+
+A synthetic history is written to a temporary database with the real schema.
+Reports rows/s, peak Python memory (tracemalloc: the row tuples SQLite hands
+back, which is what chunking bounds; pyarrow's own buffers are not counted)
+and file size for a full export, then the time an incremental re-export takes
+after a day of new rows.
+
+Usage:
+    python benchmarks/bench_export.py [--rows 500000] [--chunk-size 50000] [--format csv jsonl arrow parquet]
+"""
+import argparse
+import csv
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from category_rules import CATEGORIES  # noqa: E402
+from export import COLUMNS, export_transactions  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+VENDORS = ['SQ *CORNER CAFE', 'PUBLIX #1123', 'SHELL OIL 5531', 'AMAZON MKTPL', 'NETFLIX.COM', 'TARGET 00012',
+           'CHEWY.COM', 'DUKE ENERGY', 'TST* TACO BAR', 'HOME DEPOT #254', 'UBER *TRIP', 'CVS/PHARMACY #881']
+
+
+def synthetic_rows(count, rng, prefix=''):
+    return [(number % 3, 'pnc', f"{2015 + number % 10}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             f"{prefix}{rng.choice(VENDORS)} {number}", rng.randint(200, 25000), rng.choice(CATEGORIES))
+            for number in range(count)]
+
+
+def fetchall_csv(conn, path):
+    """The baseline: the whole table in memory, then written out."""
+    rows = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM transactions").fetchall()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+    return {'rows': len(rows), 'path': str(path)}
+
+
+def measure(label, function, trace=True):
+    """Times `function`, then (if `trace`) runs it again under tracemalloc for the peak, since tracing is slow."""
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = '-'
+    if trace:
+        tracemalloc.start()
+        function()
+        peak = f"{tracemalloc.get_traced_memory()[1] / 2**20:.1f}"
+        tracemalloc.stop()
+    size = Path(result['path']).stat().st_size
+    print(f"{label:<30} {result['rows']:>9} {elapsed:>8.2f} {result['rows'] / elapsed if elapsed else 0:>10.0f} "
+          f"{peak:>9} {size / 2**20:>8.1f}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    parser.add_argument('--format', dest='formats', nargs='+', default=['csv', 'jsonl', 'arrow', 'parquet'])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory(prefix='cashmate-export-') as tmp:
+        tmp = Path(tmp)
+        conn = sqlite3.connect(str(tmp / 'export.db'))
+        migrate(conn)
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO transactions (user_pk, bank, date, vendor, amount_cents, category)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, synthetic_rows(args.rows, rng))
+        print(f"{args.rows} transactions, {args.chunk_size} rows per chunk\n")
+        print(f"{'Run':<30} {'Rows':>9} {'Seconds':>8} {'rows/s':>10} {'Peak MiB':>9} {'File MiB':>8}")
+
+        measure('fetchall() + csv (baseline)', lambda: fetchall_csv(conn, tmp / 'baseline.csv'))
+        for fmt in args.formats:
+            measure(f'full {fmt}', lambda: export_transactions(conn, tmp / f'tx.{fmt}', chunk_size=args.chunk_size))
+
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO transactions (user_pk, bank, date, vendor, amount_cents, category)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, synthetic_rows(200, rng, prefix='DAILY '))
+        for fmt in args.formats:
+            measure(f'incremental {fmt}', lambda: export_transactions(
+                conn, tmp / f'tx.{fmt}', incremental=True, chunk_size=args.chunk_size), trace=False)
+        conn.close()
@@ -0,0 +1,102 @@
+"""
+Mbox import benchmark: throughput and memory of import_mbox.py on a
+Takeout-style export, against the stub Gemini.
+
+A synthetic mailbox is written in chunks (mostly non-transaction mail, like a
+real inbox), then imported in a child process so its peak RSS is the import's
+alone. Importing two sizes shows whether memory stays flat as the file grows;
+a plain sequential read of the same file is the disk-speed ceiling.
+
+Usage:
+    python benchmarks/bench_mbox_import.py [--messages 20000 100000] [--noise 0.9] [--pad-kb 30] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(SRC))
+
+from corpus import synthetic_corpus, write_takeout_mbox  # noqa: E402
+from stub_gemini import StubGemini  # noqa: E402
+
+CHUNK = 5000
+
+# Runs in the child: one import into a fresh database, then timings and peak RSS as JSON
+CHILD = """
+import json, logging, resource, sys, time
+sys.path.insert(0, sys.argv[4])
+import process_email, import_mbox
+from llm_client import LLMClient
+from metrics import METRICS
+logging.disable(logging.WARNING)
+process_email.DB_NAME = sys.argv[2]
+process_email.LLM_CLIENT = LLMClient(url=sys.argv[3])
+process_email.initialize_db()
+start = time.perf_counter()
+processed = import_mbox.import_mbox(sys.argv[1], 0)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'seconds': elapsed,
+    'processed': processed,
+    'scanned': METRICS.value('mbox_messages_scanned_total'),
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def write_mailbox(path, count, noise_ratio, pad_kb=0, seed=0):
+    """Writes `count` synthetic messages, CHUNK at a time, so generation memory stays small too."""
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    with open(path, 'wb') as f:
+        for offset in range(0, count, CHUNK):
+            size = min(CHUNK, count - offset)
+            records = synthetic_corpus(size, seed=seed + offset, noise_ratio=noise_ratio,
+                                       start=start + timedelta(days=offset // 20))
+            for index, record in enumerate(records):
+                record['id'] = f"{offset + index + 1:016x}"
+            write_takeout_mbox(records, f, pad_bytes=pad_kb * 1024)
+    return os.path.getsize(path)
+
+
+def sequential_read_seconds(path, block=1 << 20):
+    start = time.perf_counter()
+    with open(path, 'rb', buffering=0) as f:
+        while f.read(block):
+            pass
+    return time.perf_counter() - start
+
+
+def run_import(mbox_path, db_path, llm_url):
+    result = subprocess.run([sys.executable, '-c', CHILD, str(mbox_path), str(db_path), llm_url, str(SRC)],
+                            cwd=SRC, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, nargs='+', default=[20_000, 100_000])
+    parser.add_argument('--noise', type=float, default=0.9, help="Fraction of mail no parser claims.")
+    parser.add_argument('--pad-kb', type=int, default=30, help="Filler per message (real mail averages tens of KB).")
+    parser.add_argument('--latency', type=float, default=0.05, help="Stub Gemini latency in seconds.")
+    args = parser.parse_args()
+
+    print(f"{'Messages':>9} {'MB':>7} {'Claimed':>8} {'Seconds':>8} {'MB/s':>7} {'msg/s':>8} {'Read MB/s':>10} {'Peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory(prefix='cashmate-mbox-') as tmp, StubGemini(latency=args.latency) as stub:
+        for count in args.messages:
+            mbox_path = Path(tmp) / f'takeout-{count}.mbox'
+            size_mb = write_mailbox(mbox_path, count, args.noise, args.pad_kb) / 2**20
+            read_seconds = sequential_read_seconds(mbox_path)
+            stats = run_import(mbox_path, Path(tmp) / f'import-{count}.db', stub.url)
+            print(f"{stats['scanned']:>9} {size_mb:>7.1f} {stats['processed']:>8} {stats['seconds']:>8.2f} "
+                  f"{size_mb / stats['seconds']:>7.1f} {stats['scanned'] / stats['seconds']:>8.0f} "
+                  f"{size_mb / read_seconds:>10.0f} {stats['peak_rss_mb']:>12.1f}")
+            mbox_path.unlink()
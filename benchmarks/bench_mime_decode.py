@@ -0,0 +1,112 @@
+"""
+Microbenchmark: message body decoding.
+
+Compares the original JSON-payload walker (get_plain_text_body), the new
+JSON-payload path with HTML fallback (get_message_text) and the raw-MIME path
+(get_raw_message_text) on a corpus shaped like real notifications:
+
+  - Capital One: multipart/alternative, text/plain + text/html
+  - PNC:         HTML-only, quoted-printable, iso-8859-1
+  - Amazon:      multipart/mixed > multipart/alternative > html, plus an attachment
+
+Usage:
+    python benchmarks/bench_mime_decode.py [--messages 300] [--repeat 5]
+"""
+import argparse
+import base64
+import sys
+import timeit
+from email.message import EmailMessage
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from mime_decode import get_message_text, get_plain_text_body, get_raw_message_text  # noqa: E402
+
+CAPITALONE_TEXT = (
+    "Hi Leila,\n\nAs requested, we're notifying you that on November {day}, 2025, at WAWA {n}, "
+    "a pending authorization or purchase in the amount of ${amount} was placed or charged on your "
+    "Capital One Quicksilver Credit Card.\n\n" + "Questions? Visit capitalone.com.\n" * 20
+)
+PNC_HTML = (
+    "<html><head><style>td {{ font-family: Arial; }}</style></head><body><table>"
+    + "<tr><td>&nbsp;</td></tr>" * 30
+    + "<tr><td>A debit card purchase of ${amount} at TARGET T-{n}, ORLANDO FL was made on 11/{day}/2025.</td></tr>"
+    + "<tr><td>Café rewards apply.</td></tr></table></body></html>"
+)
+AMAZON_HTML = (
+    "<html><body><h1>Thanks for your order</h1>"
+    + "<div>Recommended for you: item</div>" * 40
+    + "<p>Order Total: ${amount}</p></body></html>"
+)
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def to_gmail_payload(part):
+    """Converts an EmailMessage into the JSON payload tree returned by format='full'."""
+    node = {
+        'mimeType': part.get_content_type(),
+        'headers': [{'name': name, 'value': str(value)} for name, value in part.items()],
+        'body': {},
+    }
+    if part.is_multipart():
+        node['parts'] = [to_gmail_payload(child) for child in part.iter_parts()]
+    else:
+        node['body'] = {'data': _b64(part.get_payload(decode=True))}
+    return node
+
+
+def build_corpus(count):
+    corpus = []
+    for n in range(count):
+        amount, day = f"{n % 90 + 1}.{n % 100:02d}", n % 28 + 1
+        msg = EmailMessage()
+        kind = n % 3
+        if kind == 0:
+            msg['From'] = 'Capital One <capitalone@notification.capitalone.com>'
+            msg.set_content(CAPITALONE_TEXT.format(day=day, n=n, amount=amount))
+            msg.add_alternative(f"<html><body><p>{CAPITALONE_TEXT.format(day=day, n=n, amount=amount)}</p></body></html>", subtype='html')
+        elif kind == 1:
+            msg['From'] = 'PNC Alerts <pncalerts@pnc.com>'
+            msg.set_content(PNC_HTML.format(day=day, n=n, amount=amount), subtype='html', charset='iso-8859-1', cte='quoted-printable')
+        else:
+            msg['From'] = 'Amazon.com <auto-confirm@amazon.com>'
+            msg.set_content(AMAZON_HTML.format(amount=amount), subtype='html')
+            msg.add_attachment(b'%PDF-1.4 ' * 2000, maintype='application', subtype='pdf', filename='invoice.pdf')
+        msg['Subject'] = 'Notification'
+        raw = msg.as_bytes()
+        corpus.append(({'id': str(n), 'payload': to_gmail_payload(msg)}, {'id': str(n), 'raw': _b64(raw)}))
+    return corpus
+
+
+def bench(name, func, messages, repeat):
+    def run():
+        return sum(1 for message in messages if func(message))
+    decoded = run()
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print(f"{name:<34} {decoded:>5}/{len(messages)} decoded  {best * 1000:>8.1f} ms  {len(messages) / best:>10.0f} msg/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    full_messages = [full for full, _raw in corpus]
+    raw_messages = [raw for _full, raw in corpus]
+
+    def original(message):
+        # The original walker raises on messages it can't descend into
+        try:
+            return get_plain_text_body(message)
+        except KeyError:
+            return None
+
+    bench("get_plain_text_body (full, orig)", original, full_messages, args.repeat)
+    bench("get_message_text (full)", get_message_text, full_messages, args.repeat)
+    bench("get_raw_message_text (raw)", get_raw_message_text, raw_messages, args.repeat)
@@ -0,0 +1,102 @@
+"""
+Recurring-charge detector benchmark (recurring.py): load + detect time at
+history sizes from thousands to hundreds of thousands of rows.
+
+A synthetic history mixes planted subscriptions (weekly, monthly, quarterly and
+yearly, some with a price change) with irregular everyday spending, written to
+a temporary database with the real schema. Reports the one-query load, the
+vectorized detection, a cached call (no new rows), and how many planted
+subscriptions were found versus everyday merchants wrongly flagged.
+
+Usage:
+    python benchmarks/bench_recurring.py [--rows 10000 100000 500000] [--subscriptions 40]
+"""
+import argparse
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from migrations import migrate  # noqa: E402
+from recurring import TransactionHistory, detect_recurring, epoch_day, iso_date, recurring_charges  # noqa: E402
+
+START_DAY = epoch_day('2015-01-01')
+CADENCES = [(7, 1), (30, 2), (91, 3), (365, 5)]  # (days, jitter)
+CITIES = ['ORLANDO FL', 'TAMPA FL', 'ATLANTA GA']
+
+
+def synthetic_history(rows, subscriptions, rng):
+    """(user_pk, bank, date, vendor, amount_cents, category) rows; returns (rows, planted vendor names)."""
+    history, planted = [], set()
+    span = max(1200, rows // 40)  # days covered: at least three years, so yearly charges repeat
+    for number in range(subscriptions):
+        name = "STREAM " + ''.join(rng.choices(string.ascii_uppercase, k=6))
+        planted.add(name.lower())
+        days, jitter = CADENCES[number % len(CADENCES)]
+        amount = rng.randint(500, 20000)
+        change_at = rng.randint(3, 12) if number % 3 == 0 else None
+        day = START_DAY + rng.randint(0, days)
+        charge = 0
+        while day < START_DAY + span:
+            if charge == change_at:
+                amount += rng.randint(100, 300)
+            history.append((0, 'capital_one', iso_date(day), f"SQ *{name}", amount, 'Subscriptions'))
+            day += days + rng.randint(-jitter, jitter)
+            charge += 1
+    # Everyday merchants, each seen under a few descriptors (store number, city)
+    descriptors = [
+        f"{name} #{rng.randint(1, 999)} {rng.choice(CITIES)}"
+        for name in (''.join(rng.choices(string.ascii_uppercase, k=7)) + ' MARKET' for _ in range(rows // 50 + 10))
+        for _variant in range(3)
+    ]
+    while len(history) < rows:
+        history.append((0, 'pnc', iso_date(START_DAY + rng.randint(0, span)), rng.choice(descriptors),
+                        rng.randint(200, 15000), 'Dining'))
+    return history, planted
+
+
+def build_database(path, rows, subscriptions, seed=0):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    history, planted = synthetic_history(rows, subscriptions, random.Random(seed))
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO transactions (user_pk, bank, date, vendor, amount_cents, category)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, history)
+    return conn, planted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--subscriptions', type=int, default=40)
+    args = parser.parse_args()
+
+    print(f"{'Rows':>8} {'load ms':>8} {'detect ms':>10} {'cached ms':>10} {'found':>7} {'false':>6} {'price chg':>10}")
+    with tempfile.TemporaryDirectory(prefix='cashmate-recurring-') as tmp:
+        for rows in args.rows:
+            conn, planted = build_database(str(Path(tmp) / f'history-{rows}.db'), rows, args.subscriptions)
+            as_of = epoch_day('2015-01-01') + max(1200, rows // 40)
+
+            start = time.perf_counter()
+            history = TransactionHistory.load(conn, 0)
+            loaded = time.perf_counter()
+            charges = detect_recurring(history, as_of)
+            detected = time.perf_counter()
+            recurring_charges(conn, 0, as_of)  # fills the cache
+            start_cached = time.perf_counter()
+            recurring_charges(conn, 0, as_of)
+            cached = time.perf_counter() - start_cached
+
+            found = sum(charge['vendor'] in planted for charge in charges)
+            false = len(charges) - found
+            changes = sum(charge['price_change'] is not None for charge in charges)
+            print(f"{len(history):>8} {(loaded - start) * 1000:>8.1f} {(detected - loaded) * 1000:>10.1f} "
+                  f"{cached * 1000:>10.2f} {found:>3}/{len(planted):<3} {false:>6} {changes:>10}")
+            conn.close()
@@ -0,0 +1,141 @@
+"""
+Startup benchmark: an "up to date, nothing to do" run in a fresh interpreter.
+
+Each run is a new `python` process that imports process_email, brings the
+database schema up to date, builds the real Gmail client from the cached
+discovery document and calls process_user_inbox() against a mailbox whose
+history is unchanged. Gmail's one history.list answer is canned with
+googleapiclient's HttpMockSequence, so no network or OAuth token is needed;
+everything else is the production code path.
+
+Reported per run (median and min over --runs):
+  - process:  wall time of the whole child process, interpreter start included
+  - import:   `import process_email`
+  - run:      initialize_db() + client build + process_user_inbox()
+  - baseline: `python -c pass`, the floor no change here can go below
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--importtime 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(SRC))
+
+from migrations import migrate  # noqa: E402
+from sync_state import SyncLedger  # noqa: E402
+from transaction_store import connect_db  # noqa: E402
+
+HISTORY_ID = '123456'
+TARGET_SECONDS = 1.0
+
+# Runs in the child. Timings start after interpreter start-up, so `import` is ours alone.
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import process_email
+imported = time.perf_counter()
+
+from googleapiclient.http import HttpMockSequence
+process_email.DB_NAME = sys.argv[1]
+process_email.initialize_db()
+http = HttpMockSequence([({'status': '200'}, json.dumps({'historyId': sys.argv[2]}))])
+service = process_email.build_gmail_service(http=http)
+processed = process_email.process_user_inbox(service, 0)
+done = time.perf_counter()
+
+print(json.dumps({'import': imported - start, 'run': done - imported, 'processed': processed}))
+"""
+
+
+def seed_database(db_path, history_id=HISTORY_ID):
+    """A database whose ledger already holds `history_id` for user 0 (what a finished sync leaves)."""
+    conn = connect_db(str(db_path))
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    ledger = SyncLedger(str(db_path), 0)
+    try:
+        ledger.finish(history_id)
+    finally:
+        ledger.close()
+
+
+def run_once(db_path, history_id=HISTORY_ID):
+    """
+    One up-to-date run in a new interpreter.
+
+    Returns:
+        Dict of seconds: 'process' (whole child), 'import' and 'run' (measured inside it).
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, str(db_path), history_id],
+        cwd=SRC, capture_output=True, text=True, check=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'},
+    )
+    elapsed = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings.pop('processed') != 0:
+        raise RuntimeError(f"expected a no-op run, child reported:\n{result.stderr}")
+    timings['process'] = elapsed
+    return timings
+
+
+def baseline_once():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def import_offenders(top):
+    """The `top` slowest imports (cumulative) under `python -X importtime`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import process_email'],
+                            cwd=SRC, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self_us, cumulative_us, name = (field.strip() for field in line[len('import time:'):].split('|'))
+        rows.append((int(cumulative_us), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def report(label, samples):
+    print(f"{label:<10} median {statistics.median(samples) * 1000:8.1f} ms   min {min(samples) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', type=int, nargs='?', const=15, metavar='TOP',
+                        help="Also list the TOP slowest imports of process_email.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cashmate-startup-') as tmp:
+        db_path = Path(tmp) / 'startup.db'
+        seed_database(db_path)
+        run_once(db_path)  # warm the OS file cache and create the schema
+        runs = [run_once(db_path) for _ in range(args.runs)]
+    baseline = [baseline_once() for _ in range(args.runs)]
+
+    print(f"--- Up-to-date run, {args.runs} fresh processes ---")
+    for key in ('process', 'import', 'run'):
+        report(key, [run[key] for run in runs])
+    report('baseline', baseline)
+    median = statistics.median(run['process'] for run in runs)
+    print(f"\nTarget: < {TARGET_SECONDS:.1f}s per up-to-date run -> {'OK' if median < TARGET_SECONDS else 'OVER'}")
+
+    if args.importtime:
+        print("\n--- Slowest imports (cumulative) ---")
+        for cumulative_us, name in import_offenders(args.importtime):
+            print(f"{cumulative_us / 1000:8.1f} ms  {name}")
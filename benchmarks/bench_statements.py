@@ -0,0 +1,85 @@
+"""
+Monthly statement benchmark (statements.py): a full render of every user x month,
+then the re-runs a daily job actually does — nothing changed, and one day of
+new transactions.
+
+Each user gets `--years` of synthetic history in a temporary database with the
+real schema. Reports wall time and statements rendered per run, in-process and
+with the process pool, to show that a re-run costs what changed, not the
+history.
+
+Usage:
+    python benchmarks/bench_statements.py [--users 3] [--years 5] [--per-month 120] [--format html pdf]
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from category_rules import CATEGORIES  # noqa: E402
+from migrations import migrate  # noqa: E402
+from statements import RENDER_WORKERS, generate_statements  # noqa: E402
+
+VENDORS = ['SQ *CORNER CAFE', 'PUBLIX #1123', 'SHELL OIL 5531', 'AMAZON MKTPL', 'NETFLIX.COM', 'TARGET 00012',
+           'CHEWY.COM', 'DUKE ENERGY', 'TST* TACO BAR', 'HOME DEPOT #254', 'UBER *TRIP', 'CVS/PHARMACY #881']
+
+
+def synthetic_rows(users, years, per_month, rng):
+    rows = []
+    for user_pk in range(users):
+        for month_index in range(years * 12):
+            month = f"{2020 + month_index // 12}-{month_index % 12 + 1:02d}"
+            for number in range(per_month):
+                vendor = rng.choice(VENDORS)
+                rows.append((user_pk, 'pnc', f"{month}-{rng.randint(1, 28):02d}", f"{vendor} {number}",
+                             rng.randint(200, 25000), rng.choice(CATEGORIES)))
+    return rows
+
+
+def timed_run(conn, out_dir, formats, workers):
+    start = time.perf_counter()
+    counts = generate_statements(conn, formats=formats, out_dir=out_dir, workers=workers)
+    return time.perf_counter() - start, counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--per-month', type=int, default=120)
+    parser.add_argument('--format', dest='formats', nargs='+', default=['html', 'pdf'])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = synthetic_rows(args.users, args.years, args.per_month, rng)
+    print(f"{len(rows)} transactions, {args.users * args.years * 12} statements ({', '.join(args.formats)})\n")
+    print(f"{'Run':<28} {'Workers':>8} {'Seconds':>8} {'Checked':>8} {'Rendered':>9}")
+    for workers in sorted({1, RENDER_WORKERS}):
+        with tempfile.TemporaryDirectory(prefix='cashmate-statements-') as tmp:
+            conn = sqlite3.connect(str(Path(tmp) / 'statements.db'))
+            migrate(conn)
+            with conn:
+                conn.executemany("""
+                    INSERT OR IGNORE INTO transactions (user_pk, bank, date, vendor, amount_cents, category)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, rows)
+            out_dir = Path(tmp) / 'out'
+
+            runs = [('full render', timed_run(conn, out_dir, args.formats, workers)),
+                    ('re-run, nothing changed', timed_run(conn, out_dir, args.formats, workers))]
+            last_month = f"{2020 + args.years - 1}-12"
+            with conn:
+                conn.executemany("""
+                    INSERT INTO transactions (user_pk, bank, date, vendor, amount_cents, category)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [(0, 'pnc', f"{last_month}-28", f"DAILY SYNC {number}", rng.randint(200, 9000), 'Dining')
+                      for number in range(8)])
+            runs.append(('re-run after a day of rows', timed_run(conn, out_dir, args.formats, workers)))
+            for name, (seconds, counts) in runs:
+                print(f"{name:<28} {workers:>8} {seconds:>8.3f} {counts['checked']:>8} {counts['rendered']:>9}")
+            conn.close()
@@ -0,0 +1,102 @@
+"""
+Microbenchmark: vendor canonicalization and the similarity index (vendor_index.py).
+
+Builds an index of synthetic merchants, then looks up descriptor variants the
+way card alerts spell them: a processor prefix, a store number, a city/state
+suffix, or a dropped letter. Reports per-lookup latency, how many variants
+reuse the right category, how often a merchant the index has never seen is
+wrongly matched, and how long an incremental refresh from `transactions` takes.
+
+Usage:
+    python benchmarks/bench_vendor_index.py [--vendors 1000 10000] [--lookups 20000]
+"""
+import argparse
+import random
+import sqlite3
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from category_rules import CATEGORIES, canonical_vendor  # noqa: E402
+from vendor_index import VendorIndex  # noqa: E402
+
+PREFIXES = ['SQ *', 'TST* ', 'PAYPAL *', '']
+CITIES = ['ORLANDO FL', 'TAMPA FL', 'ATLANTA GA', 'AUSTIN TX', '']
+
+
+def merchant_names(count, rng):
+    """Distinct two- or three-word merchant names."""
+    names = set()
+    while len(names) < count:
+        words = (''.join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 9)))
+                 for _ in range(rng.randint(2, 3)))
+        names.add(' '.join(words))
+    return sorted(names)
+
+
+def variant(name, rng):
+    """A card-descriptor spelling of `name`."""
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"{rng.choice(PREFIXES)}{name} #{rng.randint(1, 9999)} {rng.choice(CITIES)}".strip()
+    if kind == 1:
+        return f"{name} {rng.randint(100, 99999)}"
+    position = rng.randrange(1, len(name) - 1)
+    return name[:position] + name[position + 1:]  # a dropped letter
+
+
+def per_call_us(function, arguments):
+    start = time.perf_counter()
+    for argument in arguments:
+        function(argument)
+    return (time.perf_counter() - start) / len(arguments) * 1e6
+
+
+def refresh_seconds(names, categories):
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY, vendor TEXT, category TEXT)")
+    conn.executemany("INSERT INTO transactions (vendor, category) VALUES (?, ?)", zip(names, categories))
+    index = VendorIndex()
+    start = time.perf_counter()
+    index.refresh(conn)
+    full = time.perf_counter() - start
+    conn.execute("INSERT INTO transactions (vendor, category) VALUES (?, ?)", (names[0] + ' 2', categories[0]))
+    start = time.perf_counter()
+    index.refresh(conn)
+    return full, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--vendors', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'Vendors':>8} {'canon us':>9} {'exact us':>9} {'fuzzy us':>9} {'reused':>7} {'correct':>8} "
+          f"{'unseen hit':>11} {'refresh ms':>11} {'+1 row ms':>10}")
+    for count in args.vendors:
+        names = merchant_names(count * 2, rng)
+        rng.shuffle(names)
+        names, unseen = names[:count], names[count:]
+        categories = [rng.choice(CATEGORIES) for _ in names]
+        index = VendorIndex()
+        for name, category in zip(names, categories):
+            index.add(name, category)
+
+        picks = [rng.randrange(count) for _ in range(args.lookups)]
+        exact = [names[i] for i in picks]
+        variants = [variant(names[i], rng) for i in picks]
+        answers = [index.lookup(vendor) for vendor in variants]
+        reused = sum(answer is not None for answer in answers)
+        correct = sum(answer is not None and answer[0] == categories[i] for answer, i in zip(answers, picks))
+        false_matches = sum(index.lookup(vendor) is not None for vendor in unseen)
+        full, incremental = refresh_seconds(names, categories)
+
+        print(f"{count:>8} {per_call_us(canonical_vendor, variants):>9.1f} {per_call_us(index.lookup, exact):>9.1f} "
+              f"{per_call_us(index.lookup, variants):>9.1f} {reused / len(picks):>7.1%} "
+              f"{correct / max(reused, 1):>8.1%} {false_matches / len(unseen):>11.1%} "
+              f"{full * 1000:>11.1f} {incremental * 1000:>10.3f}")
@@ -0,0 +1,52 @@
+import pytest
+
+from corpus import load_corpus, synthetic_corpus
+from stub_gemini import StubGemini
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('cashmate', "CashMate offline benchmarks")
+    group.addoption('--run-large', action='store_true', help="Also run the 10k and 100k message corpora.")
+    group.addoption('--corpus', help="Also benchmark a recorded corpus (.jsonl or .mbox).")
+    group.addoption('--llm-latency', type=float, default=0.05, help="Stub Gemini latency in seconds.")
+    group.addoption('--llm-429', type=float, default=0.0, help="Fraction of stub Gemini requests answered with 429.")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', "large: corpus too big for a quick run (enable with --run-large)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-large'):
+        return
+    skip = pytest.mark.skip(reason="needs --run-large")
+    for item in items:
+        if 'large' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def stub_gemini(request):
+    with StubGemini(latency=request.config.getoption('--llm-latency'),
+                    rate_429=request.config.getoption('--llm-429')) as stub:
+        yield stub
+
+
+_CORPORA = {}
+
+
+@pytest.fixture
+def corpus(request):
+    """Synthetic corpus of `request.param` messages (generated once per session)."""
+    size = request.param
+    if size not in _CORPORA:
+        _CORPORA[size] = synthetic_corpus(size)
+    return _CORPORA[size]
+
+
+@pytest.fixture(scope='session')
+def recorded_corpus(request):
+    path = request.config.getoption('--corpus')
+    if not path:
+        pytest.skip("no --corpus given")
+    return load_corpus(path)
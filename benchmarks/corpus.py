@@ -0,0 +1,292 @@
+"""
+Message corpora for offline runs.
+
+A corpus is a list of Gmail message resources ("records") as returned by
+users.messages.get: id, threadId, labelIds, internalDate, historyId and either
+the JSON `payload` tree (format='full'), the base64url `raw` RFC 822 bytes
+(format='raw'), or both. FakeGmailService derives whichever form a request asks
+for, so a corpus recorded from a real inbox, imported from an mbox file, or
+generated synthetically all replay the same way.
+
+Corpora are stored as JSONL, one record per line.
+"""
+import base64
+import json
+import mailbox
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from email import policy
+from email.message import Message
+from email.parser import BytesParser
+from email.utils import format_datetime, parsedate_to_datetime
+
+_PARSER = BytesParser(policy=policy.compat32)
+_BODY_FROM = re.compile(rb'^(>*From )', re.MULTILINE)
+
+
+# --- JSONL / mbox I/O ---
+
+def save_jsonl(records, path):
+    """Writes records one per line. Returns the number written."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+
+def load_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_mbox(records, path):
+    """Appends each record's RFC 822 form to an mbox file (bodies only; Gmail IDs are not kept)."""
+    box = mailbox.mbox(path)
+    box.lock()
+    try:
+        for record in records:
+            box.add(raw_bytes(record))
+        box.flush()
+    finally:
+        box.unlock()
+        box.close()
+
+
+def write_takeout_mbox(records, f, pad_bytes=0):
+    """
+    Appends records to an open binary file in Google Takeout's mbox layout: each
+    message starts with "From <Gmail ID in decimal>@xxx <date>", and body lines
+    starting with "From " are mboxrd-escaped. `pad_bytes` of filler lines are
+    added to each message (multipart epilogue or trailing text) to mimic real
+    message sizes. Returns the number written.
+    """
+    padding = b'\n' + (b'x' * 75 + b'\n') * (pad_bytes // 76)
+    count = 0
+    for record in records:
+        sent = datetime.fromtimestamp(int(record['internalDate']) / 1000, timezone.utc)
+        f.write(f"From {int(record['id'], 16)}@xxx {sent:%a %b %d %H:%M:%S +0000 %Y}\n".encode('ascii'))
+        data = _BODY_FROM.sub(rb'>\1', raw_bytes(record))
+        f.write(data if data.endswith(b'\n') else data + b'\n')
+        if pad_bytes:
+            f.write(padding)
+        f.write(b'\n')
+        count += 1
+    return count
+
+
+def load_mbox(path):
+    """Builds raw-form records from an mbox file; IDs are sequential and dates come from the Date header."""
+    records = []
+    for index, message in enumerate(mailbox.mbox(path, create=False)):
+        data = message.as_bytes()
+        try:
+            internal_date = int(parsedate_to_datetime(message['Date']).timestamp() * 1000)
+        except (TypeError, ValueError):
+            internal_date = 0
+        records.append(_record(f"mbox{index:08d}", internal_date, raw=_b64encode(data)))
+    return records
+
+
+def load_corpus(path):
+    """Loads a .jsonl or .mbox corpus."""
+    return load_mbox(path) if str(path).endswith('.mbox') else load_jsonl(path)
+
+
+# --- Format Conversion ---
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _b64decode(data):
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _record(message_id, internal_date, **fields):
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'labelIds': ['INBOX'],
+        'internalDate': str(internal_date),
+        'historyId': str(internal_date // 1000),
+        **fields,
+    }
+
+
+def raw_bytes(record):
+    """The record's RFC 822 bytes, rebuilt from the payload tree if it was stored without `raw`."""
+    if 'raw' in record:
+        return _b64decode(record['raw'])
+    return _payload_to_message(record['payload']).as_bytes()
+
+
+def raw_base64(record):
+    """The record's format='raw' field."""
+    return record['raw'] if 'raw' in record else _b64encode(raw_bytes(record))
+
+
+def _payload_to_message(part):
+    message = Message()
+    for header in part.get('headers', ()):
+        if header['name'].lower() != 'content-transfer-encoding':
+            message[header['name']] = header['value']
+    if part.get('parts'):
+        if message['Content-Type'] is None:
+            message['Content-Type'] = part['mimeType']
+        message.set_payload([_payload_to_message(child) for child in part['parts']])
+    else:
+        if message['Content-Type'] is None:
+            message['Content-Type'] = part.get('mimeType', 'text/plain')
+        data = _b64decode(part['body']['data']) if part.get('body', {}).get('data') else b''
+        message['Content-Transfer-Encoding'] = 'base64'
+        message.set_payload(base64.encodebytes(data).decode('ascii'))
+    return message
+
+
+def payload_tree(record):
+    """The record's format='full' payload, parsed from `raw` if it was stored without one."""
+    if 'payload' in record:
+        return record['payload']
+    return _message_to_payload(_PARSER.parsebytes(raw_bytes(record)), '')
+
+
+def _message_to_payload(message, part_id):
+    node = {
+        'partId': part_id,
+        'mimeType': message.get_content_type(),
+        'filename': message.get_filename() or '',
+        'headers': [{'name': name, 'value': str(value)} for name, value in message.items()],
+    }
+    if message.is_multipart():
+        node['body'] = {'size': 0}
+        node['parts'] = [
+            _message_to_payload(child, f"{part_id}.{index}" if part_id else str(index))
+            for index, child in enumerate(message.get_payload())
+        ]
+    else:
+        data = message.get_payload(decode=True) or b''
+        node['body'] = {'size': len(data), 'data': _b64encode(data)}
+    return node
+
+
+def headers_of(record):
+    """Top-level headers as Gmail's [{'name', 'value'}] list, without decoding any body."""
+    if 'payload' in record:
+        return record['payload'].get('headers', [])
+    parsed = _PARSER.parsebytes(raw_bytes(record), headersonly=True)
+    return [{'name': name, 'value': str(value)} for name, value in parsed.items()]
+
+
+# --- Synthetic Corpora ---
+# Shaped like the notifications the configured parsers handle (see config.yaml):
+# Capital One text+HTML alerts, HTML-only PNC debit alerts, Amazon order
+# confirmations, plus unrelated mail the Gmail query filters out.
+
+_MERCHANT_WORDS = [
+    'WAWA', 'TARGET', 'PUBLIX', 'SHELL', 'CHIPOTLE', 'STARBUCKS', 'WALGREENS', 'COSTCO', 'KROGER',
+    'HOME DEPOT', 'LOWES', 'NETFLIX', 'SPOTIFY', 'UBER', 'LYFT', 'AMC', 'CVS', 'ALDI', 'DUNKIN',
+    'PANERA', 'SUBWAY', 'CHEVRON', 'EXXON', 'BEST BUY', 'IKEA', 'TRADER JOES', 'WHOLE FOODS',
+]
+_CITIES = ['ORLANDO FL', 'TAMPA FL', 'ATLANTA GA', 'PITTSBURGH PA', 'AUSTIN TX']
+_NOISE = [
+    ('newsletter@medium.com', 'Your daily digest'),
+    ('no-reply@github.com', '[CashMate] New pull request'),
+    ('capitalone@notification.capitalone.com', 'Your statement is ready'),
+]
+
+
+def _vendor_pool(size, rng):
+    return [f"{rng.choice(_MERCHANT_WORDS)} #{number}" for number in range(size)]
+
+
+def _headers(sender, subject, sent, content_type):
+    return [
+        {'name': 'From', 'value': sender},
+        {'name': 'To', 'value': 'me@example.com'},
+        {'name': 'Subject', 'value': subject},
+        {'name': 'Date', 'value': format_datetime(sent)},
+        {'name': 'MIME-Version', 'value': '1.0'},
+        {'name': 'Content-Type', 'value': content_type},
+    ]
+
+
+def _leaf(mime_type, text, charset='utf-8'):
+    return {
+        'mimeType': mime_type,
+        'headers': [{'name': 'Content-Type', 'value': f'{mime_type}; charset="{charset}"'}],
+        'body': {'data': _b64encode(text.encode(charset))},
+    }
+
+
+def _capital_one(vendor, amount, sent, boundary):
+    text = (
+        f"Hi,\n\nAs requested, we're notifying you that on {sent:%B} {sent.day}, {sent.year}, at {vendor}, "
+        f"a pending authorization or purchase in the amount of ${amount} was placed or charged on your "
+        "Capital One Quicksilver Credit Card.\n\nThanks for choosing Capital One."
+    )
+    return {
+        'mimeType': 'multipart/alternative',
+        'headers': _headers('Capital One <capitalone@notification.capitalone.com>',
+                            'A new transaction was charged to your account', sent,
+                            f'multipart/alternative; boundary="{boundary}"'),
+        'parts': [_leaf('text/plain', text), _leaf('text/html', f"<html><body><p>{text}</p></body></html>")],
+    }
+
+
+def _pnc(vendor, amount, sent, city):
+    html = (
+        "<html><head><style>td { font-family: Arial; }</style></head><body><table>"
+        f"<tr><td>A debit card purchase of ${amount} at {vendor}, {city} was made on "
+        f"{sent.month}/{sent.day}/{sent.year}.</td></tr><tr><td>PNC Alerts</td></tr></table></body></html>"
+    )
+    part = _leaf('text/html', html, charset='iso-8859-1')
+    part['headers'] = _headers('PNC Alerts <pncalerts@pnc.com>', 'Debit Card Purchase', sent,
+                               'text/html; charset="iso-8859-1"')
+    return part
+
+
+def _amazon(amount, sent):
+    html = f"<html><body><h1>Thanks for your order</h1><p>Order Total: ${amount}</p></body></html>"
+    part = _leaf('text/html', html)
+    part['headers'] = _headers('Amazon.com <auto-confirm@amazon.com>', 'Your Amazon.com order of 1 item', sent,
+                               'text/html; charset="utf-8"')
+    return part
+
+
+def _noise(sender, subject, sent):
+    part = _leaf('text/plain', "Nothing to see here.\n" * 5)
+    part['headers'] = _headers(sender, subject, sent, 'text/plain; charset="utf-8"')
+    return part
+
+
+def synthetic_corpus(count, seed=0, vendors=None, noise_ratio=0.1, start=datetime(2024, 1, 1, tzinfo=timezone.utc)):
+    """
+    Generates `count` format='full' records with deterministic content.
+
+    Vendors are drawn from a pool (default: count / 20, at least 50) with a
+    skewed distribution, so categorization sees the repeat merchants a real
+    inbox has. Roughly `noise_ratio` of the mail matches no parser query.
+    """
+    rng = random.Random(seed)
+    pool = _vendor_pool(vendors or max(50, count // 20), rng)
+    step = timedelta(days=730) / max(count, 1)
+    records = []
+    for index in range(count):
+        sent = start + step * index
+        # Pareto-distributed index: a few merchants account for most of the mail
+        vendor = pool[min(int(rng.paretovariate(1.2)) - 1, len(pool) - 1)]
+        amount = f"{rng.randint(1, 25000) / 100:.2f}"
+        roll = rng.random()
+        if roll < noise_ratio:
+            payload = _noise(*rng.choice(_NOISE), sent)
+        elif roll < noise_ratio + (1 - noise_ratio) * 0.6:
+            payload = _capital_one(vendor, amount, sent, f"=_b{index}")
+        elif roll < noise_ratio + (1 - noise_ratio) * 0.9:
+            payload = _pnc(vendor, amount, sent, rng.choice(_CITIES))
+        else:
+            payload = _amazon(amount, sent)
+        records.append(_record(f"{index:016x}", int(sent.timestamp() * 1000), payload=payload))
+    return records
@@ -0,0 +1,215 @@
+"""
+In-process stand-in for the googleapiclient Gmail service.
+
+Implements the slice of the API CashMate calls: users.messages.list (with
+pagination and a small query evaluator), users.messages.get in the
+'minimal'/'metadata'/'full'/'raw' formats, batch HTTP requests, getProfile and
+history.list. Every call is counted so runs can report round-trips, and an
+optional per-message 429 rate exercises the batch retry path.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from corpus import headers_of, payload_tree, raw_base64
+
+MAX_LIST_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 100
+
+_SENDER_SUBJECT = re.compile(r'from:(\S+)\s+subject:"([^"]*)"', re.IGNORECASE)
+_AFTER = re.compile(r'after:(\d+)')
+_BEFORE = re.compile(r'before:(\d+)')
+
+
+def _http_error(status, reason):
+    return HttpError(httplib2.Response({'status': status, 'reason': reason}), reason.encode())
+
+
+class _Request:
+    """A deferred call, like googleapiclient's HttpRequest."""
+
+    def __init__(self, service, kind, func):
+        self._service = service
+        self.kind = kind
+        self._func = func
+
+    def execute(self):
+        self._service.count(self.kind)
+        return self._func()
+
+
+class _BatchRequest:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        if len(self._requests) >= MAX_BATCH_SIZE:
+            raise ValueError(f"Exceeded the maximum of {MAX_BATCH_SIZE} calls in a single batch request.")
+        self._requests.append((request_id or str(len(self._requests)), request, callback or self._callback))
+
+    def execute(self):
+        self._service.count('batch')
+        for request_id, request, callback in self._requests:
+            try:
+                response, exception = request.execute(), None
+            except HttpError as error:
+                response, exception = None, error
+            callback(request_id, response, exception)
+
+
+class FakeGmailService:
+    """
+    Serves a corpus (see corpus.py) through the Gmail API call shapes.
+
+    Queries understand the subset CashMate generates: OR-ed
+    `(from:X subject:"Y")` groups, `after:<epoch seconds>` and
+    `before:<epoch seconds>`; any other query matches every message. Listing is
+    newest first, like Gmail. `latency` adds a round-trip delay to every call
+    (a batch request pays it once). `errors` maps message IDs to an HTTP status
+    every get of that message fails with.
+    """
+
+    def __init__(self, records, throttle_rate=0.0, seed=0, latency=0.0, errors=None):
+        self.records = sorted(records, key=lambda record: int(record['internalDate']), reverse=True)
+        self.by_id = {record['id']: record for record in self.records}
+        self.history_id = str(max((int(record['historyId']) for record in self.records), default=1))
+        self.throttle_rate = throttle_rate
+        self.latency = latency
+        self.errors = dict(errors or {})
+        self.calls = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._matches = {}
+        self._headers = {}
+
+    def count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+        if self.latency and kind != 'get':
+            time.sleep(self.latency)
+
+    # --- googleapiclient surface ---
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return _History(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _BatchRequest(self, callback)
+
+    def getProfile(self, userId):
+        return _Request(self, 'getProfile', lambda: {
+            'emailAddress': 'me@example.com',
+            'messagesTotal': len(self.records),
+            'historyId': self.history_id,
+        })
+
+    def list(self, userId, q='', maxResults=100, pageToken=None, **kwargs):
+        def execute():
+            matches = self._query_matches(q)
+            start = int(pageToken or 0)
+            end = start + min(maxResults, MAX_LIST_PAGE_SIZE)
+            response = {'resultSizeEstimate': len(matches)}
+            page = matches[start:end]
+            if page:
+                response['messages'] = [{'id': message_id, 'threadId': message_id} for message_id in page]
+            if end < len(matches):
+                response['nextPageToken'] = str(end)
+            return response
+        return _Request(self, 'list', execute)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        return _Request(self, 'get', lambda: self._get(id, format, metadataHeaders))
+
+    # --- Internals ---
+
+    def _get(self, message_id, msg_format, metadata_headers):
+        if self.throttle_rate:
+            with self._lock:
+                throttled = self._rng.random() < self.throttle_rate
+            if throttled:
+                raise _http_error(429, 'Too Many Requests')
+        if message_id in self.errors:
+            raise _http_error(self.errors[message_id], 'Backend Error')
+        record = self.by_id.get(message_id)
+        if record is None:
+            raise _http_error(404, 'Not Found')
+
+        message = {key: record[key] for key in ('id', 'threadId', 'labelIds', 'internalDate', 'historyId') if key in record}
+        if msg_format == 'raw':
+            message['raw'] = raw_base64(record)
+        elif msg_format == 'full':
+            message['payload'] = payload_tree(record)
+        elif msg_format == 'metadata':
+            wanted = {name.lower() for name in metadata_headers} if metadata_headers else None
+            headers, by_name = self._record_headers(record)
+            message['payload'] = {
+                'mimeType': by_name.get('content-type', 'text/plain').split(';')[0].strip(),
+                'headers': [header for header in headers if wanted is None or header['name'].lower() in wanted],
+            }
+        return message
+
+    def _record_headers(self, record):
+        """(Gmail header list, {lowercased name: value}) for a record (memoized)."""
+        cached = self._headers.get(record['id'])
+        if cached is None:
+            headers = headers_of(record)
+            cached = self._headers[record['id']] = (headers, {header['name'].lower(): header['value'] for header in headers})
+        return cached
+
+    def _query_matches(self, query):
+        """IDs matching `query`, newest first (memoized; the corpus never changes)."""
+        with self._lock:
+            if query in self._matches:
+                return self._matches[query]
+        pairs = [(sender.lower(), subject.lower()) for sender, subject in _SENDER_SUBJECT.findall(query)]
+        after = _AFTER.search(query)
+        after_ms = int(after.group(1)) * 1000 if after else None
+        before = _BEFORE.search(query)
+        before_ms = int(before.group(1)) * 1000 if before else None
+
+        matches = []
+        for record in self.records:
+            if after_ms is not None and int(record['internalDate']) <= after_ms:
+                continue
+            if before_ms is not None and int(record['internalDate']) >= before_ms:
+                continue
+            if pairs:
+                _headers, headers = self._record_headers(record)
+                sender, subject = headers.get('from', '').lower(), headers.get('subject', '').lower()
+                if not any(want_sender in sender and want_subject in subject for want_sender, want_subject in pairs):
+                    continue
+            matches.append(record['id'])
+        with self._lock:
+            self._matches[query] = matches
+        return matches
+
+
+class _History:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, maxResults=100, **kwargs):
+        def execute():
+            start = int(startHistoryId)
+            added = [
+                {'id': record['historyId'], 'messagesAdded': [{'message': {'id': record['id']}}]}
+                for record in self._service.records if int(record['historyId']) > start
+            ][:maxResults]
+            response = {'historyId': self._service.history_id}
+            if added:
+                response['history'] = added
+            return response
+        return _Request(self._service, 'history', execute)
@@ -0,0 +1,62 @@
+"""
+Records a real inbox into a corpus for offline replay (see replay.py).
+
+Lists the messages matching the configured parser query (or --query), fetches
+each one in both 'full' and 'raw' format with batch requests, and writes one
+JSON record per message. --mbox additionally writes the RFC 822 messages to an
+mbox file. Needs the same OAuth setup as process_email.py; run it from src/ so
+the user's token file is found.
+
+Usage:
+    python ../benchmarks/record_corpus.py leila --out corpus.jsonl [--max 5000] [--mbox corpus.mbox]
+"""
+import argparse
+import sys
+from itertools import islice
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from gmail_fetch import BATCH_SIZE, fetch_messages_batch, iter_message_ids  # noqa: E402
+from process_email import PARSERS, USER_MAP, get_gmail_service  # noqa: E402
+
+from corpus import save_jsonl, save_mbox  # noqa: E402
+
+
+def iter_recorded_messages(service, query, limit=None, batch_size=BATCH_SIZE):
+    """Yields corpus records (payload and raw) for the messages matching `query`, newest first."""
+    message_ids = islice(iter_message_ids(service, query), limit)
+    recorded = 0
+    while chunk := list(islice(message_ids, batch_size)):
+        full, _failed = fetch_messages_batch(service, chunk, msg_format='full')
+        raw, _failed = fetch_messages_batch(service, chunk, msg_format='raw')
+        for message_id in chunk:
+            if message_id in full and message_id in raw:
+                yield {**full[message_id], 'raw': raw[message_id]['raw']}
+                recorded += 1
+        print(f"Recorded {recorded} messages...")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record Gmail messages into a JSONL corpus for offline replay.")
+    parser.add_argument('user', help="User ID from USER_MAP (e.g. 'leila').")
+    parser.add_argument('--out', required=True, help="JSONL file to write.")
+    parser.add_argument('--query', help="Gmail search (default: every configured parser's sender/subject).")
+    parser.add_argument('--max', type=int, help="Stop after this many messages.")
+    parser.add_argument('--mbox', help="Also write the messages to this mbox file.")
+    args = parser.parse_args()
+
+    if args.user not in USER_MAP:
+        print(f"\nERROR: User ID '{args.user}' is not mapped to a database primary key. Add it to USER_MAP.")
+        sys.exit(1)
+
+    service = get_gmail_service(args.user)
+    if not service:
+        sys.exit(1)
+
+    records = list(iter_recorded_messages(service, args.query or PARSERS.query(), args.max))
+    count = save_jsonl(records, args.out)
+    print(f"Wrote {count} messages to {args.out}")
+    if args.mbox:
+        save_mbox(records, args.mbox)
+        print(f"Wrote {count} messages to {args.mbox}")
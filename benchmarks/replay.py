@@ -0,0 +1,126 @@
+"""
+Runs process_user_inbox() end to end with no network: Gmail is a
+FakeGmailService over a corpus, Gemini is a StubGemini on localhost, and the
+database is a scratch file. The categorization queue ingestion leaves behind is
+drained afterwards (category_worker.py), and timed separately.
+
+Usage:
+    python benchmarks/replay.py corpus.jsonl [--db /tmp/replay.db] [--latency 0.2] [--rate-429 0.05]
+    python benchmarks/replay.py --synthetic 10000
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+import process_email  # noqa: E402
+from category_worker import drain  # noqa: E402
+from log_config import configure_logging  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from pipeline import RateLimiter  # noqa: E402
+from transaction_store import TransactionStore  # noqa: E402
+
+from corpus import load_corpus, synthetic_corpus  # noqa: E402
+from fake_gmail import FakeGmailService  # noqa: E402
+from stub_gemini import StubGemini  # noqa: E402
+
+
+def run_offline(records, db_path, llm_url, user_pk=0, body_format=process_email.BODY_FORMAT,
+                gmail_throttle_rate=0.0, fresh=True, quiet=True):
+    """
+    One run over `records` into the database at `db_path`; with `fresh` the
+    database is deleted first, so the run is a cold backfill.
+
+    Returns:
+        Dict of run statistics (messages, seconds, messages_per_second, ingestion
+        and queue-drain seconds, Gmail calls, DB write time, row counts and the
+        per-stage metrics summary).
+        LLM counters live on the stub.
+    """
+    if fresh:
+        for suffix in ('', '-wal', '-shm'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{db_path}{suffix}")
+
+    # process_email reads these module globals at call time
+    process_email.DB_NAME = str(db_path)
+    process_email.LLM_CLIENT = LLMClient(url=llm_url)
+    process_email.LLM_LIMITER = RateLimiter()
+
+    service = FakeGmailService(records, throttle_rate=gmail_throttle_rate)
+    if quiet:
+        logging.disable(logging.WARNING)
+    try:
+        process_email.initialize_db()
+        store = TransactionStore(str(db_path))
+        METRICS.reset()
+        start = time.perf_counter()
+        try:
+            processed = process_email.process_user_inbox(service, user_pk, store=store, body_format=body_format)
+            ingested = time.perf_counter()
+            drain(str(db_path))
+        finally:
+            store.close()
+            process_email.LLM_CLIENT.close()
+        elapsed = time.perf_counter() - start
+    finally:
+        logging.disable(logging.NOTSET)
+
+    db_write = METRICS.stage_stats('db_write')
+    llm_connect = METRICS.stage_stats('llm_connect')
+    return {
+        'messages': processed or 0,
+        'seconds': elapsed,
+        'messages_per_second': (processed or 0) / elapsed if elapsed else 0.0,
+        'ingest_seconds': ingested - start,
+        'categorize_seconds': elapsed - (ingested - start),
+        'gmail_calls': dict(service.calls),
+        'db_write_seconds': db_write['total_seconds'],
+        'db_writes': db_write['count'],
+        'llm_connections': llm_connect['count'],
+        'llm_connect_seconds': llm_connect['total_seconds'],
+        'saved': store.inserted,
+        'duplicates': store.skipped,
+        'metrics': METRICS.summary(),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a message corpus through the full pipeline, offline.")
+    parser.add_argument('corpus', nargs='?', help="Recorded corpus (.jsonl or .mbox).")
+    parser.add_argument('--synthetic', type=int, metavar='N', help="Use N generated messages instead of a corpus file.")
+    parser.add_argument('--db', help="Scratch database path (default: a temporary file).")
+    parser.add_argument('--body-format', choices=['full', 'raw'], default=process_email.BODY_FORMAT)
+    parser.add_argument('--latency', type=float, default=0.2, help="Stub Gemini latency in seconds.")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Fraction of Gemini requests answered with 429.")
+    parser.add_argument('--gmail-429', type=float, default=0.0, help="Fraction of Gmail message fetches failing with 429.")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output.")
+    args = parser.parse_args()
+    configure_logging('INFO' if args.verbose else 'WARNING')
+
+    if not args.corpus and not args.synthetic:
+        parser.error("give a corpus file or --synthetic N")
+    records = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='cashmate-replay-'), 'replay.db')
+
+    with StubGemini(latency=args.latency, rate_429=args.rate_429) as stub:
+        stats = run_offline(records, db_path, stub.url, body_format=args.body_format,
+                            gmail_throttle_rate=args.gmail_429, quiet=not args.verbose)
+
+    print(f"\n--- Replay: {len(records)} messages in corpus ({args.body_format}) ---")
+    print(f"Processed:      {stats['messages']} messages in {stats['seconds']:.2f}s ({stats['messages_per_second']:.0f} msg/s)")
+    print(f"Split:          {stats['ingest_seconds']:.2f}s ingestion, {stats['categorize_seconds']:.2f}s draining the category queue")
+    print(f"Gmail calls:    {', '.join(f'{kind}={count}' for kind, count in sorted(stats['gmail_calls'].items()))}")
+    print(f"LLM calls:      {stub.requests} ({stub.throttled} throttled, {stub.transactions} transactions)")
+    print(f"LLM connects:   {stats['llm_connections']} ({stats['llm_connect_seconds'] * 1000:.1f} ms total)")
+    print(f"DB writes:      {stats['db_writes']} transactions, {stats['db_write_seconds'] * 1000:.1f} ms")
+    print(f"Rows:           {stats['saved']} saved, {stats['duplicates']} duplicates skipped")
+    print(f"Database:       {db_path}")
+    print(f"\n{METRICS.format_summary()}")
@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Gemini generateContent endpoint.
+
+Answers single-transaction prompts with a category string and batch prompts
+(<Transaction index="N"> records) with the JSON array BATCH_INSTRUCTIONS asks
+for. Categories are a stable hash of the merchant, so repeated runs agree.
+Latency and a 429 rate (with Retry-After) are configurable to reproduce quota
+pressure without a network.
+
+Usage (standalone; point GEMINI_API_URL at the printed URL):
+    python benchmarks/stub_gemini.py --port 8089 --latency 0.3 --rate-429 0.05
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
+
+from category_rules import CATEGORIES  # noqa: E402
+
+_TRANSACTION = re.compile(r'<Transaction(?: index="(\d+)")?>Merchant: (.*?)\n', re.DOTALL)
+
+
+def stub_category(merchant):
+    return CATEGORIES[zlib.crc32(merchant.strip().lower().encode()) % len(CATEGORIES)]
+
+
+class StubGemini:
+    """
+    Threaded HTTP server on 127.0.0.1. Use as a context manager; `url` is the
+    generateContent URL to use in place of GEMINI_API_URL.
+
+    Counters: requests (all calls), throttled (429s returned), transactions
+    (records categorized in successful responses).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1, port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.requests = 0
+        self.throttled = 0
+        self.transactions = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1beta/models/stub:generateContent?key=stub"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serves on the calling thread until interrupted."""
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, body):
+        """(status, headers, response body) for one generateContent request."""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            throttle = self._rng.random() < self.rate_429
+            if throttle:
+                self.throttled += 1
+        time.sleep(delay)
+        if throttle:
+            error = {'error': {'code': 429, 'message': 'Resource has been exhausted.', 'status': 'RESOURCE_EXHAUSTED'}}
+            return 429, {'Retry-After': str(self.retry_after)}, error
+
+        text = body['contents'][0]['parts'][0]['text']
+        transactions = _TRANSACTION.findall(text + '\n')
+        if any(index for index, _merchant in transactions):
+            answer = json.dumps([{'index': int(index), 'category': stub_category(merchant)} for index, merchant in transactions])
+        else:
+            answer = stub_category(transactions[0][1]) if transactions else 'Merchandise'
+        with self._lock:
+            self.transactions += max(len(transactions), 1)
+        return 200, {}, {'candidates': [{'content': {'parts': [{'text': answer}], 'role': 'model'}}]}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status, headers, payload = stub.respond(body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a local stub of the Gemini generateContent API.")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, up to this many seconds.")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429s.")
+    args = parser.parse_args()
+
+    stub = StubGemini(args.latency, args.jitter, args.rate_429, args.retry_after, port=args.port)
+    print(f"Stub Gemini listening: GEMINI_API_URL={stub.url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+        print(f"\n{stub.requests} requests, {stub.throttled} throttled, {stub.transactions} transactions categorized")
@@ -0,0 +1,77 @@
+"""
+End-to-end pipeline benchmarks, fully offline (pytest-benchmark).
+
+    pytest benchmarks/                       # 100-message corpus
+    pytest benchmarks/ --run-large           # + 10k and 100k
+    pytest benchmarks/ --corpus corpus.jsonl # + a recorded inbox
+    pytest benchmarks/ --llm-latency 0.3 --llm-429 0.05
+
+Each result carries messages/sec, LLM calls, DB write time and per-stage
+latencies in extra_info (saved with --benchmark-json).
+"""
+import pytest
+
+from fake_gmail import FakeGmailService
+from replay import run_offline
+
+SIZES = [100, pytest.param(10_000, marks=pytest.mark.large), pytest.param(100_000, marks=pytest.mark.large)]
+
+
+def _expected_messages(records):
+    """Messages the configured parser query selects (the ones the pipeline should process)."""
+    from process_email import PARSERS
+    return len(FakeGmailService(records)._query_matches(PARSERS.query()))
+
+
+def _bench_run(benchmark, stub, records, db_path, rounds, **kwargs):
+    runs = []
+
+    def run():
+        requests_before, transactions_before = stub.requests, stub.transactions
+        stats = run_offline(records, db_path, stub.url, **kwargs)
+        stats['llm_calls'] = stub.requests - requests_before
+        stats['llm_transactions'] = stub.transactions - transactions_before
+        runs.append(stats)
+        return stats
+
+    stats = benchmark.pedantic(run, rounds=rounds, iterations=1)
+    benchmark.extra_info.update({
+        'messages': stats['messages'],
+        'messages_per_second': max(run['messages_per_second'] for run in runs),
+        'llm_calls': stats['llm_calls'],
+        'llm_transactions': stats['llm_transactions'],
+        'llm_connections': stats['llm_connections'],
+        'db_write_seconds': min(run['db_write_seconds'] for run in runs),
+        'db_writes': stats['db_writes'],
+        'gmail_calls': stats['gmail_calls'],
+        'stages': stats['metrics']['stages'],
+    })
+    return stats
+
+
+@pytest.mark.parametrize('body_format', ['full', 'raw'])
+@pytest.mark.parametrize('corpus', SIZES, indirect=True)
+def test_backfill(benchmark, stub_gemini, corpus, body_format, tmp_path):
+    rounds = 3 if len(corpus) <= 1000 else 1
+    stats = _bench_run(benchmark, stub_gemini, corpus, tmp_path / 'bench.db', rounds, body_format=body_format)
+
+    assert stats['messages'] == _expected_messages(corpus)
+    assert stats['saved'] + stats['duplicates'] == stats['messages']
+
+
+@pytest.mark.parametrize('corpus', [1000], indirect=True)
+def test_resync_unchanged_mailbox(benchmark, stub_gemini, corpus, tmp_path):
+    db_path = tmp_path / 'bench.db'
+    run_offline(corpus, db_path, stub_gemini.url)
+
+    stats = _bench_run(benchmark, stub_gemini, corpus, db_path, rounds=5, fresh=False)
+
+    assert stats['messages'] == 0
+    assert stats['llm_calls'] == 0
+    assert stats['gmail_calls'] == {'history': 1}
+
+
+def test_recorded_corpus(benchmark, stub_gemini, recorded_corpus, tmp_path):
+    stats = _bench_run(benchmark, stub_gemini, recorded_corpus, tmp_path / 'bench.db', rounds=1)
+
+    assert stats['messages'] == _expected_messages(recorded_corpus)
@@ -0,0 +1,21 @@
+"""
+Cold-start benchmark: an up-to-date run in a fresh interpreter (see bench_startup.py).
+
+    pytest benchmarks/test_bench_startup.py
+"""
+from bench_startup import TARGET_SECONDS, run_once, seed_database
+
+
+def test_up_to_date_run(benchmark, tmp_path):
+    db_path = tmp_path / 'startup.db'
+    seed_database(db_path)
+    run_once(db_path)  # creates the schema, so every timed round is a plain no-op
+    runs = []
+
+    benchmark.pedantic(lambda: runs.append(run_once(db_path)), rounds=5, iterations=1)
+    benchmark.extra_info.update({
+        'import_seconds': min(run['import'] for run in runs),
+        'run_seconds': min(run['run'] for run in runs),
+    })
+
+    assert min(run['process'] for run in runs) < TARGET_SECONDS
@@ -0,0 +1,256 @@
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from googleapiclient.errors import HttpError
+
+import process_email
+from category_cache import CategoryCache
+from gmail_fetch import estimate_messages, gmail_limiter, iter_routed_messages
+from metrics import METRICS
+from parsers import METADATA_HEADERS
+from prompt import SYSTEM_PROMPT
+from sync_state import BackfillCheckpoints, SyncLedger, get_current_history_id
+from transaction_store import TransactionStore
+
+logger = logging.getLogger(__name__)
+
+# --- Parallel Backfill ---
+# A first sync lists the whole mailbox with one query. A backfill instead splits
+# the search into after:/before: date windows sized by Gmail's result estimate,
+# runs several windows at once (each with its own Gmail client, all under one
+# quota-unit limiter) and checkpoints every finished window, so an interrupted
+# backfill picks up with the windows left.
+BACKFILL_WORKERS = 4
+BACKFILL_SINCE = '2004-04-01'       # Gmail's launch; a year with no matching mail costs one probe
+INITIAL_WINDOW_SECONDS = 365 * 86400
+WINDOW_TARGET_MESSAGES = 1000       # windows estimated above this are split in half
+MIN_WINDOW_SECONDS = 86400
+PROGRESS_SECONDS = 5.0
+
+
+def window_query(query, after, before):
+    """`query` limited to [after, before) epoch seconds (one second of overlap; the ledger drops repeats)."""
+    return f"{query} after:{after - 1} before:{before}"
+
+
+def plan_windows(service, query, start, end, limiter=None, target=WINDOW_TARGET_MESSAGES):
+    """
+    Splits [start, end) into windows of about `target` matching messages.
+    Yearly windows are probed with one list call each; empty ones are dropped,
+    dense ones are halved until they fit (or reach a day), and runs of sparse
+    neighbours are merged back together.
+
+    Returns:
+        [(after, before, estimate), ...] in time order.
+    """
+    windows = []
+    pending = [(after, min(after + INITIAL_WINDOW_SECONDS, end)) for after in range(start, end, INITIAL_WINDOW_SECONDS)]
+    pending.reverse()
+    while pending:
+        after, before = pending.pop()
+        estimate = estimate_messages(service, window_query(query, after, before), limiter)
+        if not estimate:
+            continue
+        if estimate > target and before - after > MIN_WINDOW_SECONDS:
+            middle = (after + before) // 2
+            pending += [(middle, before), (after, middle)]
+        else:
+            windows.append((after, before, estimate))
+
+    merged = []
+    for after, before, estimate in windows:
+        if merged and merged[-1][2] + estimate <= target:
+            merged[-1] = (merged[-1][0], before, merged[-1][2] + estimate)
+        else:
+            merged.append((after, before, estimate))
+    return merged
+
+
+def iso_day(epoch_seconds):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).date().isoformat()
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Progress:
+    """
+    Windows done, messages/sec and estimated time left for a running backfill,
+    redrawn in place on a terminal and logged every PROGRESS_SECONDS otherwise.
+    """
+
+    def __init__(self, windows, done, estimate):
+        self.windows = windows
+        self.done = done
+        self.estimate = estimate
+        self.messages = 0
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='backfill-progress', daemon=True)
+        self._tty = sys.stderr.isatty()
+
+    def count(self, items):
+        """Passes `items` through, counting each one."""
+        for item in items:
+            with self._lock:
+                self.messages += 1
+            yield item
+
+    def window_done(self):
+        with self._lock:
+            self.done += 1
+
+    def line(self):
+        with self._lock:
+            done, messages = self.done, self.messages
+        elapsed = time.monotonic() - self._start
+        rate = messages / elapsed if elapsed else 0.0
+        eta = max(self.estimate - messages, 0) / rate if rate else None
+        return (f"Backfill: {done}/{self.windows} windows, {messages:,} of ~{self.estimate:,} messages, "
+                f"{rate:.0f} msg/s, ETA {format_duration(eta)}")
+
+    def _show(self):
+        if self._tty:
+            sys.stderr.write('\r' + self.line() + '\x1b[K')
+            sys.stderr.flush()
+        else:
+            logger.info(self.line(), extra={'windows_done': self.done, 'messages': self.messages})
+
+    def _run(self):
+        while not self._stop.wait(PROGRESS_SECONDS):
+            self._show()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        self._show()
+        if self._tty:
+            sys.stderr.write('\n')
+        return False
+
+
+def backfill_user_inbox(service_factory, user_pk, since=BACKFILL_SINCE, workers=BACKFILL_WORKERS, restart=False,
+                        body_format=process_email.BODY_FORMAT, limiter=None):
+    """
+    Imports a user's whole mailbox window by window, `workers` windows at a time.
+
+    The window plan is made once (and reused on resume unless `restart`); each
+    finished window is checkpointed after its transactions and ledger entries are
+    saved. When every window is done, the sync ledger gets the historyId from
+    planning time, so the next regular sync only fetches what arrived since.
+
+    Args:
+        service_factory: Returns a new authorized Gmail service; called once per
+            worker thread, since a client must not be shared between threads.
+        since: First day to search, YYYY-MM-DD.
+        limiter: Shared Gmail RateLimiter; default gmail_limiter(workers), the per-user quota.
+
+    Returns:
+        Number of messages processed, or None if some windows are left to do.
+    """
+    query = process_email.PARSERS.query()
+    db_name = process_email.DB_NAME
+    limiter = limiter or gmail_limiter(workers)
+    checkpoints = BackfillCheckpoints(db_name, user_pk, query)
+    ledger = SyncLedger(db_name, user_pk)
+    cache = CategoryCache(db_name, SYSTEM_PROMPT)
+    store = TransactionStore(db_name)
+    services = threading.local()
+
+    def run_window(window, progress):
+        after, before, _estimate = window
+        if not hasattr(services, 'service'):
+            services.service = service_factory()
+        window_ledger = SyncLedger(db_name, user_pk)
+        failed = set()
+        try:
+            messages = iter_routed_messages(
+                services.service, window_query(query, after, before), process_email.PARSERS.match, METADATA_HEADERS,
+                exclude=window_ledger.is_processed, body_format=body_format, limiter=limiter, failed=failed
+            )
+            processed = process_email.ingest_messages(progress.count(messages), user_pk, window_ledger, cache, store,
+                                                      parse_workers=1, categorize_workers=1)
+            window_ledger.flush()
+            if failed:
+                # Keep what was saved, but leave the window to do: a resumed backfill
+                # lists it again and only fetches the dropped messages
+                logger.error("Backfill window %s..%s: could not fetch %d messages.", iso_day(after), iso_day(before),
+                             len(failed), extra={'user_pk': user_pk, 'after': after, 'before': before})
+                return None
+            checkpoints.complete(after, processed)
+            progress.window_done()
+            return processed, window_ledger.watermark
+        except HttpError as error:
+            logger.error("Backfill window %s..%s failed: %s", iso_day(after), iso_day(before), error,
+                         extra={'user_pk': user_pk, 'after': after, 'before': before})
+            return None
+        finally:
+            window_ledger.close()
+
+    try:
+        plan = None if restart else checkpoints.load()
+        if plan is None:
+            service = service_factory()
+            history_id = get_current_history_id(service)
+            start = int(datetime.strptime(since, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp())
+            with METRICS.stage('backfill_plan'):
+                windows = plan_windows(service, query, start, int(time.time()) + 86400, limiter)
+            checkpoints.save(history_id, windows)
+            plan = history_id, [(after, before, estimate, False) for after, before, estimate in windows]
+            logger.info("Backfill planned: %d windows, ~%d messages since %s.", len(windows),
+                        sum(estimate for _after, _before, estimate in windows), since,
+                        extra={'user_pk': user_pk, 'windows': len(windows)})
+
+        history_id, windows = plan
+        pending = [(after, before, estimate) for after, before, estimate, done in windows if not done]
+        if not pending:
+            logger.info("Backfill for user PK %d is already complete.", user_pk, extra={'user_pk': user_pk})
+            return 0
+        if len(pending) < len(windows):
+            logger.info("Resuming backfill: %d of %d windows left.", len(pending), len(windows),
+                        extra={'user_pk': user_pk, 'windows': len(pending)})
+
+        with Progress(len(windows), len(windows) - len(pending), sum(window[2] for window in pending)) as progress:
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill')
+            try:
+                results = list(executor.map(lambda window: run_window(window, progress), pending))
+            except BaseException:
+                # Windows not started yet stay pending in the checkpoints for the next run
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+            executor.shutdown()
+
+        processed = sum(result[0] for result in results if result)
+        failed = sum(result is None for result in results)
+        logger.info(store.report())
+        logger.info(cache.report())
+        if failed:
+            logger.warning("Backfill: %d windows failed; run it again to resume.", failed,
+                           extra={'user_pk': user_pk, 'failed': failed})
+            return None
+
+        watermarks = [watermark for _processed, watermark in results if watermark] + [ledger.watermark or 0]
+        ledger.watermark = max(watermarks) or None
+        ledger.finish(history_id)
+        logger.info("Backfill complete: %d messages in %d windows.", processed, len(pending),
+                    extra={'user_pk': user_pk, 'messages': processed})
+        return processed
+    finally:
+        ledger.close()
+        checkpoints.close()
+        cache.close()
+        store.close()
@@ -1,16 +1,33 @@
-import os
-from google import genai
+import argparse
+import asyncio
 
-# It is recommended to set your API key as an environment variable (GEMINI_API_KEY)
-# The client will automatically find it.
-# client = genai.Client() 
+from llm_client import LLMClient
 
-# Alternatively, you can pass the key directly (replace YOUR_API_KEY):
-client = genai.Client(api_key='YOUR_API_KEY') 
 
-response = client.models.generate_content(
-    model='gemini-2.5-flash',
-    contents='Explain the benefit of using the Gemini API.'
-)
+def one_shot_prompt(config, question):
+    """Fills the one_shot template from model_config.yaml with its example pair and `question`."""
+    one_shot = config['one_shot']
+    return (one_shot['template']
+            .replace('{{EXAMPLE_USER}}', one_shot['example']['user'])
+            .replace('{{EXAMPLE_ASSISTANT}}', one_shot['example']['assistant'])
+            .replace('{{QUESTION}}', question))
 
-print(response.text)
\ No newline at end of file
+
+async def ask_all(client, questions):
+    """Asks several questions concurrently over the client's shared connection pool."""
+    return await asyncio.gather(*(client.generate_async(one_shot_prompt(client.config, question))
+                                  for question in questions))
+
+
+if __name__ == '__main__':
+    # The API key is read from the variable named by api_key_env (GEMINI_API_KEY)
+    parser = argparse.ArgumentParser(description="Ask Gemini one or more simple questions (config/model_config.yaml).")
+    parser.add_argument('questions', nargs='+')
+    args = parser.parse_args()
+
+    client = LLMClient()
+    if len(args.questions) == 1:
+        print(client.generate(one_shot_prompt(client.config, args.questions[0])).strip())
+    else:
+        for question, answer in zip(args.questions, asyncio.run(ask_all(client, args.questions))):
+            print(f"Q: {question}\nA: {answer.strip()}\n")
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from category_rules import canonical_vendor, is_amount_sensitive
+from metrics import METRICS
+from transaction_store import connect_db
+
+logger = logging.getLogger(__name__)
+
+# --- Cache Configuration ---
+DEFAULT_TTL_SECONDS = 180 * 24 * 3600  # re-ask the LLM about a merchant twice a year
+DEFAULT_MAX_ENTRIES = 20000
+INDEX_REFRESH_SECONDS = 5.0  # how stale the vendor similarity index may get during a run
+
+
+def normalize_vendor(vendor):
+    """Canonical merchant name: processor prefix, store numbers and location stripped."""
+    return canonical_vendor(vendor)
+
+
+def prompt_hash(prompt):
+    """Short, stable fingerprint of the system prompt used to key cache entries."""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(transaction):
+    """Builds the cache key for a transaction: normalized vendor, plus amount if it matters."""
+    vendor = normalize_vendor(transaction['vendor'])
+    # Merchants covered by an amount-predicated rule (e.g. the $200 Cashapp rule)
+    # need the amount in the key, since their category depends on it.
+    if is_amount_sensitive(transaction['vendor']):
+        return f"{vendor}|{transaction['dollar_amount']}"
+    return vendor
+
+
+class CategoryCache:
+    """
+    SQLite-backed merchant -> category cache sitting in front of the LLM.
+
+    Entries are scoped to a hash of the system prompt, so editing SYSTEM_PROMPT
+    invalidates every answer produced under the old rules. Lookups go through an
+    in-memory memo first, so identical vendors within a run hit the database once.
+    Misses can fall back to similar(), a fuzzy match against vendors already
+    categorized in `transactions` (see vendor_index.py).
+    Safe to share between categorization threads.
+    """
+
+    def __init__(self, db_name, prompt, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.prompt_hash = prompt_hash(prompt)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.similar_hits = 0
+        self._memo = {}
+        self._touched = set()
+        self._lock = threading.Lock()
+
+        self.conn = connect_db(db_name)
+        with self.conn:
+            # Answers produced under a different prompt are stale
+            self.conn.execute("DELETE FROM category_cache WHERE prompt_hash != ?", (self.prompt_hash,))
+
+        # numpy is only imported once a cache is opened, not on an up-to-date run
+        from vendor_index import VendorIndex
+        self.index = VendorIndex()
+        self._index_refreshed = 0.0
+        self._refresh_index()
+        self._recurring = {}  # user_pk -> (checked at, {canonical vendor: hint})
+
+    def get(self, transaction):
+        """Returns the cached category for a transaction, or None on a miss."""
+        key = cache_key(transaction)
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        if key in self._memo:
+            category = self._memo[key]
+        else:
+            row = self.conn.execute(
+                "SELECT category, created_at FROM category_cache WHERE prompt_hash = ? AND cache_key = ?",
+                (self.prompt_hash, key)
+            ).fetchone()
+            if row and time.time() - row[1] < self.ttl_seconds:
+                category = row[0]
+            else:
+                category = None
+            self._memo[key] = category
+
+        if category is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._touched.add(key)
+        return category
+
+    def similar(self, transaction):
+        """
+        Category of the closest already-categorized vendor, for a cache miss.
+
+        Returns:
+            (category, confidence, matched vendor), or None when nothing is close
+            enough or the merchant's category depends on the amount.
+        """
+        if is_amount_sensitive(transaction['vendor']):
+            return None
+        with self._lock:
+            if time.monotonic() - self._index_refreshed >= INDEX_REFRESH_SECONDS:
+                self._refresh_index()
+        with METRICS.stage('similar_lookup'):
+            match = self.index.lookup(transaction['vendor'])
+        if match is not None:
+            with self._lock:
+                self.similar_hits += 1
+        return match
+
+    def recurring_hint(self, transaction):
+        """
+        One-line description of the user's active recurring charge at this vendor
+        (see recurring.py), for the categorization prompt; None if there is none.
+        """
+        user_pk = transaction.get('user_pk')
+        if user_pk is None:
+            return None
+        from recurring import describe, recurring_charges
+        with self._lock:
+            checked, hints = self._recurring.get(user_pk, (0.0, None))
+            if hints is None or time.monotonic() - checked >= INDEX_REFRESH_SECONDS:
+                try:
+                    charges = recurring_charges(self.conn, user_pk)
+                except sqlite3.OperationalError as e:
+                    logger.debug("Recurring charges not loaded: %s", e)
+                    charges = []
+                hints = {charge['vendor']: describe(charge) for charge in charges if charge['active']}
+                self._recurring[user_pk] = (time.monotonic(), hints)
+        return hints.get(canonical_vendor(transaction['vendor']))
+
+    def _refresh_index(self):
+        try:
+            added = self.index.refresh(self.conn)
+        except sqlite3.OperationalError as e:
+            # No transactions table yet (fresh database)
+            logger.debug("Vendor index not refreshed: %s", e)
+            added = 0
+        self._index_refreshed = time.monotonic()
+        if added:
+            logger.debug("Vendor index: %d vendors after %d new transactions.", len(self.index), added,
+                         extra={'vendors': len(self.index), 'rows': added})
+
+    def put(self, transaction, category):
+        """Stores a freshly categorized transaction."""
+        key = cache_key(transaction)
+        now = int(time.time())
+        with self._lock, self.conn:
+            self._memo[key] = category
+            self._touched.discard(key)
+            # Queued rows are categorized in place, so the index's id watermark never sees them
+            self.index.add(transaction['vendor'], category)
+            self.conn.execute("""
+                INSERT OR REPLACE INTO category_cache (prompt_hash, cache_key, category, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (self.prompt_hash, key, category, now, now))
+
+    def flush(self):
+        """Persists LRU timestamps for entries hit during this run and evicts old entries."""
+        now = int(time.time())
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE category_cache SET last_used_at = ? WHERE prompt_hash = ? AND cache_key = ?",
+                [(now, self.prompt_hash, key) for key in self._touched]
+            )
+            self.conn.execute("DELETE FROM category_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.conn.execute("""
+                DELETE FROM category_cache WHERE cache_key IN (
+                    SELECT cache_key FROM category_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            self._touched.clear()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def report(self):
+        """One-line hit/miss summary for the end of a run."""
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return (f"Category cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self.similar_hits} answered by similar vendors ({len(self.index)} indexed)")
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+
+from category_rules import PENDING_CATEGORY
+from metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# --- Categorization Queue ---
+# Transactions that need Gemini are written right away with PENDING_CATEGORY and
+# get a row in category_queue in the same write transaction. category_worker.py
+# drains the queue: it leases a batch (hidden from other workers for LEASE_SECONDS),
+# categorizes it and either writes the categories or records the error and makes
+# the entries visible again after a backoff. A worker that dies mid-batch simply
+# lets its lease expire, so nothing is lost or mislabelled. The table and the
+# triggers that retire entries come from migration v4 (migrations.py).
+LEASE_SECONDS = 300          # a leased entry becomes visible again after this long
+MAX_ATTEMPTS = 8             # after this many failures an entry is parked until requeued
+RETRY_BASE_SECONDS = 60      # backoff after the first failure, doubled per attempt
+RETRY_MAX_SECONDS = 6 * 3600
+
+
+def enqueue(conn, transaction_ids):
+    """Adds transactions to the queue; call inside the transaction that inserted them."""
+    now = time.time()
+    conn.executemany(
+        "INSERT OR IGNORE INTO category_queue (transaction_id, enqueued_at, available_at) VALUES (?, ?, ?)",
+        [(transaction_id, now, now) for transaction_id in transaction_ids]
+    )
+    METRICS.inc('category_queue_enqueued_total', len(transaction_ids))
+
+
+def retry_delay(attempts):
+    """Seconds before an entry that has failed `attempts` times is retried."""
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def format_amount(cents):
+    """Integer cents back to the dollar string extraction produces ("1234.50")."""
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+class CategoryQueue:
+    """
+    Lease-based work queue over category_queue, on a connection from connect_db().
+
+    lease() claims entries in one UPDATE ... RETURNING, so several workers (threads
+    or processes) never get the same entry; complete() and fail() settle them.
+    Safe to share between threads.
+    """
+
+    def __init__(self, conn, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.conn = conn
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+    def _write(self, sql, params=(), many=False):
+        # BEGIN IMMEDIATE: queue on the busy timeout instead of failing a lock upgrade
+        with self._lock:
+            isolation_level = self.conn.isolation_level
+            self.conn.isolation_level = None
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor = self.conn.executemany(sql, params) if many else self.conn.execute(sql, params)
+                    rows = cursor.fetchall() if not many else []
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                return rows
+            finally:
+                self.conn.isolation_level = isolation_level
+
+    def lease(self, limit, owner):
+        """
+        Claims up to `limit` visible entries, oldest first.
+
+        Returns:
+            Transaction dicts (id, user_pk, date, vendor, dollar_amount, attempts)
+            in the shape the categorizer expects.
+        """
+        now = time.time()
+        leased = self._write("""
+            UPDATE category_queue
+            SET lease_owner = ?, available_at = ?, attempts = attempts + 1
+            WHERE transaction_id IN (
+                SELECT transaction_id FROM category_queue
+                WHERE available_at <= ?
+                ORDER BY available_at
+                LIMIT ?
+            )
+            RETURNING transaction_id, attempts
+        """, (owner, now + self.lease_seconds, now, limit))
+        if not leased:
+            return []
+
+        attempts = dict(leased)
+        with self._lock:
+            rows = self.conn.execute(f"""
+                SELECT id, user_pk, date, vendor, amount_cents FROM transactions
+                WHERE id IN ({', '.join('?' * len(attempts))})
+            """, list(attempts)).fetchall()
+        METRICS.inc('category_queue_leased_total', len(rows))
+        return [
+            {'id': row_id, 'user_pk': user_pk, 'date': date, 'vendor': vendor,
+             'dollar_amount': format_amount(cents), 'attempts': attempts[row_id]}
+            for row_id, user_pk, date, vendor, cents in rows
+        ]
+
+    def complete(self, categories):
+        """
+        Writes answers ({transaction id: category}); the queue entries are dropped by
+        trg_category_queue_done. Rows already categorized (e.g. by a worker whose
+        lease outlived ours) are left alone.
+        """
+        if not categories:
+            return
+        self._write(
+            f"UPDATE transactions SET category = ? WHERE id = ? AND category = '{PENDING_CATEGORY}'",
+            [(category, transaction_id) for transaction_id, category in categories.items()],
+            many=True
+        )
+        METRICS.inc('category_queue_completed_total', len(categories))
+
+    def fail(self, transactions, errors, owner):
+        """
+        Returns leased transactions to the queue with their error reason
+        ({transaction id: reason}). Each becomes visible again after retry_delay();
+        one that has used up max_attempts is parked (available_at NULL) instead.
+        """
+        if not transactions:
+            return
+        now = time.time()
+        params = []
+        for transaction in transactions:
+            attempts = transaction['attempts']
+            available_at = None if attempts >= self.max_attempts else now + retry_delay(attempts)
+            params.append((available_at, errors.get(transaction['id'], "no answer"), transaction['id'], owner))
+            METRICS.inc('category_queue_failed_total', outcome='parked' if available_at is None else 'retry')
+        self._write("""
+            UPDATE category_queue SET available_at = ?, last_error = ?, lease_owner = NULL
+            WHERE transaction_id = ? AND lease_owner = ?
+        """, params, many=True)
+
+    def release(self, transactions, owner):
+        """Hands leased transactions back untouched (e.g. on shutdown), without using up an attempt."""
+        if not transactions:
+            return
+        now = time.time()
+        self._write("""
+            UPDATE category_queue SET available_at = ?, lease_owner = NULL, attempts = attempts - 1
+            WHERE transaction_id = ? AND lease_owner = ?
+        """, [(now, transaction['id'], owner) for transaction in transactions], many=True)
+
+    def requeue_parked(self):
+        """Makes every parked entry visible again with a fresh attempt count; returns how many."""
+        rows = self._write("""
+            UPDATE category_queue SET available_at = ?, attempts = 0, lease_owner = NULL
+            WHERE available_at IS NULL
+            RETURNING transaction_id
+        """, (time.time(),))
+        return len(rows)
+
+    def stats(self):
+        """Entry counts by state: ready, leased, retrying (backing off) and parked."""
+        with self._lock:
+            row = self.conn.execute("""
+                SELECT coalesce(sum(available_at <= :now), 0),
+                       coalesce(sum(available_at > :now AND lease_owner IS NOT NULL), 0),
+                       coalesce(sum(available_at > :now AND lease_owner IS NULL), 0),
+                       coalesce(sum(available_at IS NULL), 0)
+                FROM category_queue
+            """, {'now': time.time()}).fetchone()
+        return dict(zip(('ready', 'leased', 'retrying', 'parked'), row))
+
+    def errors(self, limit=10):
+        """Entries that have failed, parked ones first: list of (transaction id, vendor, attempts, last_error)."""
+        with self._lock:
+            return self.conn.execute("""
+                SELECT q.transaction_id, t.vendor, q.attempts, q.last_error
+                FROM category_queue q JOIN transactions t ON t.id = q.transaction_id
+                WHERE q.last_error IS NOT NULL
+                ORDER BY q.available_at IS NOT NULL, q.attempts DESC, q.transaction_id
+                LIMIT ?
+            """, (limit,)).fetchall()
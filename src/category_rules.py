@@ -0,0 +1,249 @@
+import re
+
+# --- Category Rule Table ---
+# Single source of truth for the category list, the mandatory merchant overrides
+# and the keyword heuristics. prompt.py renders SYSTEM_PROMPT from these tables and
+# the compiled matcher below applies the overrides locally, so the two can't drift.
+
+CATEGORIES = [
+    "Tax",
+    "Mortgage",
+    "Savings",
+    "Grocery",
+    "Pets",
+    "Home",
+    "Healthcare",
+    "Utilities",
+    "Alcohol",
+    "Personal Training",
+    "Auto Maintanence/Car Cost",
+    "Dining",
+    "Auto Insurance",
+    "Clothing and Shoes",
+    "Wellness",
+    "Hair",
+    "Nails",
+    "Pest Control",
+    "Entertainment",
+    "Beauty",
+    "Gas",
+    "Lawn Care",
+    "Internet",
+    "Subscriptions",
+    "Transportation/Tolls",
+    "Cleaning Services",
+    "Charity",
+    "Gym",
+    "Merchandise",
+    "Government Fees",
+    "Phone",
+]
+
+# Stored for rows written before Gemini has answered; category_worker.py replaces it.
+# Deliberately not in CATEGORIES, so it is never offered to (or accepted from) the model.
+PENDING_CATEGORY = "Pending"
+
+# (merchant patterns, category, exact amount or None, extra prompt wording or None)
+# Order matters: when several rules match a descriptor, the earliest one wins.
+MERCHANT_RULES = [
+    (("7 Eleven", "7-Eleven", "7ELEVEN", "7/11", "7-11", "7ELE"), "Gas", None, None),
+    (("Wawa",), "Gas", None, None),
+    (("Tmobile", "T-Mobile", "T-Mobile USA"), "Phone", None, None),
+    (("Vagaro Russian Manicure",), "Nails", None, None),
+    (("European Wax Center",), "Beauty", None, None),
+    (("QDI*QUEST DIAGNOSTICS",), "Healthcare", None, None),
+    (("TMX*Terminix Intl", "Terminix"), "Pest Control", None, None),
+    (("Sunpass",), "Transportation/Tolls", None, '"Sunpass" in any token'),
+    (("Google YouTubePremium", "YouTube Premium"), "Subscriptions", None, None),
+    (("Lift365",), "Gym", None, None),
+    (("Yaniel Cash App",), "Auto Maintanence/Car Cost", None, None),
+    (("Cashapp",), "Personal Training", "200.00", None),
+    (("NSM DBAMR.COOPER",), "Mortgage", None, None),
+    (("CAON36 SV",), "Savings", None, None),
+    (("Momentum Solar E",), "Utilities", None, None),
+    (("Harvindar Kuar",), "Cleaning Services", None, None),
+    (("Paypal Inst XFER Adobe Inc",), "Subscriptions", None, None),
+    (("Tims Wine Market",), "Alcohol", None, None),
+    (("Total Wine",), "Alcohol", None, None),
+    (("The Ivy House",), "Wellness", None, None),
+    (("SQ *Bahala KA Mai LLC",), "Hair", None, None),
+]
+
+# Patterns that match anywhere inside a token ("EZSUNPASS"). Every other pattern
+# must cover whole tokens, so short ones can't fire inside longer words or numbers.
+IN_TOKEN_PATTERNS = {"Sunpass"}
+
+# Keyword heuristics are only rendered into the prompt. They are deliberately not
+# applied locally: the prompt ranks them below merchant knowledge the LLM has
+# (e.g. "Uber Eats" is Dining even though "uber" maps to Transportation/Tolls).
+KEYWORD_RULES = [
+    (("gas", "shell", "chevron", "exxon", "bp"), "Gas"),
+    (("market", "grocery", "supermarket", "costco", "kroger"), "Grocery"),
+    (("uber", "lyft", "sunpass"), "Transportation/Tolls"),
+]
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def squash(text):
+    """Lowercases and drops punctuation/spacing, so "7-Eleven" and "7ELEVEN" compare equal."""
+    return _NON_ALNUM.sub('', text.lower())
+
+
+def normalize_text(text):
+    """Lowercases and collapses every punctuation/spacing run into a single space."""
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+# --- Vendor Canonicalization ---
+# Card descriptors for one merchant vary per purchase: a processor prefix
+# ("SQ *", "TST* ", "PAYPAL *", "IC* "), store numbers and a city/state suffix.
+# The canonical form keeps only the merchant's name, so those variants share a
+# cache entry and a row in the vendor similarity index.
+
+# Payment processors / marketplaces that prefix the merchant as "<code>*<merchant>"
+PROCESSOR_PREFIXES = {'sq', 'tst', 'toast', 'paypal', 'pp', 'sp', 'py', 'ic', 'dd', 'pos', 'clover', 'vagaro', 'gglpay'}
+# "<short code>*<rest>"; the code is at most 12 characters
+_STAR_PREFIX = re.compile(r'^\s*([a-z0-9_.\- ]{1,12}?)\s*\*+\s*(.+)$')
+# A single code-like token (e.g. the order reference in "AMZN Mktp US*2K4L09I2")
+_REFERENCE = re.compile(r'[a-z0-9]*\d[a-z0-9]*')
+_DIGITS = re.compile(r'\d')
+# Tokens that never identify a merchant
+_FILLER_TOKENS = {'llc', 'inc', 'co', 'corp', 'ltd', 'com', 'www', 'store', 'str', 'no'}
+US_STATES = {
+    'al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'dc', 'fl', 'ga', 'hi', 'id', 'il', 'in', 'ia', 'ks',
+    'ky', 'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 'mo', 'mt', 'ne', 'nv', 'nh', 'nj', 'nm', 'ny', 'nc',
+    'nd', 'oh', 'ok', 'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt', 'va', 'wa', 'wv', 'wi', 'wy',
+}
+
+
+def canonical_vendor(vendor):
+    """
+    Merchant name from a card descriptor, e.g. "SQ *BAHALA KA MAI LLC" and
+    "Bahala Ka Mai #2 Orlando FL" both become "bahala ka mai".
+
+    Strips a processor prefix, tokens with two or more digits (store numbers,
+    phone numbers, references), lone digits/letters after the first token
+    ("#2", the "T" of "T-1234"), legal/web filler and a trailing "CITY ST".
+    Falls back to normalize_text() if nothing would be left.
+    """
+    text = vendor.lower()
+    match = _STAR_PREFIX.match(text)
+    if match:
+        head, rest = match.groups()
+        if _REFERENCE.fullmatch(rest.strip()):
+            # The tail is only a reference code; the head is the merchant
+            text = head
+        elif normalize_text(head) in PROCESSOR_PREFIXES:
+            text = rest
+
+    tokens = [
+        token for position, token in enumerate(normalize_text(text).split())
+        if token not in _FILLER_TOKENS and len(_DIGITS.findall(token)) < 2
+        and (position == 0 or len(token) > 1)
+    ]
+    if len(tokens) > 1 and tokens[-1] in US_STATES:
+        # "... ORLANDO FL": drop the state, and the city when a name is left before it
+        tokens = tokens[:-2] if len(tokens) > 2 else tokens[:-1]
+    return ' '.join(tokens) or normalize_text(vendor)
+
+
+# --- Prompt Rendering ---
+
+def render_categories():
+    return "\n".join(CATEGORIES)
+
+
+def render_override_rules():
+    lines = []
+    for patterns, category, amount, note in MERCHANT_RULES:
+        text = " or ".join(f'"{pattern}"' for pattern in patterns)
+        if note:
+            text += f" or {note}"
+        if amount:
+            text += f" transactions of exactly ${float(amount):g} (note amount match required)"
+        lines.append(f"{text} -> {category}")
+    return "\n".join(lines)
+
+
+def render_keyword_rules():
+    return "; ".join(
+        ", ".join(f'"{keyword}"' for keyword in keywords) + f" -> {category}"
+        for keywords, category in KEYWORD_RULES
+    )
+
+
+# --- Compiled Matcher ---
+
+def _pattern_regex(pattern):
+    """Regex for one merchant pattern that tolerates any punctuation/spacing between characters."""
+    return ' ?'.join(map(re.escape, squash(pattern)))
+
+
+def _guarded_regex(pattern):
+    """
+    A pattern's regex with its token boundaries. All-digit patterns ("7/11")
+    read like store numbers anywhere else, so they only count as the leading
+    merchant name; in-token patterns get no boundaries at all.
+    """
+    regex = _pattern_regex(pattern)
+    if pattern in IN_TOKEN_PATTERNS:
+        return regex
+    if squash(pattern).isdigit():
+        return rf"^{regex}(?![a-z0-9])"
+    return rf"(?<![a-z0-9]){regex}(?![a-z0-9])"
+
+
+def _compile_rules():
+    """
+    Compiles every override pattern into one alternation over normalized text.
+    Each rule gets a named group so a single scan reports which rules matched, and
+    each alternative is bounded as _guarded_regex describes (so "7/11" can't fire
+    inside "PUBLIX #7110"). Longer patterns come first so overlaps prefer the most specific.
+    """
+    alternatives = []
+    for index, (patterns, _category, _amount, _note) in enumerate(MERCHANT_RULES):
+        ordered = sorted(set(patterns), key=lambda pattern: len(squash(pattern)), reverse=True)
+        alternatives.append(f"(?P<r{index}>{'|'.join(map(_guarded_regex, ordered))})")
+    return re.compile("|".join(alternatives))
+
+
+_RULE_PATTERN = _compile_rules()
+
+# Squashed patterns of rules whose answer depends on the amount (cache keys need the amount).
+AMOUNT_SENSITIVE_PATTERNS = tuple(
+    squash(pattern)
+    for patterns, _category, amount, _note in MERCHANT_RULES if amount
+    for pattern in patterns
+)
+
+
+def is_amount_sensitive(vendor):
+    """True for merchants covered by an amount-predicated rule (their category depends on the amount)."""
+    squashed = squash(vendor)
+    return any(pattern in squashed for pattern in AMOUNT_SENSITIVE_PATTERNS)
+
+
+def _amount_matches(expected, dollar_amount):
+    try:
+        return abs(float(dollar_amount) - float(expected)) < 0.005
+    except (TypeError, ValueError):
+        return False
+
+
+def match_rule_category(transaction):
+    """
+    Applies the mandatory merchant override rules to a transaction.
+    Returns the category of the highest-priority matching rule, or None if no rule
+    applies and the transaction has to go to the LLM.
+    """
+    best = None
+    for match in _RULE_PATTERN.finditer(normalize_text(transaction['vendor'])):
+        index = int(match.lastgroup[1:])
+        _patterns, category, amount, _note = MERCHANT_RULES[index]
+        if amount and not _amount_matches(amount, transaction['dollar_amount']):
+            continue
+        if best is None or index < best:
+            best = index
+
+    return MERCHANT_RULES[best][1] if best is not None else None
@@ -0,0 +1,156 @@
+import argparse
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import process_email
+from category_cache import CategoryCache
+from category_queue import CategoryQueue
+from log_config import LOG_FORMATS, configure_logging
+from metrics import METRICS
+from prompt import SYSTEM_PROMPT
+from transaction_store import connect_db
+
+logger = logging.getLogger(__name__)
+
+# --- Worker Configuration ---
+POLL_SECONDS = 30  # --loop: pause between drains when the queue is empty or Gemini is failing
+
+
+def worker_owner():
+    """Lease owner tag for this thread: host:pid:thread."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def drain_queue(cache, queue, batch_size=process_email.LLM_BATCH_MAX_ITEMS,
+                workers=process_email.CATEGORIZE_WORKERS):
+    """
+    Categorizes queued transactions until nothing is ready. Each worker thread
+    leases a batch, runs it through categorize_transactions() (rules, cache and
+    similar vendors first, then Gemini) and writes the answers; transactions
+    Gemini could not answer go back to the queue with the reason instead of
+    being given a fallback category. A worker stops early when a whole batch
+    fails, since that usually means Gemini is down or out of quota.
+
+    Returns:
+        (categorized, failed) counts.
+    """
+    totals = {'categorized': 0, 'failed': 0}
+    totals_lock = threading.Lock()
+
+    def work():
+        owner = worker_owner()
+        while True:
+            batch = queue.lease(batch_size, owner)
+            if not batch:
+                return
+            errors = {}
+            try:
+                categories = process_email.categorize_transactions(batch, cache, fallback=None, errors=errors)
+            except Exception as e:
+                logger.exception("Categorizing %d queued transactions failed: %s", len(batch), e)
+                categories = [None] * len(batch)
+                errors = dict.fromkeys(range(len(batch)), f"{type(e).__name__}: {e}")
+            except BaseException:
+                queue.release(batch, owner)  # interrupted: hand the batch straight back
+                raise
+
+            answered = {transaction['id']: category for transaction, category in zip(batch, categories) if category}
+            failed = [transaction for transaction, category in zip(batch, categories) if not category]
+            queue.complete(answered)
+            queue.fail(failed, {batch[i]['id']: reason for i, reason in errors.items()}, owner)
+            with totals_lock:
+                totals['categorized'] += len(answered)
+                totals['failed'] += len(failed)
+            if failed and not answered:
+                logger.warning("No answers for a batch of %d (%s); leaving the rest of the queue for later.",
+                               len(failed), next(iter(errors.values()), "no answer"), extra={'failed': len(failed)})
+                return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(work) for _ in range(workers)]:
+            future.result()
+    cache.flush()
+    return totals['categorized'], totals['failed']
+
+
+def drain(db_name=None, batch_size=process_email.LLM_BATCH_MAX_ITEMS, workers=process_email.CATEGORIZE_WORKERS):
+    """Opens the cache and queue on `db_name` (default DB_NAME), drains once, and logs a summary."""
+    db_name = db_name or process_email.DB_NAME
+    conn = connect_db(db_name)
+    cache = CategoryCache(db_name, SYSTEM_PROMPT)
+    queue = CategoryQueue(conn)
+    try:
+        start = time.perf_counter()
+        with METRICS.stage('categorize_queue'):
+            categorized, failed = drain_queue(cache, queue, batch_size=batch_size, workers=workers)
+        if categorized or failed:
+            stats = queue.stats()
+            logger.info("Categorized %d queued transactions in %.1fs (%d failed; %d ready, %d retrying, %d parked).",
+                        categorized, time.perf_counter() - start, failed,
+                        stats['ready'], stats['retrying'], stats['parked'],
+                        extra={'categorized': categorized, 'failed': failed, **stats})
+            logger.info(cache.report())
+        return categorized, failed
+    finally:
+        cache.close()
+        conn.close()
+
+
+def format_status(queue, errors=10):
+    """Queue counts plus the most recent failure reasons."""
+    stats = queue.stats()
+    lines = [f"Queue: {stats['ready']} ready, {stats['leased']} leased, "
+             f"{stats['retrying']} retrying, {stats['parked']} parked"]
+    for transaction_id, vendor, attempts, last_error in queue.errors(errors):
+        lines.append(f"  #{transaction_id:<8} {vendor[:30]:<30} {attempts:>2} attempts  {last_error}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Categorize transactions queued by ingestion (Pending category).")
+    parser.add_argument('--loop', action='store_true', help="Keep draining the queue until interrupted.")
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help="Seconds between drains with --loop.")
+    parser.add_argument('--batch', type=int, default=process_email.LLM_BATCH_MAX_ITEMS,
+                        help="Transactions leased per batch.")
+    parser.add_argument('--workers', type=int, default=process_email.CATEGORIZE_WORKERS,
+                        help="Concurrent batches.")
+    parser.add_argument('--status', action='store_true', help="Print queue counts and recent errors, then exit.")
+    parser.add_argument('--requeue-parked', action='store_true',
+                        help="Give transactions that used up their attempts another round.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-format', default='text', choices=LOG_FORMATS, help="'json' emits one object per line.")
+    parser.add_argument('--metrics-json', metavar='PATH', help="Write the run's metrics summary as JSON.")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    process_email.initialize_db()
+    if args.status or args.requeue_parked:
+        conn = connect_db(process_email.DB_NAME)
+        queue = CategoryQueue(conn)
+        if args.requeue_parked:
+            logger.info("Requeued %d parked transactions.", queue.requeue_parked())
+        if args.status:
+            print(format_status(queue))
+        conn.close()
+        if args.status:
+            sys.exit(0)
+
+    METRICS.reset()
+    try:
+        while True:
+            drain(batch_size=args.batch, workers=args.workers)
+            if not args.loop:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; leased transactions were handed back or will expire.")
+    finally:
+        logger.info("--- Run Metrics ---\n%s", METRICS.format_summary())
+        if args.metrics_json:
+            METRICS.write_json(args.metrics_json)
+            logger.info("Metrics written to %s", args.metrics_json)
@@ -0,0 +1,291 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# --- Transaction Export ---
+# Streams `transactions` out of SQLite in fetchmany() chunks, so memory is bounded
+# by the chunk size whatever the table holds. Filters become the WHERE clause
+# (the (user_pk, date) and (user_pk, category, date) indexes serve them).
+# Every export records the highest row id it covered in export_state (migration
+# v6); an incremental re-export to the same file only reads rows past it.
+# Arrow/Parquet need the optional pyarrow package.
+COLUMNS = ('id', 'user_pk', 'bank', 'date', 'vendor', 'amount_cents', 'category')
+CHUNK_ROWS = 50_000
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.arrow': 'arrow', '.feather': 'arrow', '.parquet': 'parquet'}
+
+
+def build_filter(users=None, start=None, end=None, categories=None, after_id=None, until_id=None):
+    """
+    SQL WHERE clause and parameters for the export filters.
+    `start`/`end` are inclusive ISO dates; `users` and `categories` are lists.
+    """
+    clauses, params = [], []
+    if users:
+        clauses.append(f"user_pk IN ({', '.join('?' * len(users))})")
+        params += users
+    if start:
+        clauses.append("date >= ?")
+        params.append(start)
+    if end:
+        clauses.append("date <= ?")
+        params.append(end)
+    if categories:
+        clauses.append(f"category IN ({', '.join('?' * len(categories))})")
+        params += categories
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    if until_id is not None:
+        clauses.append("id <= ?")
+        params.append(until_id)
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def iter_transaction_chunks(conn, chunk_size=CHUNK_ROWS, **filters):
+    """
+    Yields lists of at most `chunk_size` row tuples (COLUMNS order) matching the
+    filters (see build_filter). For analysis code that wants to stream, e.g.
+    pandas.DataFrame.from_records(chunk, columns=COLUMNS) per chunk.
+    """
+    where, params = build_filter(**filters)
+    cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM transactions {where}", params)
+    try:
+        while rows := cursor.fetchmany(chunk_size):
+            yield rows
+    finally:
+        cursor.close()
+
+
+# --- Writers ---
+# Each takes the output path and the chunk iterator, and returns the rows written.
+
+def write_csv(path, chunks, append=False):
+    with open(path, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if not append:
+            writer.writerow(COLUMNS)
+        rows = 0
+        for chunk in chunks:
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+_encode_json = json.JSONEncoder(ensure_ascii=False).encode  # json.dumps builds a new encoder per call
+
+
+def write_jsonl(path, chunks, append=False):
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        rows = 0
+        for chunk in chunks:
+            f.write(''.join(_encode_json(dict(zip(COLUMNS, row))) + '\n' for row in chunk))
+            rows += len(chunk)
+    return rows
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Arrow and Parquet export need pyarrow (poetry install -E export).") from None
+    return pyarrow
+
+
+def arrow_schema():
+    pa = _pyarrow()
+    return pa.schema([
+        ('id', pa.int64()), ('user_pk', pa.int64()), ('bank', pa.string()), ('date', pa.date32()),
+        ('vendor', pa.string()), ('amount_cents', pa.int64()), ('category', pa.string()),
+    ])
+
+
+def _record_batch(chunk, schema):
+    pa = _pyarrow()
+    arrays = []
+    for values, field in zip(zip(*chunk), schema):
+        if field.type == pa.date32():
+            try:
+                arrays.append(pa.array(values, pa.string()).cast(pa.date32()))
+            except pa.ArrowInvalid:
+                # Rows the v2 migration kept with an unparseable date export a null date
+                arrays.append(pa.array([_iso_date_or_none(value) for value in values], pa.date32()))
+        else:
+            arrays.append(pa.array(values, field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _iso_date_or_none(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def write_arrow(path, chunks, append=False):
+    """Arrow IPC file (Feather v2); one record batch per chunk."""
+    pa = _pyarrow()
+    schema = arrow_schema()
+    rows = 0
+    with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for chunk in chunks:
+            writer.write_batch(_record_batch(chunk, schema))
+            rows += len(chunk)
+    return rows
+
+
+def write_parquet(path, chunks, append=False):
+    """Parquet with one row group per chunk (zstd)."""
+    _pyarrow()
+    import pyarrow.parquet as pq
+    schema = arrow_schema()
+    rows = 0
+    with pq.ParquetWriter(str(path), schema, compression='zstd') as writer:
+        for chunk in chunks:
+            writer.write_batch(_record_batch(chunk, schema))
+            rows += len(chunk)
+    return rows
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'arrow': write_arrow, 'parquet': write_parquet}
+APPENDABLE = {'csv', 'jsonl'}
+
+
+def export_format(path):
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"Can't tell the export format of {path}; use one of {', '.join(FORMATS)}.")
+    return fmt
+
+
+def part_path(path, first_id, last_id):
+    """Where an incremental Arrow/Parquet export goes: a new file next to `path` ("tx.parquet" -> "tx.101-250.parquet")."""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.{first_id}-{last_id}{path.suffix}")
+
+
+# --- Export ---
+
+def export_transactions(conn, path, fmt=None, incremental=False, chunk_size=CHUNK_ROWS,
+                        users=None, start=None, end=None, categories=None):
+    """
+    Streams matching transactions to `path` as CSV, JSON Lines, Arrow or Parquet
+    (from the suffix unless `fmt` is given).
+
+    A full export rewrites `path` (atomically, via a temporary file) with every
+    matching row, "Pending" ones included. An incremental one only reads rows
+    added since the last export to `path`: CSV and JSON Lines are appended to,
+    Arrow and Parquet get a new part file next to it (see part_path). It also
+    stops short of the oldest row still waiting in the categorization queue, so
+    that row goes out with its category in a later incremental export. Parked
+    entries (out of retries until requeued) don't hold it back: they are
+    exported as "Pending" rather than stall every later export. Each row is
+    exported once; later edits are not re-exported.
+
+    Returns:
+        Dict with rows, path (the file written), first_id and last_id.
+    """
+    fmt = fmt or export_format(path)
+    target = str(Path(path).resolve())
+    filters = {'users': sorted(users) if users else None, 'start': start, 'end': end,
+               'categories': sorted(categories) if categories else None}
+    state = conn.execute("SELECT filters, last_id, rows FROM export_state WHERE target = ?", (target,)).fetchone()
+    if incremental and state is not None and json.loads(state[0]) != filters:
+        raise ValueError(f"{path} was exported with filters {state[0]}; export to a new file to change them.")
+    after_id, total = (state[1], state[2]) if incremental and state is not None else (0, 0)
+
+    until_id = conn.execute("SELECT coalesce(max(id), 0) FROM transactions").fetchone()[0]
+    if incremental:
+        # Stop before the oldest queued (Pending) row that is still being retried: its
+        # category is about to change, possibly into one of `categories`, so the
+        # category filter doesn't apply here
+        where, params = build_filter(users=users, start=start, end=end)
+        pending = conn.execute(f"""
+            SELECT min(transaction_id) FROM category_queue
+            JOIN transactions ON id = transaction_id AND available_at IS NOT NULL {where}
+        """, params).fetchone()[0]
+        if pending is not None:
+            until_id = min(until_id, pending - 1)
+    if until_id <= after_id and incremental and state is not None:
+        logger.info("Nothing new to export to %s.", path, extra={'path': str(path)})
+        return {'rows': 0, 'path': str(path), 'first_id': None, 'last_id': after_id}
+
+    chunks = iter_transaction_chunks(conn, chunk_size, after_id=after_id, until_id=until_id, **filters)
+    append = after_id > 0 and fmt in APPENDABLE
+    if after_id > 0 and not append:
+        out = part_path(path, after_id + 1, until_id)
+    else:
+        out = Path(path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    start_time = time.perf_counter()
+    if append:
+        size = out.stat().st_size if out.exists() else 0
+        try:
+            rows = WRITERS[fmt](out, chunks, append=True)
+        except BaseException:
+            with open(out, 'r+b') as f:
+                f.truncate(size)  # leave the file as the last export left it
+            raise
+    else:
+        tmp = out.with_name(out.name + '.tmp')
+        try:
+            rows = WRITERS[fmt](tmp, chunks)
+            os.replace(tmp, out)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    elapsed = time.perf_counter() - start_time
+
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO export_state (target, filters, last_id, rows, exported_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (target, json.dumps(filters), until_id, total + rows, int(time.time())))
+    logger.info("Exported %d transactions to %s in %.2fs (%s, ids %d-%d).", rows, out, elapsed, fmt,
+                after_id + 1, until_id, extra={'rows': rows, 'path': str(out), 'seconds': round(elapsed, 3)})
+    return {'rows': rows, 'path': str(out), 'first_id': after_id + 1, 'last_id': until_id}
+
+
+if __name__ == '__main__':
+    from log_config import LOG_FORMATS, configure_logging
+    from process_email import DB_NAME, USER_MAP, initialize_db
+    from transaction_store import connect_db
+
+    parser = argparse.ArgumentParser(description="Stream transactions to CSV, JSON Lines, Arrow or Parquet.")
+    parser.add_argument('out', type=Path, help="Output file: .csv, .jsonl, .arrow/.feather or .parquet.")
+    parser.add_argument('--user', dest='users', action='append', help="User ID from USER_MAP (repeatable).")
+    parser.add_argument('--from', dest='start', metavar='YYYY-MM-DD', help="First date, inclusive.")
+    parser.add_argument('--to', dest='end', metavar='YYYY-MM-DD', help="Last date, inclusive.")
+    parser.add_argument('--category', dest='categories', action='append', help="Only this category (repeatable).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only export rows added since the last export to this file.")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_ROWS, help="Rows fetched and written at a time.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-format', default='text', choices=LOG_FORMATS, help="'json' emits one object per line.")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    unknown = [user_id for user_id in args.users or [] if user_id not in USER_MAP]
+    if unknown:
+        logger.error("User ID(s) %s not mapped to a database primary key. Add them to USER_MAP.", ', '.join(unknown))
+        sys.exit(1)
+
+    initialize_db()
+    conn = connect_db(DB_NAME)
+    try:
+        export_transactions(conn, args.out, incremental=args.incremental, chunk_size=args.chunk_size,
+                            users=[USER_MAP[user_id] for user_id in args.users or []], start=args.start,
+                            end=args.end, categories=args.categories)
+    except (ValueError, RuntimeError) as e:
+        logger.error("%s", e)
+        sys.exit(1)
+    finally:
+        conn.close()
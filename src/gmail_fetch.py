@@ -0,0 +1,204 @@
+import contextlib
+import logging
+import time
+
+from googleapiclient.errors import HttpError
+
+from metrics import METRICS
+from pipeline import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# --- Fetch Configuration ---
+# Gmail caps messages.list at 500 IDs per page and recommends no more than
+# 50 calls per batch request (hard limit 100).
+LIST_PAGE_SIZE = 500
+BATCH_SIZE = 50
+# Per-message errors inside a batch that are worth retrying (rate limit / backend).
+RETRYABLE_STATUSES = {429, 500, 503}
+MAX_BATCH_RETRIES = 3
+# Per-user quota: 250 units/second; messages.list and messages.get cost 5 units
+# each (a batch costs the sum of its calls).
+QUOTA_UNITS_PER_SECOND = 250
+LIST_QUOTA_UNITS = 5
+GET_QUOTA_UNITS = 5
+
+
+def gmail_limiter(max_concurrency, units_per_second=QUOTA_UNITS_PER_SECOND):
+    """RateLimiter priced in Gmail quota units, shared by every thread calling one mailbox."""
+    return RateLimiter(rate=units_per_second, burst=units_per_second, max_concurrency=max_concurrency)
+
+
+def _quota(limiter, units):
+    return limiter.slot(units) if limiter is not None else contextlib.nullcontext()
+
+
+def iter_message_ids(service, query, page_size=LIST_PAGE_SIZE, limiter=None):
+    """
+    Yields message IDs matching a Gmail query, one page at a time.
+    Follows nextPageToken so nothing past the first page is dropped, and only
+    ever holds a single page of IDs in memory.
+    """
+    page_token = None
+    while True:
+        request_args = {'userId': 'me', 'q': query, 'maxResults': page_size}
+        if page_token:
+            request_args['pageToken'] = page_token
+
+        with _quota(limiter, LIST_QUOTA_UNITS), METRICS.stage('gmail_list'):
+            results = service.users().messages().list(**request_args).execute()
+        METRICS.inc('gmail_api_calls_total', call='list')
+
+        for message_id_obj in results.get('messages', []):
+            yield message_id_obj['id']
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+
+def _chunked(iterable, size):
+    """Groups an iterable into lists of at most `size` items without materializing it."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _body_bytes(message):
+    """Size of the base64 body data in a message resource (raw or payload parts)."""
+    if 'raw' in message:
+        return len(message['raw'])
+    size = 0
+    parts = [message.get('payload', {})]
+    while parts:
+        part = parts.pop()
+        size += len(part.get('body', {}).get('data', ''))
+        parts.extend(part.get('parts', ()))
+    return size
+
+
+def estimate_messages(service, query, limiter=None):
+    """Gmail's resultSizeEstimate for a query (one list call; approximate for large results)."""
+    with _quota(limiter, LIST_QUOTA_UNITS), METRICS.stage('gmail_list'):
+        results = service.users().messages().list(userId='me', q=query, maxResults=1).execute()
+    METRICS.inc('gmail_api_calls_total', call='list')
+    return results.get('resultSizeEstimate', 0)
+
+
+def fetch_messages_batch(service, message_ids, msg_format='full', limiter=None, **get_kwargs):
+    """
+    Fetches a list of messages with a single Gmail batch HTTP request.
+    Messages that fail with a retryable status are re-batched with exponential
+    backoff (through `limiter`, when given, so every thread sharing it backs off);
+    anything still failing afterwards, or failing with any other error, is
+    reported and left out.
+
+    Returns:
+        (fetched, failed): a dict mapping message ID -> message resource, and the
+        list of IDs that could not be fetched.
+    """
+    fetched = {}
+    failed = []
+    pending = list(message_ids)
+
+    for attempt in range(MAX_BATCH_RETRIES):
+        retry = []
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+                if msg_format != 'metadata':
+                    METRICS.inc('gmail_bytes_downloaded_total', _body_bytes(response), format=msg_format)
+            elif isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUSES:
+                retry.append(request_id)
+            else:
+                logger.warning("Could not fetch message ID %s: %s", request_id, exception,
+                               extra={'message_id': request_id})
+                failed.append(request_id)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in pending:
+            batch.add(
+                service.users().messages().get(userId='me', id=message_id, format=msg_format, **get_kwargs),
+                request_id=message_id
+            )
+        with _quota(limiter, GET_QUOTA_UNITS * len(pending)), METRICS.stage(f'gmail_{msg_format}'):
+            batch.execute()
+        METRICS.inc('gmail_api_calls_total', call='batch')
+        METRICS.inc('gmail_api_calls_total', len(pending), call='get')
+
+        if not retry:
+            if limiter is not None:
+                limiter.succeeded()
+            break
+
+        pending = retry
+        METRICS.inc('gmail_retries_total', len(pending))
+        if attempt < MAX_BATCH_RETRIES - 1:
+            delay = limiter.throttled() if limiter is not None else 2 ** attempt
+            logger.warning("Batch fetch throttled for %d messages. Retrying in %.1fs...", len(pending), delay,
+                           extra={'messages': len(pending), 'attempt': attempt + 1})
+            if limiter is None:
+                time.sleep(delay)
+        else:
+            logger.error("Batch fetch: giving up on %d messages after %d attempts.", len(pending), MAX_BATCH_RETRIES,
+                         extra={'messages': len(pending)})
+            failed += pending
+
+    return fetched, failed
+
+
+def iter_routed_messages(service, query, route, metadata_headers, batch_size=BATCH_SIZE,
+                         page_size=LIST_PAGE_SIZE, exclude=None, body_format='full', limiter=None, failed=None):
+    """
+    Streams messages matching `query`, looking at headers before downloading bodies.
+    IDs are consumed lazily from the paginated list (skipping those for which
+    `exclude(message_id)` is true) in chunks of `batch_size`, so memory stays
+    bounded by one page + one batch. Each chunk is first fetched with format='metadata'; `route(metadata)` picks a
+    handler (e.g. a parser) or returns None, and only claimed messages are then
+    fetched with `body_format` ('full' or 'raw'). Raw messages carry no parsed
+    headers, so the metadata headers are attached to them as `payload`.
+
+    Messages that could not be fetched (see fetch_messages_batch) are not yielded;
+    their IDs are added to the `failed` set, when given, so the caller can tell
+    that the listing was not processed completely (and must not be checkpointed).
+
+    Yields:
+        (message_id, message, handler) tuples in list order. Unclaimed messages are
+        yielded with their metadata resource and a None handler so callers can
+        still record them as seen.
+    """
+    message_ids = iter_message_ids(service, query, page_size, limiter)
+    if exclude is not None:
+        message_ids = (message_id for message_id in message_ids if not exclude(message_id))
+
+    for chunk in _chunked(message_ids, batch_size):
+        metadata, dropped = fetch_messages_batch(service, chunk, msg_format='metadata', limiter=limiter,
+                                                 metadataHeaders=metadata_headers)
+        handlers = {message_id: route(message) for message_id, message in metadata.items()}
+        claimed = [message_id for message_id in chunk if handlers.get(message_id) is not None]
+        if claimed:
+            full, dropped_bodies = fetch_messages_batch(service, claimed, msg_format=body_format, limiter=limiter)
+            dropped += dropped_bodies
+        else:
+            full = {}
+        if dropped:
+            METRICS.inc('gmail_messages_dropped_total', len(dropped))
+            if failed is not None:
+                failed.update(dropped)
+        for message_id, message in full.items():
+            message.setdefault('payload', metadata[message_id].get('payload', {}))
+
+        for message_id in chunk:
+            if message_id not in metadata:
+                continue
+            handler = handlers[message_id]
+            if handler is None:
+                yield message_id, metadata[message_id], None
+            elif message_id in full:
+                yield message_id, full[message_id], handler
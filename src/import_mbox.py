@@ -0,0 +1,240 @@
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import re
+import sys
+from datetime import datetime
+from email import policy
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+
+import process_email
+from category_cache import CategoryCache
+from log_config import LOG_FORMATS, configure_logging
+from metrics import METRICS
+from parsers import METADATA_HEADERS
+from prompt import SYSTEM_PROMPT
+from sync_state import SyncLedger
+from transaction_store import TransactionStore
+
+logger = logging.getLogger(__name__)
+
+# --- Mbox Import Configuration ---
+# Google Takeout exports one mbox per label (e.g. "All mail Including Spam and Trash.mbox").
+# Each message starts with a From_ line: "From <X-GM-MSGID>@xxx <asctime-like date>".
+PROGRESS_EVERY = 50_000  # messages scanned between progress lines
+RELEASE_BYTES = 16 * 2**20  # scanned pages are dropped from the mapping this often
+_FROM_LINE = b'\nFrom '
+_HEADER_END = re.compile(rb'\r?\n\r?\n')
+_QUOTED_FROM = re.compile(rb'^>(>*From )', re.MULTILINE)  # mboxrd escaping of body "From " lines
+_HEADER_PARSER = BytesHeaderParser(policy=policy.compat32)
+
+
+def iter_mbox_spans(mm):
+    """
+    Yields (from_line_start, message_start, end) byte offsets for each message in a
+    mapped mbox. Boundaries are found by searching the map, so nothing is copied.
+    """
+    size = len(mm)
+    if mm[:5] == b'From ':
+        start = 0
+    else:
+        start = mm.find(_FROM_LINE)
+        if start == -1:
+            return
+        start += 1
+    while start < size:
+        line_end = mm.find(b'\n', start)
+        if line_end == -1:
+            return
+        next_from = mm.find(_FROM_LINE, line_end)
+        end = next_from + 1 if next_from != -1 else size
+        yield start, line_end + 1, end
+        start = end
+
+
+def parse_from_line(line):
+    """
+    Gmail message ID and internalDate (epoch ms) from a Takeout From_ line.
+    The ID is X-GM-MSGID in decimal; the Gmail API uses the same number in hex,
+    so imported messages and API-synced ones share ledger entries. Either value
+    is None when the line doesn't carry it (mbox files from other tools).
+    """
+    fields = line.decode('ascii', 'replace').strip().split(' ', 2)
+    local_part = fields[1].split('@', 1)[0] if len(fields) > 1 else ''
+    message_id = format(int(local_part), 'x') if local_part.isdigit() else None
+    internal_date = None
+    if len(fields) > 2:
+        try:
+            internal_date = int(datetime.strptime(fields[2], '%a %b %d %H:%M:%S %z %Y').timestamp() * 1000)
+        except ValueError:
+            pass
+    return message_id, internal_date
+
+
+def _header_text(value):
+    """A header value with RFC 2047 encoded-words decoded."""
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, UnicodeError, ValueError):
+        return value
+
+
+def _date_header_ms(value):
+    try:
+        return int(parsedate_to_datetime(value).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
+
+
+def _release(mm, upto):
+    # Drop already-scanned pages from this process's mapping so resident memory
+    # stays flat however large the file is (the OS page cache still holds them)
+    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED') and upto >= mmap.PAGESIZE:
+        mm.madvise(mmap.MADV_DONTNEED, 0, upto - upto % mmap.PAGESIZE)
+
+
+def iter_mbox_messages(path, registry, exclude=None):
+    """
+    Streams an mbox file through a memory map, yielding (message_id, message,
+    parser) for each message a parser claims, in file order.
+
+    Only headers are looked at until a parser claims a message: a bytes search of
+    the header block for the registered sender addresses skips all other mail
+    without parsing it, then From/Subject/Date are parsed and routed. A claimed
+    message carries its RFC 822 bytes under `mime` and its headers as Gmail-style
+    `payload.headers`, so the rest of the pipeline treats it like an API message.
+
+    Args:
+        registry: ParserRegistry (senders to look for, and the router).
+        exclude: Optional message_id -> bool; True skips the message (already processed).
+    """
+    if not os.path.getsize(path):
+        return
+    senders = [parser.sender.encode() for parser in registry.parsers]
+    scanned = claimed = released = 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        size = len(mm)
+        for from_start, start, end in iter_mbox_spans(mm):
+            scanned += 1
+            if from_start - released >= RELEASE_BYTES:
+                _release(mm, from_start)
+                released = from_start
+            if scanned % PROGRESS_EVERY == 0:
+                METRICS.inc('mbox_messages_scanned_total', PROGRESS_EVERY)
+                logger.info("Scanned %d messages (%.0f%% of %.0f MB), %d claimed.", scanned,
+                            100 * end / size, size / 2**20, claimed,
+                            extra={'scanned': scanned, 'claimed': claimed, 'offset': end})
+
+            header_end = _HEADER_END.search(mm, start, end)
+            header_block = mm[start:header_end.end() if header_end else end]
+            lowered = header_block.lower()
+            if not any(sender in lowered for sender in senders):
+                continue
+
+            headers = _HEADER_PARSER.parsebytes(header_block)
+            message = {'payload': {'headers': [
+                {'name': name, 'value': _header_text(headers[name])}
+                for name in METADATA_HEADERS if headers[name] is not None
+            ]}}
+            parser = registry.match(message)
+            if parser is None:
+                continue
+
+            message_id, internal_date = parse_from_line(mm[from_start:start])
+            if internal_date is None:
+                internal_date = _date_header_ms(headers['Date'])
+            if message_id is None:
+                # Not a Takeout export: key on the Message-ID header (stable across exports)
+                key = headers['Message-ID'] or f"{path}:{from_start}"
+                message_id = 'mbox-' + hashlib.sha1(key.encode('utf-8', 'replace')).hexdigest()[:16]
+            if exclude is not None and exclude(message_id):
+                continue
+
+            claimed += 1
+            message['id'] = message_id
+            if internal_date is not None:
+                message['internalDate'] = str(internal_date)
+            data = mm[start:end]
+            if b'>From ' in data:
+                data = _QUOTED_FROM.sub(rb'\1', data)
+            message['mime'] = data
+            yield message_id, message, parser
+
+        METRICS.inc('mbox_messages_scanned_total', scanned % PROGRESS_EVERY)
+        METRICS.inc('mbox_messages_claimed_total', claimed)
+        METRICS.inc('mbox_bytes_scanned_total', size)
+        logger.info("Scanned %d messages (%.0f MB), %d claimed by a parser.", scanned, size / 2**20, claimed,
+                    extra={'scanned': scanned, 'claimed': claimed, 'bytes': size})
+
+
+def import_mbox(path, user_pk, parse_workers=process_email.PARSE_WORKERS,
+                categorize_workers=process_email.CATEGORIZE_WORKERS):
+    """
+    Backfills one user's transactions from an mbox export through the same
+    extraction -> categorization -> DB write path as process_user_inbox.
+    Messages already in the sync ledger are skipped, so re-imports and overlap
+    with the Gmail sync are free. The ledger's historyId is left alone; once the
+    whole file is imported the watermark advances, so the next Gmail sync only
+    lists mail newer than the export.
+
+    Returns:
+        Number of claimed messages processed.
+    """
+    ledger = SyncLedger(process_email.DB_NAME, user_pk)
+    cache = CategoryCache(process_email.DB_NAME, SYSTEM_PROMPT)
+    store = TransactionStore(process_email.DB_NAME)
+    try:
+        logger.info("--- Importing %s for user PK %d (%s) ---", path, user_pk, ', '.join(process_email.PARSERS.by_bank),
+                    extra={'user_pk': user_pk})
+        processed = process_email.ingest_messages(
+            iter_mbox_messages(path, process_email.PARSERS, exclude=ledger.is_processed),
+            user_pk, ledger, cache, store,
+            parse_workers=parse_workers,
+            categorize_workers=categorize_workers
+        )
+        ledger.flush(save_state=True)
+        logger.info("Imported %d transaction emails.", processed, extra={'user_pk': user_pk, 'messages': processed})
+        logger.info(store.report())
+        logger.info(cache.report())
+        return processed
+    finally:
+        ledger.close()
+        cache.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Backfill a user's transactions from a Google Takeout .mbox export.")
+    parser.add_argument('user', help="User ID from USER_MAP (e.g. 'leila').")
+    parser.add_argument('mbox', nargs='+', help="One or more .mbox files.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-format', default='text', choices=LOG_FORMATS, help="'json' emits one object per line.")
+    parser.add_argument('--metrics-json', metavar='PATH', help="Write the run's metrics summary as JSON.")
+    parser.add_argument('--defer-categorization', action='store_true',
+                        help="Only queue imported transactions for Gemini; category_worker.py categorizes them.")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    if args.user not in process_email.USER_MAP:
+        logger.error("User ID '%s' not mapped to a database primary key. Add it to USER_MAP.", args.user)
+        sys.exit(1)
+
+    METRICS.reset()
+    process_email.initialize_db()
+    try:
+        for path in args.mbox:
+            import_mbox(path, process_email.USER_MAP[args.user])
+        if not args.defer_categorization:
+            from category_worker import drain
+            drain()
+    finally:
+        logger.info("--- Run Metrics ---\n%s", METRICS.format_summary())
+        if args.metrics_json:
+            METRICS.write_json(args.metrics_json)
+            logger.info("Metrics written to %s", args.metrics_json)
@@ -0,0 +1,232 @@
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import yaml
+
+from metrics import METRICS
+from pipeline import CATEGORIZE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# --- LLM Client Configuration ---
+# Model, sampling, timeout and retry settings live in config/model_config.yaml.
+MODEL_CONFIG_PATH = Path(__file__).resolve().parent / 'config' / 'model_config.yaml'
+GEMINI_BASE_URL = 'https://generativelanguage.googleapis.com/v1beta/models'
+# Jittered exponential backoff between attempts (when no shared RateLimiter paces retries)
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+# Statuses worth another attempt; anything else (400, 401, 403, ...) fails immediately
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """A request that failed for good (non-retryable status, or retries exhausted)."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def load_model_config(config_path=MODEL_CONFIG_PATH):
+    """Reads model_config.yaml into a dict."""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def retry_after_seconds(response):
+    """Parses a Retry-After header (delay in seconds or an HTTP date), if the server sent one."""
+    value = getattr(response, 'headers', {}).get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff for `attempt` (0-based), never shorter than
+    the server's Retry-After.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+def _pooled_session(pool_size):
+    """
+    A requests.Session with a keep-alive pool of `pool_size` connections per host.
+    Every new TCP(+TLS) connection is timed into stage_seconds{stage=llm_connect}
+    and counted, so reuse shows up as a connect count far below the request count.
+    """
+    import requests
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    def timed(connection_cls):
+        class TimedConnection(connection_cls):
+            def connect(self):
+                with METRICS.stage('llm_connect'):
+                    super().connect()
+                METRICS.inc('llm_connections_total')
+        return TimedConnection
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = timed(HTTPConnection)
+
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = timed(HTTPSConnection)
+
+    class TimedAdapter(requests.adapters.HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': TimedHTTPConnectionPool,
+                'https': TimedHTTPSConnectionPool,
+            }
+
+    session = requests.Session()
+    # pool_block: callers beyond pool_size wait for a pooled connection rather than
+    # opening (and handshaking) a throwaway one
+    adapter = TimedAdapter(pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class LLMClient:
+    """
+    Gemini generateContent client shared by the whole process.
+
+    - One keep-alive connection pool (sized for the categorization workers), created
+      on first use, so only the first request per connection pays for TCP + TLS.
+    - Model, temperature, top_p, max_tokens, timeout and max_retries come from
+      model_config.yaml; callers size max_tokens per request to the answer they expect.
+    - 429/5xx and transport errors are retried with jittered backoff that honors
+      Retry-After. With a shared RateLimiter the limiter paces the retries instead.
+
+    `url` overrides the endpoint (e.g. the offline stub in benchmarks/stub_gemini.py);
+    GEMINI_API_URL does the same from the environment.
+    """
+
+    def __init__(self, config=None, url=None, pool_size=CATEGORIZE_WORKERS):
+        self.config = config if config is not None else load_model_config()
+        self.model = self.config.get('model', 'gemini-2.0-flash')
+        self.url = url or os.getenv('GEMINI_API_URL') or f"{GEMINI_BASE_URL}/{self.model}:generateContent"
+        self.api_key = os.getenv(self.config.get('api_key_env', 'GEMINI_API_KEY'))
+        self.timeout = self.config.get('timeout_seconds', 10)
+        self.max_retries = self.config.get('max_retries', 2)
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = _pooled_session(self.pool_size)
+            return self._session
+
+    def close(self):
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def payload(self, text, system=None, max_tokens=None, json_response=False):
+        """The generateContent request body for one prompt."""
+        generation = {
+            'maxOutputTokens': max_tokens or self.config.get('max_tokens', 128),
+            'temperature': self.config.get('temperature', 0.2),
+            'topP': self.config.get('top_p', 0.9),
+            'candidateCount': self.config.get('n', 1),
+        }
+        if json_response:
+            generation['responseMimeType'] = 'application/json'
+        payload = {
+            'contents': [{'parts': [{'text': text}]}],
+            'generationConfig': generation,
+        }
+        if system:
+            payload['systemInstruction'] = {'parts': [{'text': system}]}
+        return payload
+
+    def generate(self, text, system=None, max_tokens=None, json_response=False,
+                 timeout=None, limiter=None, max_retries=None):
+        """
+        Sends one prompt and returns the text of the first candidate.
+
+        Args:
+            max_tokens: Response token cap for this request; defaults to the config's max_tokens.
+            json_response: Ask for application/json output.
+            timeout: Seconds; defaults to the config's timeout_seconds.
+            limiter: Optional shared RateLimiter; each attempt runs inside it, and
+                failures pause it (with the server's Retry-After) instead of sleeping here.
+            max_retries: Defaults to the config's max_retries.
+
+        Raises:
+            LLMError: on a non-retryable status, an unusable response, or when
+                every attempt failed.
+        """
+        import requests
+
+        payload = self.payload(text, system, max_tokens, json_response)
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['x-goog-api-key'] = self.api_key
+        timeout = timeout or self.timeout
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        for attempt in range(max_retries + 1):
+            try:
+                with limiter or nullcontext(), METRICS.stage('llm_request'):
+                    response = self.session.post(self.url, headers=headers, json=payload, timeout=timeout)
+                status = response.status_code
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                retry_after = retry_after_seconds(getattr(e, 'response', None))
+                METRICS.inc('llm_requests_total', outcome='throttled' if status == 429 else 'error')
+                if status is not None and status not in RETRYABLE_STATUSES:
+                    raise LLMError(f"Gemini request failed: {e}", status=status) from e
+                # Other callers sharing the limiter back off even if this call gives up
+                delay = limiter.throttled(retry_after) if limiter is not None else backoff_delay(attempt, retry_after)
+                if attempt == max_retries:
+                    raise LLMError(f"Gemini request failed after {attempt + 1} attempts: {e}",
+                                   status=status, retry_after=retry_after) from e
+
+                METRICS.inc('llm_http_retries_total')
+                logger.warning("Gemini error (attempt %d/%d): %s. Retrying in %.1fs...",
+                               attempt + 1, max_retries + 1, e, delay, extra={'status': status})
+                if limiter is None:
+                    time.sleep(delay)
+                continue
+
+            if limiter is not None:
+                limiter.succeeded()
+            try:
+                answer = response.json()['candidates'][0]['content']['parts'][0]['text']
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                METRICS.inc('llm_requests_total', outcome='unusable')
+                raise LLMError(f"Gemini returned an unusable response: {e!r}", status=status) from e
+            METRICS.inc('llm_requests_total', outcome='ok')
+            return answer
+
+    async def generate_async(self, text, **kwargs):
+        """
+        Awaitable generate(): the blocking call runs on a worker thread and shares
+        the same connection pool, so sync and async callers reuse one set of connections.
+        """
+        import asyncio
+        return await asyncio.to_thread(self.generate, text, **kwargs)
@@ -0,0 +1,65 @@
+import json
+import logging
+import sys
+import time
+
+# --- Logging Configuration ---
+# Modules log through logging.getLogger(__name__) and attach structured fields with
+# `extra=`, e.g. logger.info("Flushed transactions", extra={'inserted': 12}).
+# The text format appends those fields as key=value pairs; the JSON format emits
+# one object per line for log shippers.
+LOG_FORMATS = ('text', 'json')
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`.
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def record_fields(record):
+    """The structured fields attached to a record via `extra=`."""
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """`2025-11-21 10:00:00 INFO    gmail_fetch: message key=value ...`"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, plus the structured fields."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level='INFO', fmt='text', stream=None):
+    """Installs a single root handler (replacing any previous one) at `level`."""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else KeyValueFormatter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    # Client libraries are chatty at DEBUG; keep them at WARNING unless asked for
+    for noisy in ('googleapiclient', 'urllib3', 'google_auth_httplib2'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
@@ -0,0 +1,292 @@
+import bisect
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# --- Metrics Configuration ---
+METRIC_PREFIX = 'cashmate_'
+# Latency histogram bucket upper bounds, in seconds (Prometheus-style, cumulative on export)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# HELP text for the metrics the ingestion run records
+METRIC_HELP = {
+    'stage_seconds': "Latency of one unit of work per pipeline stage.",
+    'gmail_api_calls_total': "Gmail API calls, by call type (list, get, batch, profile, history).",
+    'gmail_retries_total': "Gmail message fetches re-batched after a retryable error.",
+    'gmail_messages_dropped_total': "Gmail messages left out after failing every fetch attempt or a non-retryable error.",
+    'gmail_bytes_downloaded_total': "Base64 body bytes downloaded from Gmail, by message format.",
+    'llm_requests_total': "Gemini requests, by outcome (ok, throttled, error, unusable).",
+    'llm_retries_total': "Transactions re-sent to Gemini after a failed or incomplete answer.",
+    'llm_http_retries_total': "Gemini requests repeated by the LLM client after a 429, 5xx or transport error.",
+    'llm_connections_total': "New connections (TCP + TLS handshake) opened to the Gemini endpoint.",
+    'category_lookups_total': "Transactions categorized, by source (rule, cache, similar, llm, fallback, queued, unanswered).",
+    'category_queue_enqueued_total': "Transactions saved as Pending and queued for Gemini categorization.",
+    'category_queue_leased_total': "Queued transactions leased by a categorization worker.",
+    'category_queue_completed_total': "Queued transactions given a category by a worker.",
+    'category_queue_failed_total': "Queued transactions returned after a failed attempt, by outcome (retry, parked).",
+    'messages_processed_total': "Messages that went through the pipeline (claimed or not).",
+    'extraction_failures_total': "Claimed messages that yielded no transaction, by reason.",
+    'transactions_saved_total': "Rows inserted into the transactions table.",
+    'duplicates_skipped_total': "Rows skipped by INSERT OR IGNORE as already present.",
+    'transactions_rejected_total': "Rows rejected before writing (unparseable date or amount).",
+    'mbox_messages_scanned_total': "Messages read from mbox exports (headers only unless claimed).",
+    'mbox_messages_claimed_total': "Mbox messages claimed by a parser and sent through the pipeline.",
+    'mbox_bytes_scanned_total': "Size of the mbox exports scanned, in bytes.",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _summary_key(name, key):
+    return name + ('{' + ','.join(f"{label}={value}" for label, value in key) + '}' if key else '')
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    escaped = (name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for name, value in key)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; cheap to update from any thread (callers hold the registry lock)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Approximate quantile, interpolated linearly inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / bucket_count, self.max)
+            seen += bucket_count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total_seconds': round(self.sum, 6),
+            'mean_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    """
+    In-process registry of counters and latency histograms for one ingestion run.
+
+    Everything is keyed by metric name plus a small set of labels, e.g.
+    `METRICS.inc('gmail_api_calls_total', call='list')` or
+    `with METRICS.stage('decode'): ...`. Exported as JSON (a per-run summary)
+    or in the Prometheus text exposition format for node_exporter's textfile
+    collector.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._counters = {}
+            self._histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        """Times the enclosed block into stage_seconds{stage=...}, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage):
+        """Decorator form of stage()."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def value(self, name, **labels):
+        """Current value of one counter (0 if never incremented)."""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def stage_stats(self, stage):
+        """Snapshot dict of one stage's histogram (zeros if it never ran)."""
+        with self._lock:
+            histogram = self._histograms.get(('stage_seconds', (('stage', stage),)), Histogram())
+            return histogram.snapshot()
+
+    # --- Export ---
+
+    def summary(self):
+        """
+        Per-run summary: wall time, counters (label values joined into the key,
+        e.g. "gmail_api_calls_total{call=list}") and per-stage latency stats.
+        """
+        with self._lock:
+            counters = {_summary_key(name, key): value for (name, key), value in sorted(self._counters.items())}
+            stages = {dict(key).get('stage', name): histogram.snapshot()
+                      for (name, key), histogram in sorted(self._histograms.items())}
+        return {
+            'started': self.started,
+            'wall_seconds': round(time.time() - self.started, 3),
+            'counters': counters,
+            'stages': stages,
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        seen = set()
+        for (name, key), value in counters:
+            metric = METRIC_PREFIX + name
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(key)} {value}")
+
+        for (name, key), histogram in histograms:
+            metric = METRIC_PREFIX + name
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{metric}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {histogram.sum}")
+            lines.append(f"{metric}_count{_format_labels(key)} {histogram.count}")
+
+        lines.append(f"# TYPE {METRIC_PREFIX}last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}last_run_timestamp_seconds {self.started}")
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        _atomic_write(path, self.to_json())
+
+    def write_prometheus(self, path):
+        _atomic_write(path, self.to_prometheus())
+
+    def format_summary(self):
+        """Human-readable stage table for the end-of-run log."""
+        summary = self.summary()
+        lines = [f"{'Stage':<14} {'Count':>8} {'Total s':>9} {'Mean ms':>9} {'p95 ms':>9} {'Max ms':>9}"]
+        for stage, stats in summary['stages'].items():
+            lines.append(f"{stage:<14} {stats['count']:>8} {stats['total_seconds']:>9.2f} "
+                         f"{stats['mean_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+        for name, value in summary['counters'].items():
+            lines.append(f"{name:<58} {value:>10}")
+        return '\n'.join(lines)
+
+
+def _atomic_write(path, text):
+    # Write-then-rename, so the textfile collector never scrapes a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# Shared by every module in the process, like the LLM rate limiter.
+METRICS = Metrics()
+
+
+# --- Profiling ---
+
+def profile_run(func, top=25):
+    """
+    Runs `func()` under cProfile, including every thread it starts (the
+    pipeline's workers do most of the work), then logs the `top` functions by
+    cumulative and by internal time.
+
+    Returns:
+        Whatever `func()` returns.
+    """
+    profiles = []
+    lock = threading.Lock()
+
+    def start_thread_profile(frame, event, arg):
+        # Runs once as the first profile event of each new thread; hands over to cProfile
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with lock:
+            profiles.append(profile)
+        profile.enable()
+
+    main_profile = cProfile.Profile()
+    threading.setprofile(start_thread_profile)
+    main_profile.enable()
+    try:
+        return func()
+    finally:
+        main_profile.disable()
+        threading.setprofile(None)
+        stats = pstats.Stats(main_profile, stream=io.StringIO())
+        with lock:
+            for profile in profiles:
+                stats.add(profile)
+        for sort, label in (('cumulative', 'cumulative'), ('tottime', 'internal')):
+            stats.stream = io.StringIO()
+            stats.sort_stats(sort).print_stats(top)
+            logger.info("Profile: top %d functions by %s time (all threads)\n%s", top, label,
+                        stats.stream.getvalue().strip(), extra={'sort': sort})
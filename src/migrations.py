@@ -0,0 +1,403 @@
+import logging
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+
+logger = logging.getLogger(__name__)
+
+# --- Schema Migrations ---
+# The schema version lives in PRAGMA user_version. Each migration upgrades the
+# database from version N-1 to N and runs inside its own transaction.
+# Migrations are frozen: their SQL is spelled out here rather than borrowed from
+# the modules that use the tables, so a later change to those modules can't
+# alter what an old migration does. Schema changes go in a new migration.
+
+# Date formats seen in bank alerts ("November 21, 2025", "Nov 21, 2025") plus ISO.
+DATE_FORMATS = ('%Y-%m-%d', '%B %d, %Y', '%b %d, %Y', '%m/%d/%Y')
+
+
+def to_iso_date(date_text):
+    """Converts an alert date like "November 21, 2025" to ISO-8601 ("2025-11-21")."""
+    text = date_text.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized transaction date: {date_text!r}")
+
+
+def to_cents(dollar_amount):
+    """Converts a dollar string like "1,234.50" to integer cents (123450)."""
+    try:
+        return int((Decimal(str(dollar_amount).replace(',', '').replace('$', '')) * 100).to_integral_value())
+    except InvalidOperation:
+        raise ValueError(f"Unrecognized dollar amount: {dollar_amount!r}")
+
+
+def _migrate_v1(conn):
+    """Original free-text schema (what initialize_db used to create)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_pk INTEGER NOT NULL,
+            bank TEXT NOT NULL,
+            date TEXT NOT NULL,
+            vendor TEXT NOT NULL,
+            dollar_amount TEXT NOT NULL,
+            category TEXT NOT NULL,
+            UNIQUE(user_pk, date, vendor, dollar_amount)
+        )
+    """)
+
+
+def _migrate_v2(conn):
+    """
+    Typed schema: ISO-8601 `date` and integer `amount_cents`, plus indexes so
+    date-range and per-category monthly queries are index range scans.
+    Existing rows are converted in place; rows whose date can't be parsed keep
+    their original text so nothing is lost.
+    """
+    def iso_or_raw(text):
+        try:
+            return to_iso_date(text)
+        except ValueError:
+            logger.warning("Keeping unparseable date %r during migration.", text)
+            return text
+
+    conn.create_function("to_iso_date", 1, iso_or_raw, deterministic=True)
+    conn.create_function("to_cents", 1, to_cents, deterministic=True)
+
+    conn.execute("""
+        CREATE TABLE transactions_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_pk INTEGER NOT NULL,
+            bank TEXT NOT NULL,
+            date TEXT NOT NULL,          -- ISO-8601, YYYY-MM-DD
+            vendor TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            UNIQUE(user_pk, date, vendor, amount_cents)
+        )
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO transactions_v2 (id, user_pk, bank, date, vendor, amount_cents, category)
+        SELECT id, user_pk, bank, to_iso_date(date), vendor, to_cents(dollar_amount), category
+        FROM transactions
+        ORDER BY id
+    """)
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_v2 RENAME TO transactions")
+    conn.execute("CREATE INDEX idx_transactions_user_date ON transactions (user_pk, date)")
+    conn.execute("CREATE INDEX idx_transactions_user_category_date ON transactions (user_pk, category, date)")
+
+
+def _migrate_v3(conn):
+    """Per user x month x category spending rollups (see rollups.py), maintained by triggers and backfilled once."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollups (
+            user_pk INTEGER NOT NULL,
+            month TEXT NOT NULL,         -- YYYY-MM
+            category TEXT NOT NULL,
+            txn_count INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            min_cents INTEGER NOT NULL,
+            max_cents INTEGER NOT NULL,
+            PRIMARY KEY (user_pk, month, category)
+        ) WITHOUT ROWID
+    """)
+    # Only ISO-dated rows are rolled up (v2 may keep unparseable dates as-is). A
+    # removed row's bucket recomputes min/max from its month, and is dropped once empty.
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO monthly_rollups (user_pk, month, category, txn_count, total_cents, min_cents, max_cents)
+            SELECT NEW.user_pk, substr(NEW.date, 1, 7), NEW.category, 1, NEW.amount_cents, NEW.amount_cents, NEW.amount_cents
+            WHERE NEW.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            ON CONFLICT(user_pk, month, category) DO UPDATE SET
+                txn_count = txn_count + 1,
+                total_cents = total_cents + excluded.total_cents,
+                min_cents = min(min_cents, excluded.min_cents),
+                max_cents = max(max_cents, excluded.max_cents);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_delete AFTER DELETE ON transactions BEGIN
+            UPDATE monthly_rollups SET
+                txn_count = txn_count - 1,
+                total_cents = total_cents - OLD.amount_cents,
+                min_cents = coalesce((SELECT min(amount_cents) FROM transactions
+                    WHERE user_pk = OLD.user_pk AND category = OLD.category
+                      AND date BETWEEN substr(OLD.date, 1, 7) || '-01' AND substr(OLD.date, 1, 7) || '-31'), 0),
+                max_cents = coalesce((SELECT max(amount_cents) FROM transactions
+                    WHERE user_pk = OLD.user_pk AND category = OLD.category
+                      AND date BETWEEN substr(OLD.date, 1, 7) || '-01' AND substr(OLD.date, 1, 7) || '-31'), 0)
+            WHERE user_pk = OLD.user_pk AND month = substr(OLD.date, 1, 7) AND category = OLD.category;
+            DELETE FROM monthly_rollups
+            WHERE user_pk = OLD.user_pk AND month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND txn_count <= 0;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+        AFTER UPDATE OF user_pk, date, amount_cents, category ON transactions BEGIN
+            UPDATE monthly_rollups SET
+                txn_count = txn_count - 1,
+                total_cents = total_cents - OLD.amount_cents,
+                min_cents = coalesce((SELECT min(amount_cents) FROM transactions
+                    WHERE user_pk = OLD.user_pk AND category = OLD.category
+                      AND date BETWEEN substr(OLD.date, 1, 7) || '-01' AND substr(OLD.date, 1, 7) || '-31'), 0),
+                max_cents = coalesce((SELECT max(amount_cents) FROM transactions
+                    WHERE user_pk = OLD.user_pk AND category = OLD.category
+                      AND date BETWEEN substr(OLD.date, 1, 7) || '-01' AND substr(OLD.date, 1, 7) || '-31'), 0)
+            WHERE user_pk = OLD.user_pk AND month = substr(OLD.date, 1, 7) AND category = OLD.category;
+            DELETE FROM monthly_rollups
+            WHERE user_pk = OLD.user_pk AND month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND txn_count <= 0;
+            INSERT INTO monthly_rollups (user_pk, month, category, txn_count, total_cents, min_cents, max_cents)
+            SELECT NEW.user_pk, substr(NEW.date, 1, 7), NEW.category, 1, NEW.amount_cents, NEW.amount_cents, NEW.amount_cents
+            WHERE NEW.date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+            ON CONFLICT(user_pk, month, category) DO UPDATE SET
+                txn_count = txn_count + 1,
+                total_cents = total_cents + excluded.total_cents,
+                min_cents = min(min_cents, excluded.min_cents),
+                max_cents = max(max_cents, excluded.max_cents);
+        END
+    """)
+    conn.execute("DELETE FROM monthly_rollups")
+    conn.execute("""
+        INSERT INTO monthly_rollups (user_pk, month, category, txn_count, total_cents, min_cents, max_cents)
+        SELECT user_pk, substr(date, 1, 7), category, count(*), sum(amount_cents), min(amount_cents), max(amount_cents)
+        FROM transactions
+        WHERE date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+        GROUP BY user_pk, substr(date, 1, 7), category
+    """)
+
+
+def _migrate_v4(conn):
+    """Durable categorization queue: rows waiting for Gemini (see category_queue.py)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS category_queue (
+            transaction_id INTEGER PRIMARY KEY,  -- transactions.id
+            enqueued_at REAL NOT NULL,
+            available_at REAL,                   -- leasable from this time; NULL once parked
+            lease_owner TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_category_queue_available ON category_queue (available_at)")
+    # Entries go away with their transaction, or once it has a category (a worker's or one fixed by hand)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_category_queue_delete AFTER DELETE ON transactions BEGIN
+            DELETE FROM category_queue WHERE transaction_id = OLD.id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_category_queue_done
+        AFTER UPDATE OF category ON transactions WHEN NEW.category != 'Pending' BEGIN
+            DELETE FROM category_queue WHERE transaction_id = NEW.id;
+        END
+    """)
+
+
+def _migrate_v5(conn):
+    """Monthly statement ledger and change log (see statements.py); every month renders on the first run."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS statements (
+            user_pk INTEGER NOT NULL,
+            month TEXT NOT NULL,         -- YYYY-MM
+            render_hash TEXT NOT NULL,   -- templates, layout and formats it was rendered with
+            content_hash TEXT NOT NULL,  -- statement data + render_hash
+            rendered_at REAL NOT NULL,
+            PRIMARY KEY (user_pk, month)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS statement_changes (
+            user_pk INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            changes INTEGER NOT NULL,    -- writes since the last run; lets a run clear only what it saw
+            PRIMARY KEY (user_pk, month)
+        ) WITHOUT ROWID
+    """)
+    # Every write to `transactions` counts a change against the (user, month) it touches
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_statement_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO statement_changes (user_pk, month, changes)
+            VALUES (NEW.user_pk, substr(NEW.date, 1, 7), 1)
+            ON CONFLICT(user_pk, month) DO UPDATE SET changes = changes + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_statement_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO statement_changes (user_pk, month, changes)
+            VALUES (OLD.user_pk, substr(OLD.date, 1, 7), 1)
+            ON CONFLICT(user_pk, month) DO UPDATE SET changes = changes + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_statement_update
+        AFTER UPDATE OF user_pk, date, vendor, amount_cents, category ON transactions BEGIN
+            INSERT INTO statement_changes (user_pk, month, changes)
+            VALUES (OLD.user_pk, substr(OLD.date, 1, 7), 1)
+            ON CONFLICT(user_pk, month) DO UPDATE SET changes = changes + 1;
+            INSERT INTO statement_changes (user_pk, month, changes)
+            VALUES (NEW.user_pk, substr(NEW.date, 1, 7), 1)
+            ON CONFLICT(user_pk, month) DO UPDATE SET changes = changes + 1;
+        END
+    """)
+
+
+def _migrate_v6(conn):
+    """Export watermarks: the last transaction id written to each export target (see export.py)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_state (
+            target TEXT PRIMARY KEY,     -- resolved output path
+            filters TEXT NOT NULL,       -- JSON; an incremental export must use the same filters
+            last_id INTEGER NOT NULL,    -- every matching row up to this id has been exported
+            rows INTEGER NOT NULL,       -- total rows exported to the target
+            exported_at INTEGER NOT NULL
+        )
+    """)
+
+
+def _migrate_v7(conn):
+    """Per-user history versions, so caches of derived data (recurring.py) notice any write."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_versions (
+            user_pk INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL     -- bumped by every write to the user's transactions
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_version_insert AFTER INSERT ON transactions BEGIN
+            INSERT INTO history_versions (user_pk, version) VALUES (NEW.user_pk, 1)
+            ON CONFLICT(user_pk) DO UPDATE SET version = version + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_version_delete AFTER DELETE ON transactions BEGIN
+            INSERT INTO history_versions (user_pk, version) VALUES (OLD.user_pk, 1)
+            ON CONFLICT(user_pk) DO UPDATE SET version = version + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_history_version_update AFTER UPDATE ON transactions BEGIN
+            INSERT INTO history_versions (user_pk, version) VALUES (OLD.user_pk, 1)
+            ON CONFLICT(user_pk) DO UPDATE SET version = version + 1;
+            INSERT INTO history_versions (user_pk, version) VALUES (NEW.user_pk, 1)
+            ON CONFLICT(user_pk) DO UPDATE SET version = version + 1;
+        END
+    """)
+
+
+def _migrate_v8(conn):
+    """
+    Sync ledger, category cache and backfill checkpoints (see sync_state.py and
+    category_cache.py), which their classes used to create on first use; IF NOT
+    EXISTS keeps the tables those left behind.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            user_pk INTEGER PRIMARY KEY,
+            history_id TEXT,
+            watermark INTEGER,           -- newest processed internalDate, epoch seconds
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            user_pk INTEGER NOT NULL,
+            message_id TEXT NOT NULL,
+            processed_at INTEGER NOT NULL,
+            PRIMARY KEY (user_pk, message_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS category_cache (
+            prompt_hash TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            category TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            last_used_at INTEGER NOT NULL,
+            PRIMARY KEY (prompt_hash, cache_key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_plans (
+            user_pk INTEGER NOT NULL,
+            query_hash TEXT NOT NULL,
+            history_id TEXT,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (user_pk, query_hash)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS backfill_windows (
+            user_pk INTEGER NOT NULL,
+            query_hash TEXT NOT NULL,
+            after INTEGER NOT NULL,      -- epoch seconds, inclusive
+            before INTEGER NOT NULL,     -- epoch seconds, exclusive
+            estimate INTEGER NOT NULL,   -- Gmail's resultSizeEstimate when planned
+            messages INTEGER,            -- processed; NULL until the window is done
+            completed_at INTEGER,
+            PRIMARY KEY (user_pk, query_hash, after)
+        ) WITHOUT ROWID
+    """)
+
+
+MIGRATIONS = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+    _migrate_v6,
+    _migrate_v7,
+    _migrate_v8,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    """Current schema version; pre-versioning databases with a transactions table count as 1."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0 and conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions'"
+    ).fetchone():
+        version = 1
+    return version
+
+
+def migrate(conn):
+    """
+    Brings the database up to SCHEMA_VERSION, one migration per transaction.
+    The version is re-read after taking the write lock, so several processes
+    starting at once apply each migration exactly once.
+
+    Returns:
+        The (old, new) schema versions.
+    """
+    start = get_schema_version(conn)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # manage the migration transactions explicitly
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = get_schema_version(conn)
+                if version >= SCHEMA_VERSION:
+                    conn.execute("COMMIT")
+                    break
+                MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info("Migrated database schema to version %d.", version + 1, extra={'schema_version': version + 1})
+    finally:
+        conn.isolation_level = isolation_level
+
+    return start, version
@@ -0,0 +1,155 @@
+import base64
+import re
+from email import policy
+from email.parser import BytesParser
+
+# --- Message Body Decoding ---
+# Two ways to get text out of a Gmail message:
+#   - format='full': walk the JSON payload tree (get_plain_text_body / get_message_text)
+#   - format='raw':  parse the RFC 822 bytes with the stdlib email parser (get_raw_message_text)
+# Both prefer text/plain and fall back to an HTML-to-text conversion, which is how
+# HTML-only notifications (PNC alerts, Amazon order confirmations) arrive.
+
+# compat32 skips the header-object machinery of policy.default, several times faster
+_BYTES_PARSER = BytesParser(policy=policy.compat32)
+_WHITESPACE = re.compile(r'[ \t\r\f\v]+')
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+# XHTML bodies may open with one; lxml refuses a declared encoding on an already-decoded str
+_XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+# Elements whose text never belongs in the extracted body
+_SKIPPED_TAGS = ('script', 'style', 'head', 'title')
+
+
+def _b64decode(data):
+    """base64url decode that tolerates Gmail's missing padding."""
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def html_to_text(html):
+    """
+    Converts an HTML body to plain text with lxml: drops script/style, keeps
+    block structure as newlines and collapses whitespace so regex extractors
+    see the same shape of text a text/plain alert would have.
+    Returns None for markup lxml can't make a document of (e.g. only a comment),
+    so the message is reported as having no body instead of failing the run.
+    """
+    import lxml.etree  # deferred: only HTML-only messages need it
+    import lxml.html
+
+    if isinstance(html, bytes):
+        html = html.decode('utf-8', errors='replace')
+    html = _XML_DECLARATION.sub('', html, count=1)
+    if not html.strip():
+        return ''
+    try:
+        document = lxml.html.document_fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+    # Collected first: dropping while iterating would end the walk at the first drop
+    for element in list(document.iter(*_SKIPPED_TAGS)):
+        element.drop_tree()
+    for element in document.iter('br', 'p', 'div', 'tr', 'li', 'h1', 'h2', 'h3', 'table'):
+        element.tail = '\n' + (element.tail or '')
+    for element in document.iter('td', 'th'):
+        element.tail = ' ' + (element.tail or '')  # "Merchant:</td><td>WAWA" -> "Merchant: WAWA"
+
+    text = _WHITESPACE.sub(' ', document.text_content().replace('\xa0', ' '))
+    return _BLANK_LINES.sub('\n', text).strip()
+
+
+def get_plain_text_body(msg_part):
+    """
+    Extracts the plain text body from a Gmail API message payload.
+    It iterates through parts and handles MIME decoding.
+    """
+    if 'parts' in msg_part.get('payload', {}):
+        for part in msg_part['payload']['parts']:
+            # Recursively check for content in sub-parts (common for multipart/alternative)
+            result = get_plain_text_body(part)
+            if result:
+                return result
+
+    # Check for text/plain mimeType
+    if msg_part['mimeType'] == 'text/plain' and 'data' in msg_part['body']:
+        data = msg_part['body']['data']
+        # Decode base64 URL safe, then decode bytes to string
+        return base64.urlsafe_b64decode(data).decode('utf-8')
+
+    return None
+
+
+def _find_part(part, mime_type):
+    """Depth-first search of a Gmail payload tree for the first part with data of `mime_type`."""
+    if part.get('mimeType') == mime_type and part.get('body', {}).get('data'):
+        return part
+    for child in part.get('parts', ()):
+        found = _find_part(child, mime_type)
+        if found is not None:
+            return found
+    return None
+
+
+def _part_charset(part):
+    for header in part.get('headers', ()):
+        if header['name'].lower() == 'content-type':
+            match = re.search(r'charset="?([\w.-]+)"?', header['value'], re.IGNORECASE)
+            if match:
+                return match.group(1)
+    return 'utf-8'
+
+
+def get_message_text(message):
+    """
+    Text of a format='full' message: the text/plain part if there is one (at any
+    nesting depth), otherwise the text/html part converted to text. Only the
+    chosen part is base64-decoded.
+    """
+    payload = message.get('payload', message)
+    for mime_type in ('text/plain', 'text/html'):
+        part = _find_part(payload, mime_type)
+        if part is None:
+            continue
+        data = _b64decode(part['body']['data'])
+        try:
+            text = data.decode(_part_charset(part), errors='replace')
+        except LookupError:
+            text = data.decode('utf-8', errors='replace')
+        return text if mime_type == 'text/plain' else html_to_text(text)
+    return None
+
+
+def _decode_part(part):
+    """Transfer-decodes one email.message part and decodes it with its declared charset."""
+    data = part.get_payload(decode=True) or b''
+    try:
+        return data.decode(part.get_content_charset() or 'utf-8', errors='replace')
+    except LookupError:
+        return data.decode('utf-8', errors='replace')
+
+
+def get_raw_message_text(message):
+    """Text of a format='raw' message (see get_mime_text)."""
+    return get_mime_text(_b64decode(message['raw']))
+
+
+def get_mime_text(data):
+    """
+    Text of an RFC 822 message given as bytes, parsed bytes-first with the stdlib
+    email parser. Parts are walked without decoding; only the chosen text/plain
+    (or, failing that, text/html) part is transfer- and charset-decoded.
+    """
+    parsed = _BYTES_PARSER.parsebytes(data)
+    html_part = None
+    for part in parsed.walk():
+        if part.get_content_maintype() == 'multipart' or part.get_filename():
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/plain':
+            return _decode_part(part)
+        if content_type == 'text/html' and html_part is None:
+            html_part = part
+    if html_part is None:
+        return None
+    return html_to_text(_decode_part(html_part))
@@ -0,0 +1,126 @@
+import logging
+import re
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# --- Parser Registry Configuration ---
+CONFIG_PATH = Path(__file__).resolve().parent / 'config' / 'config.yaml'
+METADATA_HEADERS = ['From', 'Subject', 'Date']
+
+
+def get_header(message, name):
+    """Returns a header value from a Gmail message resource (any format), or ''."""
+    for header in message.get('payload', {}).get('headers', []):
+        if header['name'].lower() == name.lower():
+            return header['value']
+    return ''
+
+
+def header_date(message):
+    """The message's Date header as an ISO date, or None if missing/unparseable."""
+    try:
+        return parsedate_to_datetime(get_header(message, 'Date')).date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+class TransactionParser:
+    """
+    Extracts one transaction from the text of a bank/merchant notification.
+    Built from a `parsers` entry in config.yaml; the regex is compiled once.
+    """
+
+    def __init__(self, bank, sender, subject, pattern, vendor=None):
+        self.bank = bank
+        self.sender = sender.lower()
+        self.subject = subject.lower()
+        self.vendor = vendor
+        self.pattern = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+    def claims(self, sender, subject):
+        """True if a message with these From/Subject headers belongs to this parser."""
+        return self.sender in sender.lower() and self.subject in subject.lower()
+
+    def query(self):
+        return f"(from:{self.sender} subject:\"{self.subject}\")"
+
+    def extract(self, plain_text, user_pk, message=None):
+        """
+        Applies the pattern to a message body.
+
+        Returns:
+            Transaction dict (without category), or None if the text doesn't match.
+        """
+        match = self.pattern.search(plain_text)
+        if not match:
+            return None
+
+        fields = match.groupdict()
+        # Clean up vendor name (get everything before the comma, then strip whitespace)
+        vendor = (fields.get('vendor') or self.vendor or '').split(',')[0].strip()
+        date = (fields.get('date') or '').strip() or (header_date(message) if message else None)
+        if not vendor or not date:
+            return None
+
+        return {
+            'user_pk': user_pk,
+            'bank': self.bank,
+            'date': date,
+            'vendor': vendor,
+            'dollar_amount': fields['amount'].replace(',', '').strip()
+            # Category will be added by categorize_transactions()
+        }
+
+
+class ParserRegistry:
+    """
+    All configured parsers, keyed by sender/subject.
+    Provides one combined Gmail query covering every sender and routes each
+    message to its parser from the metadata headers alone.
+    """
+
+    def __init__(self, parsers):
+        self.parsers = parsers
+        self.by_bank = {parser.bank: parser for parser in parsers}
+
+    def query(self):
+        """Single Gmail search matching any registered sender/subject pair."""
+        # Parenthesized so terms appended later (e.g. after:) apply to every sender
+        return "(" + " OR ".join(parser.query() for parser in self.parsers) + ")"
+
+    def match(self, message):
+        """Returns the parser claiming a (metadata or full) message, or None."""
+        sender = get_header(message, 'From')
+        subject = get_header(message, 'Subject')
+        for parser in self.parsers:
+            if parser.claims(sender, subject):
+                return parser
+        return None
+
+
+def load_parsers(config_path=CONFIG_PATH):
+    """
+    Builds the parser registry from the `email_search` section of config.yaml.
+    Parsers whose sender isn't covered by the `senders` allow-list are skipped.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = yaml.safe_load(f)['email_search']
+
+    allowed = [sender.lower() for sender in config.get('senders', [])]
+    parsers = []
+    for bank, spec in config.get('parsers', {}).items():
+        if allowed and not any(sender in spec['sender'].lower() for sender in allowed):
+            logger.warning("Skipping parser '%s': sender %s is not in email_search.senders.", bank, spec['sender'])
+            continue
+        parsers.append(TransactionParser(
+            bank=bank,
+            sender=spec['sender'],
+            subject=spec['subject'],
+            pattern=spec['pattern'],
+            vendor=spec.get('vendor'),
+        ))
+    return ParserRegistry(parsers)
@@ -0,0 +1,306 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# --- Pipeline Configuration ---
+PARSE_WORKERS = 2
+CATEGORIZE_WORKERS = 4
+QUEUE_SIZE = 200
+BATCH_LINGER_SECONDS = 0.5  # flush a partial categorization batch after this much idle time
+
+# Default LLM quota: requests per second and burst size for the token bucket.
+LLM_REQUESTS_PER_SECOND = 4.0
+LLM_BURST = 4
+
+_DONE = object()
+
+
+class TokenBucket:
+    """
+    Classic token bucket shared by every thread that calls a rate-limited API.
+    `pause()` blocks the whole bucket (e.g. after a 429 with Retry-After), so all
+    callers back off together instead of each sleeping on its own schedule.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)  # a request larger than the bucket waits for a full one
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return
+                    wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: every success raises the limit by one (up to
+    `max_limit`), every throttled/5xx response halves it.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = max_limit
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def increase(self):
+        with self._cond:
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self._cond.notify_all()
+
+    def decrease(self):
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit // 2)
+
+
+class RateLimiter:
+    """
+    Token bucket + adaptive concurrency in one object, used as a context manager
+    around each API request:
+
+        with limiter:
+            response = post(...)
+        limiter.succeeded()  /  limiter.throttled(retry_after)
+
+    `with limiter.slot(cost):` does the same for a request that spends `cost`
+    tokens, e.g. a Gmail batch priced in quota units.
+    """
+
+    def __init__(self, rate=LLM_REQUESTS_PER_SECOND, burst=LLM_BURST, max_concurrency=CATEGORIZE_WORKERS):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._backoff = 1.0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def acquire(self, cost=1):
+        self.concurrency.acquire()
+        try:
+            self.bucket.acquire(cost)
+        except BaseException:
+            self.concurrency.release()
+            raise
+        return self
+
+    @contextmanager
+    def slot(self, cost=1):
+        self.acquire(cost)
+        try:
+            yield self
+        finally:
+            self.concurrency.release()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.concurrency.release()
+        return False
+
+    def succeeded(self):
+        with self._lock:
+            self._backoff = 1.0
+        self.concurrency.increase()
+
+    def throttled(self, retry_after=None):
+        """Records a 429/5xx/transport failure: shrink concurrency and pause the bucket."""
+        with self._lock:
+            delay = retry_after if retry_after is not None else self._backoff
+            self._backoff = min(self._backoff * 2, 60.0)
+        self.concurrency.decrease()
+        self.bucket.pause(delay)
+        return delay
+
+
+def run_pipeline(source, parse, categorize, write, parse_workers=PARSE_WORKERS,
+                 categorize_workers=CATEGORIZE_WORKERS, batch_size=50, queue_size=QUEUE_SIZE):
+    """
+    Runs fetch -> parse -> categorize -> write as concurrent stages joined by bounded queues.
+
+    Args:
+        source: Iterable of work items (consumed on its own thread, e.g. Gmail fetching).
+        parse: item -> record or None. Runs on `parse_workers` threads.
+        categorize: list of records -> list of categories. Runs on `categorize_workers`
+            threads, fed batches of up to `batch_size` records.
+        write: (item, record, category) -> None. Always called on the calling thread,
+            one item at a time and in source order, so DB writes stay single-writer.
+            `record` and `category` are None for items that did not parse.
+
+    Exceptions raised by any stage (or by `write`) stop the pipeline and are
+    re-raised here once every stage thread has exited.
+    """
+    parse_q = queue.Queue(maxsize=queue_size)
+    batch_q = queue.Queue(maxsize=queue_size)
+    write_q = queue.Queue()
+    errors = []
+    stop = threading.Event()
+
+    def guarded(target):
+        def run(*args):
+            try:
+                target(*args)
+            except BaseException as e:  # surfaced on the calling thread
+                errors.append(e)
+                stop.set()
+                write_q.put(_DONE)
+        return run
+
+    def put(q, value):
+        # Bounded puts that give up once another stage has failed
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        # Blocking gets that give up (as _DONE) once another stage has failed
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def produce():
+        seq = 0
+        for item in source:
+            if not put(parse_q, (seq, item)):
+                return
+            seq += 1
+        for _ in range(parse_workers):
+            put(parse_q, _DONE)
+
+    def parse_worker():
+        while True:
+            entry = get(parse_q)
+            if entry is _DONE:
+                put(batch_q, _DONE)
+                return
+            seq, item = entry
+            put(batch_q, (seq, item, parse(item)))
+
+    def batcher(executor):
+        # Parsed records are grouped into categorization batches; unparsed items go straight to the writer
+        finished_workers = 0
+        batch = []
+        slots = threading.Semaphore(categorize_workers * 2)
+
+        def submit(entries):
+            # Batches cancelled after a failure never release their slot
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+
+            def run():
+                try:
+                    categories = categorize([record for _seq, _item, record in entries])
+                    for (seq, item, record), category in zip(entries, categories):
+                        write_q.put((seq, item, record, category))
+                finally:
+                    slots.release()
+
+            executor.submit(guarded(run))
+
+        while finished_workers < parse_workers and not stop.is_set():
+            try:
+                entry = batch_q.get(timeout=BATCH_LINGER_SECONDS)
+            except queue.Empty:
+                if batch:
+                    submit(batch)
+                    batch = []
+                continue
+
+            if entry is _DONE:
+                finished_workers += 1
+                continue
+
+            seq, item, record = entry
+            if record is None:
+                write_q.put((seq, item, None, None))
+                continue
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                submit(batch)
+                batch = []
+
+        if batch:
+            submit(batch)
+
+    executor = ThreadPoolExecutor(max_workers=categorize_workers)
+    threads = [threading.Thread(target=guarded(produce), daemon=True)]
+    threads += [threading.Thread(target=guarded(parse_worker), daemon=True) for _ in range(parse_workers)]
+    batch_thread = threading.Thread(target=guarded(batcher), args=(executor,), daemon=True)
+    threads.append(batch_thread)
+    for thread in threads:
+        thread.start()
+
+    def finish():
+        # Once the batcher has submitted everything, wait for categorization to drain
+        batch_thread.join()
+        executor.shutdown(wait=True)
+        write_q.put(_DONE)
+
+    threads.append(threading.Thread(target=finish, daemon=True))
+    threads[-1].start()
+
+    # Writer: reorder by sequence number so writes happen in source order
+    next_seq = 0
+    buffered = {}
+    try:
+        while True:
+            entry = write_q.get()
+            if entry is _DONE:
+                break
+            seq, item, record, category = entry
+            buffered[seq] = (item, record, category)
+            while next_seq in buffered:
+                write(*buffered.pop(next_seq))
+                next_seq += 1
+    finally:
+        # After a failure (here or in a stage) every stage sees `stop` and exits; the
+        # fetch thread finishes the item it is on. Nothing outlives the call.
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
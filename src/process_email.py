@@ -1,21 +1,36 @@
 
 import os.path
 from dotenv import load_dotenv
+import logging
 import pickle
 import sys
-import re
-import sqlite3
-import base64
-import requests
+import json
 import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 
-
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+# requests, google-auth, google_auth_oauthlib and googleapiclient.discovery are
+# imported where they are used: together they cost ~0.4s of start-up, and an
+# "up to date" run needs none but the discovery client.
 from googleapiclient.errors import HttpError
 from prompt import SYSTEM_PROMPT
+from gmail_fetch import iter_routed_messages, BATCH_SIZE
+from parsers import load_parsers, METADATA_HEADERS
+from mime_decode import get_message_text, get_mime_text, get_raw_message_text
+from sync_state import SyncLedger, get_current_history_id, check_for_new_messages
+from category_cache import CategoryCache, cache_key
+from category_rules import CATEGORIES, PENDING_CATEGORY, match_rule_category
+from pipeline import RateLimiter, run_pipeline, PARSE_WORKERS, CATEGORIZE_WORKERS
+from transaction_store import TransactionStore, connect_db
+from migrations import migrate, SCHEMA_VERSION
+from metrics import METRICS, profile_run
+from llm_client import LLMClient, LLMError
+from log_config import LOG_FORMATS, configure_logging
+
+logger = logging.getLogger('process_email')
 
 # Load .env from project root (two levels up if your script is in src/)
 ROOT = Path(__file__).resolve().parents[1]  # parent of src
@@ -23,10 +38,22 @@ env_path = ROOT / ".env"
 load_dotenv(dotenv_path=env_path)
 
 # --- API Configuration ---
-# NOTE: The API key is left empty as required. The execution environment will provide it.
-API_KEY = os.getenv("GEMINI_API_KEY", "0")
-GEMINI_MODEL = "gemini-2.0-flash"
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={API_KEY}"
+# Model, key, timeouts and retries come from config/model_config.yaml (see llm_client.py).
+# GEMINI_API_URL may point somewhere else, e.g. the offline stub in benchmarks/stub_gemini.py
+
+# --- Batch Categorization Configuration ---
+# Uncached transactions are packed into one request until either limit is hit.
+LLM_BATCH_MAX_ITEMS = 50
+LLM_BATCH_TOKEN_BUDGET = 3000  # approximate input tokens for the transaction list
+LLM_BATCH_TOKENS_PER_ANSWER = 24  # output cap per transaction: {"index": N, "category": "..."}
+BATCH_INSTRUCTIONS = """
+Batch mode: the input contains several <Transaction index="N"> records. Categorize each one independently using the rules above.
+Respond ONLY with a JSON array containing one object per transaction: [{"index": N, "category": "<category>"}]. Use the exact category strings from the list above.
+"""
+# Shared by every categorization thread (and every user in --all-users mode) so the
+# whole run respects one Gemini quota and reuses one keep-alive connection pool.
+LLM_LIMITER = RateLimiter()
+LLM_CLIENT = LLMClient()
 
 # --- 1. Configuration ---
 # Set the desired scope to read email metadata (read-only)
@@ -43,313 +70,649 @@ USER_MAP = {
 }
 
 DB_NAME = 'chatmate_transactions.db'
-CAPITALONE_SENDER = 'capitalone@notification.capitalone.com'
-CAPITALONE_SUBJECT = 'A new transaction was charged to your account'
+# Sender/subject -> extractor registry, loaded from config/config.yaml (patterns compiled once)
+PARSERS = load_parsers()
+# Gmail format for message bodies: 'full' walks the JSON parts, 'raw' is parsed with the
+# stdlib email parser (see benchmarks/bench_mime_decode.py for the trade-off)
+BODY_FORMAT = 'full'
 # --- Existing Authentication Functions (Unchanged) ---
 def get_token_filepath(user_id):
     """Generates a token filename specific to the user (e.g., token_leila.json)."""
     return f"token_{user_id}.json"
 
-def get_gmail_service(user_id):
+# Built Gmail services by user ID, so repeated lookups in one process reuse them
+_GMAIL_SERVICES = {}
+
+
+@lru_cache(maxsize=None)
+def gmail_discovery_document():
+    """
+    The Gmail v1 discovery document, read from the copy bundled with
+    googleapiclient (no discovery fetch over the network) and parsed once per process.
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+    return json.loads(get_static_doc('gmail', 'v1'))
+
+
+def build_gmail_service(credentials=None, http=None):
+    """Builds a Gmail client from the cached discovery document."""
+    from googleapiclient.discovery import build_from_document
+    return build_from_document(gmail_discovery_document(), credentials=credentials, http=http)
+
+
+def load_credentials(user_id):
     """
     Handles the authentication flow for a specific user.
+    Returns the credentials, or None if authentication failed.
     """
     token_filepath = get_token_filepath(user_id)
     creds = None
     
     # 1. Check for existing token (user-specific token file)
     if os.path.exists(token_filepath):
-        print(f"Loading credentials from {token_filepath}...")
+        logger.info("Loading credentials from %s...", token_filepath)
         try:
             with open(token_filepath, 'rb') as token:
                 creds = pickle.load(token)
         except Exception as e:
-            print(f"Error loading {token_filepath}: {e}. Will re-authenticate.")
+            logger.warning("Error loading %s: %s. Will re-authenticate.", token_filepath, e)
             creds = None
     
     # 2. Refresh or create new token
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            print("Credentials expired. Attempting to refresh token...")
+            logger.info("Credentials expired. Attempting to refresh token...")
             try:
+                from google.auth.transport.requests import Request
                 creds.refresh(Request())
             except Exception as e:
-                print(f"Token refresh failed: {e}. Starting full OAuth flow.")
+                logger.warning("Token refresh failed: %s. Starting full OAuth flow.", e)
                 creds = None
         
         if not creds:
-            print(f"Starting new OAuth authentication flow for {user_id} (browser will open)...")
+            logger.info("Starting new OAuth authentication flow for %s (browser will open)...", user_id)
             try:
+                from google_auth_oauthlib.flow import InstalledAppFlow
                 flow = InstalledAppFlow.from_client_secrets_file(
                     CREDENTIALS_FILE, SCOPES)
                 # This opens the browser for the user to log into their Gmail account
                 creds = flow.run_local_server(port=0)
             except FileNotFoundError:
-                print(f"\n--- FATAL ERROR: Credentials file '{CREDENTIALS_FILE}' not found. ---")
+                logger.critical("Credentials file '%s' not found.", CREDENTIALS_FILE)
                 return None
             except Exception as e:
-                print("\n--- FATAL ERROR: OAuth flow failed. Check credentials or network. ---")
-                print(f"Details: {e}")
+                logger.critical("OAuth flow failed. Check credentials or network. Details: %s", e)
                 return None
 
         # 3. Save the new/refreshed token for next time
-        print(f"Authentication successful. Saving credentials to {token_filepath}...")
+        logger.info("Authentication successful. Saving credentials to %s...", token_filepath)
         with open(token_filepath, 'wb') as token:
             pickle.dump(creds, token)
 
-    # 4. Build and return the service object
-    return build('gmail', 'v1', credentials=creds)
+    return creds
+
+
+def get_gmail_service(user_id):
+    """
+    Returns an authenticated Gmail service for a user, building it on first use.
+    """
+    service = _GMAIL_SERVICES.get(user_id)
+    if service is None:
+        creds = load_credentials(user_id)
+        if not creds:
+            return None
+        service = _GMAIL_SERVICES[user_id] = build_gmail_service(credentials=creds)
+    return service
 
 
 # --- NEW: Database Functions (Updated) ---
 
 def initialize_db():
-    """Initializes the SQLite database and creates the transactions table, including the new 'category' column."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_pk INTEGER NOT NULL,
-            bank TEXT NOT NULL,
-            date TEXT NOT NULL,
-            vendor TEXT NOT NULL,
-            dollar_amount TEXT NOT NULL,
-            category TEXT NOT NULL, -- NEW COLUMN
-            UNIQUE(user_pk, date, vendor, dollar_amount) 
-            -- Adds a basic constraint to prevent duplicate entries
-        )
-    """)
-    conn.commit()
-    conn.close()
-    print(f"Database '{DB_NAME}' initialized. Table now includes 'category'.")
-
-def save_transaction(transaction_data):
-    """Saves a single extracted transaction to the database, including the category."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    """Initializes the SQLite database and brings the schema up to date via the migration runner."""
+    conn = connect_db(DB_NAME)
     try:
-        cursor.execute("""
-            INSERT INTO transactions (user_pk, bank, date, vendor, dollar_amount, category)
-            VALUES (?, ?, ?, ?, ?, ?) -- Updated to include category
-        """, (
-            transaction_data['user_pk'],
-            transaction_data['bank'],
-            transaction_data['date'],
-            transaction_data['vendor'],
-            transaction_data['dollar_amount'],
-            transaction_data['category'] # New value
-        ))
-        conn.commit()
-        print(f"-> SAVED: {transaction_data['bank']} transaction for ${transaction_data['dollar_amount']} at {transaction_data['vendor']} (Category: {transaction_data['category']})")
-    except sqlite3.IntegrityError:
-        # This catches the UNIQUE constraint violation (duplicate transaction)
-        print(f"-> SKIPPED: Duplicate transaction found for {transaction_data['vendor']} on {transaction_data['date']}")
-    except Exception as e:
-        print(f"-> ERROR saving transaction: {e}")
+        migrate(conn)
     finally:
         conn.close()
+    logger.info("Database '%s' initialized (schema version %d).", DB_NAME, SCHEMA_VERSION)
 
 
 # --- Existing Email Parsing Helpers (Unchanged) ---
 
-def get_plain_text_body(msg_part):
-    """
-    Extracts the plain text body from a Gmail API message payload.
-    It iterates through parts and handles MIME decoding.
-    """
-    if 'parts' in msg_part.get('payload', {}):
-        for part in msg_part['payload']['parts']:
-            # Recursively check for content in sub-parts (common for multipart/alternative)
-            result = get_plain_text_body(part)
-            if result:
-                return result
-    
-    # Check for text/plain mimeType
-    if msg_part['mimeType'] == 'text/plain' and 'data' in msg_part['body']:
-        data = msg_part['body']['data']
-        # Decode base64 URL safe, then decode bytes to string
-        return base64.urlsafe_b64decode(data).decode('utf-8')
-        
-    return None
-
-# --- Existing Transaction Extraction Logic (Capital One) (Unchanged) ---
+# --- Transaction Extraction Logic (config-driven parsers) ---
 
 def extract_capitalone_transaction(plain_text, user_pk):
     """
     Uses regex to extract date, vendor, and amount from the Capital One text.
+    The pattern lives in config.yaml under email_search.parsers.capital_one.
     """
-    # Regex pattern to capture the required fields
-    # Group 1: Date (e.g., November 21, 2025)
-    # Group 2: Vendor (e.g., SUNPASS). We stop before the comma after the vendor.
-    # Group 3: Amount (e.g., 10.00)
-    pattern = re.compile(
-        r'notifying you that on\s+(.+?), at\s+(.+?),.*?amount of \$(\d+\.\d{2})',
-        re.IGNORECASE | re.DOTALL
-    )
-    
-    match = pattern.search(plain_text)
-    
-    if match:
-        # Clean up vendor name (get everything before the comma, then strip whitespace)
-        vendor_raw = match.group(2).strip()
-        vendor = vendor_raw.split(',')[0].strip()
-        
-        transaction = {
-            'user_pk': user_pk,
-            'bank': 'capital_one',
-            'date': match.group(1).strip(),
-            'vendor': vendor,
-            'dollar_amount': match.group(3).strip()
-            # Category will be added by get_transaction_category()
-        }
-        return transaction
-    
-    return None
+    return PARSERS.by_bank['capital_one'].extract(plain_text, user_pk)
+
+# --- NEW: Batched Gemini Categorization ---
+
+_CATEGORY_LOOKUP = {category.lower(): category for category in CATEGORIES}
 
-# --- NEW: Gemini Categorization Function ---
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token), good enough for budgeting batches."""
+    return len(text) // 4 + 1
 
-def get_transaction_category(transaction:dict):
+def format_batch_transaction(index, transaction:dict):
+    # 'recurring' is the categorizer's hint from the user's history (CategoryCache.recurring_hint)
+    recurring = f"\nRecurring: {transaction['recurring']}" if transaction.get('recurring') else ""
+    return (
+        f"<Transaction index=\"{index}\">Merchant: {transaction['vendor']}\n"
+        f"Amount: ${transaction['dollar_amount']}\nDate: {transaction['date']}{recurring}</Transaction>"
+    )
+
+def pack_transaction_batches(transactions, max_items=LLM_BATCH_MAX_ITEMS, token_budget=LLM_BATCH_TOKEN_BUDGET):
+    """Groups (index, transaction) pairs into batches that fit the item and token limits."""
+    batch, batch_tokens = [], 0
+    for index, transaction in transactions:
+        tokens = estimate_tokens(format_batch_transaction(index, transaction))
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > token_budget):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((index, transaction))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def parse_batch_response(text):
     """
-    Calls the Gemini API to categorize a transaction based on the detailed rules.
-    Implements exponential backoff for retries.
+    Parses the model's JSON answer into {index: category}, keeping only answers
+    that name a category from the prompt's list.
     """
-    max_retries = 5
-    initial_delay = 1 # seconds
+    try:
+        answers = json.loads(text)
+    except json.JSONDecodeError:
+        return {}
 
-    content = f"<Transaction>Merchant: {transaction['vendor']}\nAmount: ${transaction['dollar_amount']}\nDate: {transaction['date']}</Transaction>"
+    if isinstance(answers, dict):
+        answers = [{'index': key, 'category': value} for key, value in answers.items()]
+    if not isinstance(answers, list):
+        return {}
 
-    # Construct the payload
-    payload = {
-        "contents": [{ "parts": [{ "text": content }] }],
-        "systemInstruction": { "parts": [{ "text": SYSTEM_PROMPT }] },
-        # We only expect a string response, no need for grounding or tools.
-    }
+    parsed = {}
+    for answer in answers:
+        try:
+            index = int(answer['index'])
+            category = _CATEGORY_LOOKUP.get(str(answer['category']).strip().lower())
+        except (KeyError, TypeError, ValueError):
+            continue
+        if category:
+            parsed[index] = category
+    return parsed
+
+def request_batch_categories(transactions:list, limiter:RateLimiter=None, errors:dict=None):
+    """
+    Categorizes many transactions with as few Gemini requests as possible.
+    Each request carries up to LLM_BATCH_MAX_ITEMS transactions within the token
+    budget and asks for a JSON array keyed by index. Failed requests, and answers
+    outside the category list (or missing ones), are re-sent in the next round,
+    up to the model config's max_retries.
+    Requests go through the shared rate limiter: 429/5xx responses pause it (honoring
+    Retry-After) and shrink concurrency, instead of each caller sleeping on its own.
+
+    Args:
+        errors: Optional dict; filled with {index: reason} for every transaction left without a category.
+
+    Returns:
+        A list aligned with `transactions`: the category, or None if it could not be determined.
+    """
+    max_retries = LLM_CLIENT.max_retries + 1
+    timeout = LLM_CLIENT.config.get('batch_timeout_seconds', 30)
+    limiter = limiter or LLM_LIMITER
+
+    results = [None] * len(transactions)
+    reasons = {}
+    remaining = list(enumerate(transactions))
+    system_text = SYSTEM_PROMPT + BATCH_INSTRUCTIONS
 
     for attempt in range(max_retries):
-        try:
-            response = requests.post(
-                GEMINI_API_URL, 
-                headers={'Content-Type': 'application/json'},
-                json=payload,
-                timeout=10
-            )
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            result = response.json()
-            
-            # Extract and clean the category string
-            category = result['candidates'][0]['content']['parts'][0]['text'].strip()
-            
-            return category
-
-        except requests.exceptions.RequestException as e:
-            # Handle connection errors, timeouts, and HTTP errors
-            if attempt < max_retries - 1:
-                delay = initial_delay * (2 ** attempt)
-                print(f" API Error (Attempt {attempt + 1}/{max_retries}): {e}. Retrying in {delay:.1f}s...")
-                time.sleep(delay)
-            else:
-                print(f" API Error: Maximum retries reached. Returning 'Merchandise'. Error: {e}")
-                return "Merchandise" # Fallback category
+        failed = []
+        for batch in pack_transaction_batches(remaining):
+            content = "<Transactions>\n" + "\n".join(
+                format_batch_transaction(index, transaction) for index, transaction in batch
+            ) + "\n</Transactions>"
+
+            try:
+                # One attempt per round: the rounds are the retries, re-packing whatever is left
+                text = LLM_CLIENT.generate(
+                    content,
+                    system=system_text,
+                    max_tokens=LLM_BATCH_TOKENS_PER_ANSWER * len(batch),
+                    json_response=True,
+                    timeout=timeout,
+                    limiter=limiter,
+                    max_retries=0
+                )
+            except LLMError as e:
+                logger.warning("Batch API Error (Attempt %d/%d) for %d transactions: %s",
+                               attempt + 1, max_retries, len(batch), e,
+                               extra={'status': e.status, 'transactions': len(batch)})
+                failed.extend(batch)
+                reasons.update((index, str(e)) for index, _transaction in batch)
+                continue
+
+            answers = parse_batch_response(text)
+            for index, transaction in batch:
+                if index in answers:
+                    results[index] = answers[index]
+                else:
+                    failed.append((index, transaction))
+                    reasons[index] = "answer missing or not in the category list"
 
-    return "Merchandise" # Should be unreachable if max_retries > 0
+        if not failed:
+            break
+
+        remaining = failed
+        if attempt == max_retries - 1:
+            logger.error("Batch API: giving up on %d transactions after %d attempts.", len(failed), max_retries)
+        else:
+            METRICS.inc('llm_retries_total', len(failed))
+
+    if errors is not None:
+        errors.update((index, reasons[index]) for index, result in enumerate(results) if result is None)
+    return results
+
+def categorize_transactions(transactions:list, cache:CategoryCache, use_llm=True,
+                            fallback="Merchandise", errors:dict=None):
+    """
+    Categorizes a list of transactions. Local merchant override rules are applied
+    first, then the merchant cache, then the closest already-categorized vendor
+    (if similar enough); the remaining transactions are deduplicated by cache key
+    and sent to Gemini in batches, flagged when they match one of the user's
+    recurring charges. Fallback answers are not cached.
+
+    Args:
+        use_llm: False answers only from the local sources and leaves the rest None
+            (ingestion queues those for category_worker.py).
+        fallback: Category for transactions Gemini could not answer; None leaves them None.
+        errors: Optional dict; filled with {index: reason} for transactions Gemini could not answer.
+
+    Returns:
+        A list of categories aligned with `transactions`.
+    """
+    categories = [None] * len(transactions)
+    uncached = {}  # cache key -> indexes of transactions sharing it
+    sources = Counter()
+
+    for i, transaction in enumerate(transactions):
+        category = match_rule_category(transaction)
+        if category is not None:
+            sources['rule'] += 1
+        else:
+            category = cache.get(transaction)
+            if category is not None:
+                sources['cache'] += 1
+            elif (match := cache.similar(transaction)) is not None:
+                category, confidence, matched = match
+                sources['similar'] += 1
+                logger.info("-> SIMILAR: '%s' categorized like '%s' (%s, confidence %.2f)",
+                            transaction['vendor'], matched, category, confidence,
+                            extra={'vendor': transaction['vendor'], 'matched': matched, 'confidence': confidence})
+            else:
+                uncached.setdefault(cache_key(transaction), []).append(i)
+        categories[i] = category
+
+    if uncached and not use_llm:
+        sources['queued'] += sum(map(len, uncached.values()))
+    elif uncached:
+        representatives = []
+        for indexes in uncached.values():
+            transaction = transactions[indexes[0]]
+            hint = cache.recurring_hint(transaction)
+            representatives.append(dict(transaction, recurring=hint) if hint else transaction)
+        reasons = {}
+        answers = request_batch_categories(representatives, errors=reasons)
+        for position, (transaction, indexes, category) in enumerate(zip(representatives, uncached.values(), answers)):
+            if category is None:
+                category = fallback
+                sources['fallback' if fallback else 'unanswered'] += len(indexes)
+                if errors is not None:
+                    errors.update((i, reasons.get(position, "no answer")) for i in indexes)
+            else:
+                cache.put(transaction, category)
+                sources['llm'] += len(indexes)
+            for i in indexes:
+                categories[i] = category
+
+    for source, count in sources.items():
+        METRICS.inc('category_lookups_total', count, source=source)
+    return categories
+
+def extract_message_transaction(message_id, full_msg, user_pk, parser):
+    """Parse stage: body decoding + extraction with the parser that claimed the message."""
+    if parser is None:
+        # Matched the search but no registered parser claims its headers; only the ledger cares
+        return None
+
+    # 1. Extract the body text (text/plain preferred, HTML converted as a fallback)
+    with METRICS.stage('decode'):
+        if 'mime' in full_msg:
+            # Already-decoded RFC 822 bytes (mbox import)
+            plain_text = get_mime_text(full_msg['mime'])
+        elif 'raw' in full_msg:
+            plain_text = get_raw_message_text(full_msg)
+        else:
+            plain_text = get_message_text(full_msg)
+    if not plain_text:
+        METRICS.inc('extraction_failures_total', reason='no_body')
+        logger.warning("Could not find plain text body for message ID %s.", message_id,
+                       extra={'message_id': message_id, 'bank': parser.bank})
+        return None
+
+    # 2. Extract the transaction data
+    with METRICS.stage('extract'):
+        transaction = parser.extract(plain_text, user_pk, full_msg)
+    if not transaction:
+        METRICS.inc('extraction_failures_total', reason='no_match')
+        logger.warning("Could not extract data from message ID %s. Text content not matched.", message_id,
+                       extra={'message_id': message_id, 'bank': parser.bank})
+    return transaction
 
 # --- Refactored Main Processor (Updated) ---
 
-def process_user_inbox(service, user_pk):
+def ingest_messages(messages, user_pk, ledger, cache, store,
+                    parse_workers=PARSE_WORKERS, categorize_workers=CATEGORIZE_WORKERS):
     """
-    Searches the user's inbox for Capital One transaction emails, extracts data, 
-    categorizes it using Gemini, and saves it to the database.
+    Runs routed (message_id, message, parser) items through extraction,
+    categorization and the DB writer, recording each one in the sync ledger.
+    Shared by the Gmail sync (process_user_inbox) and the mbox import.
+    Only local answers (rules, cache, similar vendors) are applied here; the rest
+    are saved as PENDING_CATEGORY and queued for category_worker.py.
+
+    Returns:
+        Number of messages processed.
+    """
+    processed = 0
+
+    def parse(item):
+        message_id, full_msg, parser = item
+        transaction = extract_message_transaction(message_id, full_msg, user_pk, parser)
+        # The writer only needs the ID and date; don't hold bodies in the reorder buffer
+        full_msg.pop('mime', None)
+        full_msg.pop('raw', None)
+        return transaction
+
+    def write(item, transaction, category):
+        nonlocal processed
+        message_id, full_msg, _parser = item
+        processed += 1
+        METRICS.inc('messages_processed_total')
+        if transaction:
+            # 3. Buffer the row for the next bulk write to SQLite
+            transaction['category'] = category
+            store.add(transaction)
+
+        # Record the message so later runs never download or categorize it again.
+        # Writes arrive in order, so once the store is flushed everything marked so far is saved.
+        ledger.mark_processed(message_id, full_msg.get('internalDate'))
+        if processed % store.flush_size == 0:
+            store.flush()
+            ledger.flush()
+
+    run_pipeline(
+        messages,
+        parse,
+        METRICS.timed('categorize')(lambda transactions: [
+            category or PENDING_CATEGORY for category in categorize_transactions(transactions, cache, use_llm=False)
+        ]),
+        write,
+        parse_workers=parse_workers,
+        categorize_workers=categorize_workers,
+        batch_size=LLM_BATCH_MAX_ITEMS
+    )
+    store.flush()
+    return processed
+
+
+def process_user_inbox(service, user_pk, batch_size=BATCH_SIZE, cache=None, store=None,
+                       parse_workers=PARSE_WORKERS, categorize_workers=CATEGORIZE_WORKERS,
+                       body_format=BODY_FORMAT):
+    """
+    Searches the user's inbox for transaction emails from every configured sender
+    (one combined query), routes each message to its parser from the headers,
+    extracts data, categorizes it using Gemini, and saves it to the database.
+    Only mail that arrived since the last run is touched: the sync ledger
+    short-circuits via historyId and skips message IDs already processed.
+    Fetching, parsing and categorization run as concurrent pipeline stages; saving
+    stays on this thread, in message order.
     
     Args:
         service: Authorized Gmail API service object.
         user_pk: The integer primary key for the user in the database.
+        batch_size: Number of messages fetched per Gmail batch request.
+        cache: Shared CategoryCache; one is opened (and closed) for this run if omitted.
+        store: Shared TransactionStore; one is opened (and closed) for this run if omitted.
+        parse_workers: Threads decoding and extracting message bodies.
+        categorize_workers: Threads issuing batched categorization requests.
+        body_format: 'full' (JSON payload tree) or 'raw' (RFC 822 bytes, parsed locally).
+
+    Returns:
+        Number of messages processed, or None if the run could not complete (an API
+        error, or messages that could not be fetched).
     """
     if not service:
-        print("Cannot access Gmail service. Aborting processing.")
-        return
+        logger.error("Cannot access Gmail service. Aborting processing.")
+        return None
+
+    ledger = SyncLedger(DB_NAME, user_pk)
+    owns_cache = cache is None
+    owns_store = store is None
 
     try:
-        print("\n--- Searching for Capital One Transaction Emails ---")
+        if ledger.history_id:
+            has_new, history_id = check_for_new_messages(service, ledger.history_id)
+            if not has_new:
+                logger.info("Mailbox unchanged since last sync for user PK %d. Nothing to do.", user_pk, extra={'user_pk': user_pk})
+                ledger.finish(history_id)
+                return 0
+
+        # Only a run with work to do opens the category cache and transaction store
+        if owns_cache:
+            cache = CategoryCache(DB_NAME, SYSTEM_PROMPT)
+        if owns_store:
+            store = TransactionStore(DB_NAME)
+
+        # Capture the mailbox position before listing so mail arriving mid-run is picked up next time
+        current_history_id = get_current_history_id(service)
+
+        logger.info("--- Searching for Transaction Emails (%s) ---", ', '.join(PARSERS.by_bank), extra={'user_pk': user_pk})
         
-        # Construct the Gmail API query string
-        query = (
-            f"from:{CAPITALONE_SENDER} subject:\"{CAPITALONE_SUBJECT}\""
-        )
+        # One Gmail query across every registered sender/subject
+        query = ledger.query_with_watermark(PARSERS.query())
         
-        # List messages matching the query
-        results = service.users().messages().list(
-            userId='me', 
-            q=query
-        ).execute()
-        
-        message_ids = results.get('messages', [])
-        
-        if not message_ids:
-            print(f'No new Capital One transaction emails found for user PK {user_pk}.')
-            return
+        # Stream every page of matching messages (headers first, full bodies only for
+        # messages a parser claims) and categorize extracted transactions in batches
+        failed = set()
+        processed = ingest_messages(
+            iter_routed_messages(
+                service, query, PARSERS.match, METADATA_HEADERS,
+                batch_size=batch_size, exclude=ledger.is_processed, body_format=body_format, failed=failed
+            ),
+            user_pk, ledger, cache, store,
+            parse_workers=parse_workers,
+            categorize_workers=categorize_workers
+        )
+        if failed:
+            # Same as an API error: keep what was saved, but leave the historyId and
+            # watermark alone so the next run lists the dropped messages again
+            logger.error("Could not fetch %d messages for user PK %d; they will be retried next run.",
+                         len(failed), user_pk, extra={'user_pk': user_pk, 'messages': len(failed)})
+            ledger.flush()
+            return None
+        ledger.finish(current_history_id)
+
+        if not processed:
+            logger.info("No new transaction emails found for user PK %d.", user_pk, extra={'user_pk': user_pk})
+        else:
+            logger.info("Processed %d matching emails.", processed, extra={'user_pk': user_pk, 'messages': processed})
+            logger.info(store.report())
+            logger.info(cache.report())
+        return processed
+                
+    except HttpError as error:
+        logger.error("An API error occurred during processing: %s", error, extra={'user_pk': user_pk})
+        # Keep what was saved, but not the historyId or watermark: the listing is newest
+        # first, so older mail not reached yet must stay in the next run's query
+        if store is not None:
+            store.flush()
+        ledger.flush()
+        return None
+    finally:
+        ledger.close()
+        if owns_cache and cache is not None:
+            cache.close()
+        if owns_store and store is not None:
+            store.close()
+
+
+# --- Multi-User Runs ---
+
+def process_users(user_ids):
+    """
+    Processes several USER_MAP accounts concurrently in one process.
+    Each user gets their own authenticated Gmail service (authenticated up front,
+    one at a time, since the OAuth flow may open a browser), while all users share
+    the categorization cache, the Gemini session and rate limiter, and one DB writer.
+    Prints a per-user summary of timing and counts at the end.
+    """
+    services = {}
+    for user_id in user_ids:
+        logger.info("--- Authenticating user: %s (PK: %d) ---", user_id, USER_MAP[user_id])
+        with METRICS.stage('auth'):
+            services[user_id] = get_gmail_service(user_id)
+
+    cache = CategoryCache(DB_NAME, SYSTEM_PROMPT)
+    store = TransactionStore(DB_NAME)
 
-        print(f"Found {len(message_ids)} matching emails. Processing...")
+    def run_user(user_id):
+        start = time.perf_counter()
+        try:
+            processed = process_user_inbox(services[user_id], USER_MAP[user_id], cache=cache, store=store)
+        except Exception as e:
+            logger.exception("ERROR processing user %s: %s", user_id, e, extra={'user': user_id})
+            processed = None
+        return processed, time.perf_counter() - start
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=len(user_ids)) as executor:
+            results = dict(zip(user_ids, executor.map(run_user, user_ids)))
+    finally:
+        store.flush()
+        cache.close()
+        store.close()
+    elapsed = time.perf_counter() - started
+
+    lines = [f"{'User':<10} {'Status':<8} {'Messages':>9} {'Saved':>7} {'Dupes':>7} {'Seconds':>8}"]
+    for user_id in user_ids:
+        processed, seconds = results[user_id]
+        saved, skipped = store.user_counts(USER_MAP[user_id])
+        status = 'ok' if processed is not None else 'failed'
+        lines.append(f"{user_id:<10} {status:<8} {processed or 0:>9} {saved:>7} {skipped:>7} {seconds:>8.1f}")
+        logger.debug("User summary", extra={'user': user_id, 'status': status, 'messages': processed or 0,
+                                            'saved': saved, 'duplicates': skipped, 'seconds': round(seconds, 3)})
+    logger.info("--- Household Summary ---\n%s", '\n'.join(lines))
+    logger.info(cache.report())
+    logger.info("Total wall time: %.1fs", elapsed, extra={'seconds': round(elapsed, 3)})
+
+
+def run_users(user_ids, categorize=True, backfill=None):
+    """
+    Runs one user directly, or several concurrently via process_users(), then
+    categorizes what ingestion queued (unless `categorize` is False, leaving it
+    to category_worker.py). With `backfill` (keyword arguments for
+    backfill.backfill_user_inbox), each user's mailbox is instead imported in
+    parallel date windows, one user at a time.
+    """
+    initialize_db()
+
+    if backfill is not None:
+        from backfill import backfill_user_inbox
+        for user_id in user_ids:
+            logger.info("--- Backfilling user: %s (PK: %d) ---", user_id, USER_MAP[user_id])
+            with METRICS.stage('auth'):
+                creds = load_credentials(user_id)
+            if creds:
+                backfill_user_inbox(lambda creds=creds: build_gmail_service(credentials=creds), USER_MAP[user_id],
+                                    **backfill)
+    elif len(user_ids) > 1:
+        process_users(user_ids)
+    else:
+        user_id = user_ids[0]
+        user_pk = USER_MAP[user_id]
+        logger.info("--- Running script for user: %s (PK: %d) ---", user_id, user_pk)
         
+        # 2. Get the authenticated service object
+        with METRICS.stage('auth'):
+            gmail_service = get_gmail_service(user_id)
         
-        for i, message_id_obj in enumerate(message_ids):
-            message_id = message_id_obj['id']
-            
-            # Fetch the full message content
-            full_msg = service.users().messages().get(
-                userId='me', 
-                id=message_id, 
-                format='full' 
-            ).execute()
-            
-            # 1. Extract the plain text body
-            plain_text = get_plain_text_body(full_msg)
-            
-            if plain_text:
-                # 2. Extract the transaction data
-                transaction = extract_capitalone_transaction(plain_text, user_pk)
-                
-                if transaction:
-                    # --- NEW STEP: Categorize the transaction using Gemini ---
-                    category = get_transaction_category(transaction)
-                    transaction['category'] = category
-                    
-                    # 3. Save the data to SQLite
-                    save_transaction(transaction)
+        # 3. Process the inbox
+        if gmail_service:
+            process_user_inbox(gmail_service, user_pk)
 
-                else:
-                    print(f"Warning: Could not extract data from message ID {message_id}. Text content not matched.")
-            else:
-                print(f"Warning: Could not find plain text body for message ID {message_id}.")
-                
-    except HttpError as error:
-        print(f'An API error occurred during processing: {error}')
+    if categorize:
+        from category_worker import drain
+        drain(DB_NAME)
 
 
 if __name__ == '__main__':
     # --- 1. Initialization and User Check ---
-    initialize_db()
-    
-    if len(sys.argv) < 2:
-        print("\nUSAGE ERROR: You must specify a user ID (e.g., 'leila', 'brother', 'sister').")
-        print("Example: poetry run python basic_gmail_access.py leila")
+    parser = argparse.ArgumentParser(description="Import bank transaction alerts from Gmail into the CashMate database.")
+    parser.add_argument('users', nargs='*', help="One or more user IDs from USER_MAP (e.g. 'leila', 'brother', 'sister').")
+    parser.add_argument('--all-users', action='store_true', help="Process every account in USER_MAP concurrently.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-format', default='text', choices=LOG_FORMATS, help="'json' emits one object per line.")
+    parser.add_argument('--metrics-json', metavar='PATH', help="Write the run's metrics summary as JSON.")
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help="Write metrics in Prometheus text format (e.g. into node_exporter's textfile directory).")
+    parser.add_argument('--profile', nargs='?', type=int, const=25, metavar='TOP',
+                        help="Run under cProfile and log the TOP hottest functions (default 25).")
+    parser.add_argument('--defer-categorization', action='store_true',
+                        help="Only queue new transactions for Gemini; category_worker.py categorizes them.")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Import the whole mailbox in parallel date windows (resumes an interrupted backfill).")
+    parser.add_argument('--since', metavar='YYYY-MM-DD', help="--backfill: first day to import (default: 2004-04-01).")
+    parser.add_argument('--backfill-workers', type=int, metavar='N', help="--backfill: windows fetched at once.")
+    parser.add_argument('--restart-backfill', action='store_true',
+                        help="--backfill: re-plan the windows instead of resuming the saved plan.")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    user_ids = list(USER_MAP) if args.all_users else args.users
+    if not user_ids:
+        logger.error("USAGE ERROR: You must specify a user ID (e.g., 'leila', 'brother', 'sister') or --all-users.")
+        logger.error("Example: poetry run python process_email.py leila")
         sys.exit(1)
-        
-    user_id = sys.argv[1]
-    
-    if user_id not in USER_MAP:
-        print(f"\nERROR: User ID '{user_id}' is not mapped to a database primary key. Add it to USER_MAP.")
+
+    unknown = [user_id for user_id in user_ids if user_id not in USER_MAP]
+    if unknown:
+        logger.error("User ID(s) %s not mapped to a database primary key. Add them to USER_MAP.", ', '.join(unknown))
         sys.exit(1)
-        
-    user_pk = USER_MAP[user_id]
-    print(f"\n--- Running script for user: {user_id} (PK: {user_pk}) ---")
-    
-    # 2. Get the authenticated service object
-    gmail_service = get_gmail_service(user_id)
-    
-    # 3. Process the inbox
-    if gmail_service:
-        process_user_inbox(gmail_service, user_pk)
 
-    print("\nScript finished.")
\ No newline at end of file
+    backfill = None
+    if args.backfill:
+        backfill = {'restart': args.restart_backfill}
+        if args.since:
+            backfill['since'] = args.since
+        if args.backfill_workers:
+            backfill['workers'] = args.backfill_workers
+
+    METRICS.reset()
+    try:
+        if args.profile:
+            profile_run(lambda: run_users(user_ids, not args.defer_categorization, backfill), top=args.profile)
+        else:
+            run_users(user_ids, not args.defer_categorization, backfill)
+    finally:
+        logger.info("--- Run Metrics ---\n%s", METRICS.format_summary())
+        if args.metrics_json:
+            METRICS.write_json(args.metrics_json)
+            logger.info("Metrics written to %s", args.metrics_json)
+        if args.metrics_prom:
+            METRICS.write_prometheus(args.metrics_prom)
+            logger.info("Metrics written to %s", args.metrics_prom)
+
+    logger.info("Script finished.")
@@ -0,0 +1,312 @@
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+from category_rules import canonical_vendor
+from rollups import format_cents
+
+# --- Recurring Charge Detection ---
+# A user's history is loaded once into columnar arrays (epoch days, integer cents,
+# vendor codes) and every statistic is computed with sort + group-by array
+# operations, so hundreds of thousands of rows take well under a second.
+# Results are cached per database and user until any of the user's rows changes.
+
+# (name, nominal days, tolerance in days) for each cadence we recognize
+PERIODS = (
+    ('weekly', 7, 1),
+    ('biweekly', 14, 2),
+    ('monthly', 30, 3),
+    ('quarterly', 91, 7),
+    ('yearly', 365, 14),
+)
+MIN_OCCURRENCES = 3       # charges needed before a cadence counts
+MIN_REGULARITY = 0.75     # share of intervals within the period's tolerance
+MIN_AMOUNT_STABILITY = 0.5  # share of consecutive charges within AMOUNT_TOLERANCE
+FIXED_AMOUNT_STABILITY = 0.75  # at or above this the amount is "fixed" (price changes are reported)
+AMOUNT_TOLERANCE = 0.10   # relative change between consecutive charges still counted as the same amount
+
+# Only ISO-dated rows are analysed (the v2 migration may keep unparseable dates as-is)
+_ISO_DATE = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+_PERIOD_NAMES = [name for name, _days, _tolerance in PERIODS]
+_PERIOD_DAYS = np.array([days for _name, days, _tolerance in PERIODS])
+_PERIOD_TOLERANCE = np.array([tolerance for _name, _days, tolerance in PERIODS])
+
+_canonical_names = {}  # descriptor -> canonical_vendor(), kept for the life of the process
+_cache = {}  # (database path, user_pk) -> (history version, as_of day, charges)
+_cache_lock = threading.Lock()
+
+
+def epoch_day(iso_date):
+    """Days since 1970-01-01 for a YYYY-MM-DD string."""
+    return int(np.datetime64(iso_date, 'D').astype(np.int64))
+
+
+def iso_date(day):
+    """YYYY-MM-DD for an epoch day."""
+    return str(np.datetime64(int(day), 'D'))
+
+
+class TransactionHistory:
+    """
+    One user's transactions as parallel NumPy columns: `days` (epoch days),
+    `cents` (amount_cents), `descriptor_codes` (index into `descriptors`, the raw
+    vendor strings) and `vendor_codes` (index into `vendors`, their canonical names).
+    """
+
+    def __init__(self, days, cents, descriptor_codes, descriptors, vendor_codes, vendors):
+        self.days = days
+        self.cents = cents
+        self.descriptor_codes = descriptor_codes
+        self.descriptors = descriptors
+        self.vendor_codes = vendor_codes
+        self.vendors = vendors
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def load(cls, conn, user_pk):
+        """
+        Reads the user's ISO-dated transactions in one query, one row per vendor
+        string: its charges come back as a single "day,cents,day,cents,..."
+        string, so each day stays paired with its amount, and NumPy parses them
+        all in one call; building a Python tuple per transaction would cost more
+        than the whole analysis. The full scan (NOT INDEXED) reads the table in
+        rowid order, where walking the (user_pk, date) index costs a random row
+        lookup per transaction.
+        """
+        groups = conn.execute(f"""
+            SELECT vendor, count(*), group_concat(CAST(julianday(date) - 2440587.5 AS INTEGER) || ',' || amount_cents)
+            FROM transactions NOT INDEXED
+            WHERE user_pk = ? AND date GLOB {_ISO_DATE}
+            GROUP BY vendor
+            ORDER BY vendor
+        """, (user_pk,)).fetchall()
+        if not groups:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty, empty, [], empty, [])
+
+        descriptors, counts, charges = zip(*groups)
+        charges = np.fromstring(','.join(charges), dtype=np.int64, sep=',').reshape(-1, 2)
+        descriptor_codes = np.repeat(np.arange(len(descriptors)), counts)
+        # Each distinct descriptor is canonicalized once
+        vendor_of_descriptor, vendors = _codes([_canonical(descriptor) for descriptor in descriptors])
+        return cls(
+            charges[:, 0].copy(),
+            charges[:, 1].copy(),
+            descriptor_codes,
+            list(descriptors),
+            vendor_of_descriptor[descriptor_codes],
+            vendors,
+        )
+
+
+def _canonical(descriptor):
+    name = _canonical_names.get(descriptor)
+    if name is None:
+        name = _canonical_names[descriptor] = canonical_vendor(descriptor)
+    return name
+
+
+def _codes(values):
+    """Dictionary-encodes a list of strings: (int64 codes, distinct values in code order)."""
+    lookup = {value: code for code, value in enumerate(dict.fromkeys(values))}
+    return np.fromiter(map(lookup.__getitem__, values), dtype=np.int64, count=len(values)), list(lookup)
+
+
+def detect_recurring(history, as_of=None):
+    """
+    Recurring charges in a TransactionHistory.
+
+    Charges are grouped by canonical vendor and ordered by date. A group is
+    recurring when it has at least MIN_OCCURRENCES charges, its median interval
+    matches one of PERIODS, at least MIN_REGULARITY of its intervals fall within
+    that period's tolerance and at least MIN_AMOUNT_STABILITY of consecutive
+    charges are within AMOUNT_TOLERANCE of each other.
+
+    Args:
+        as_of: Epoch day the `active` flag is judged against (default: today).
+
+    Returns:
+        List of dicts (vendor, descriptor, period, interval_days, occurrences,
+        amount_cents, average_cents, amount_stability, fixed_amount, regularity,
+        first_date, last_date, next_date, active, price_change), most expensive first.
+        price_change is None or {from_cents, to_cents, date} for the most recent
+        change of a fixed amount. `descriptor` is the latest charge's raw vendor.
+    """
+    if len(history) < MIN_OCCURRENCES:
+        return []
+    if as_of is None:
+        as_of = int(time.time() // 86400)
+
+    # One packed int64 key (vendor in the high bits, day in the low ones) sorts
+    # several times faster than a two-key lexsort
+    order = np.argsort((history.vendor_codes << 32) | (history.days - history.days.min()))
+    vendor = history.vendor_codes[order]
+    days = history.days[order]
+    cents = history.cents[order]
+    descriptor_codes = history.descriptor_codes[order]
+
+    # Group boundaries over the (vendor, day)-sorted rows
+    starts = np.flatnonzero(np.r_[True, vendor[1:] != vendor[:-1]])
+    counts = np.diff(np.r_[starts, len(vendor)])
+    lasts = starts + counts - 1
+    group_count = len(starts)
+    row_group = np.repeat(np.arange(group_count), counts)
+
+    # Consecutive charge pairs inside each group
+    same = vendor[1:] == vendor[:-1]
+    pair_group = row_group[1:][same]
+    gaps = np.diff(days)[same]
+    previous_cents = cents[:-1][same]
+    next_cents = cents[1:][same]
+    pair_position = np.flatnonzero(same) + 1  # row index of each pair's later charge
+    pairs = np.bincount(pair_group, minlength=group_count)
+
+    # Median interval per group: pairs are already grouped, so sort by gap within group
+    sorted_gaps = np.sort((pair_group << 32) | gaps) & 0xFFFFFFFF
+    pair_starts = np.r_[0, np.cumsum(pairs)[:-1]]
+    candidate = counts >= MIN_OCCURRENCES
+    median_gap = np.zeros(group_count, dtype=np.int64)
+    median_gap[candidate] = sorted_gaps[pair_starts[candidate] + pairs[candidate] // 2]
+
+    # Cadence: the first period whose tolerance covers the median interval
+    matches = np.abs(median_gap[:, None] - _PERIOD_DAYS[None, :]) <= _PERIOD_TOLERANCE[None, :]
+    has_period = candidate & matches.any(axis=1)
+    period = matches.argmax(axis=1)
+
+    safe_pairs = np.maximum(pairs, 1)
+    on_time = np.abs(gaps - _PERIOD_DAYS[period][pair_group]) <= _PERIOD_TOLERANCE[period][pair_group]
+    regularity = np.bincount(pair_group, weights=on_time, minlength=group_count) / safe_pairs
+    amount_delta = np.abs(next_cents - previous_cents)
+    steady = amount_delta <= AMOUNT_TOLERANCE * np.abs(previous_cents)
+    stability = np.bincount(pair_group, weights=steady, minlength=group_count) / safe_pairs
+    total_cents = np.bincount(row_group, weights=cents, minlength=group_count)
+
+    # Most recent amount change per group (row index of the first charge at the new amount)
+    changed_group = pair_group[amount_delta != 0]
+    changed_position = pair_position[amount_delta != 0]
+    last_in_group = np.flatnonzero(np.r_[changed_group[1:] != changed_group[:-1], len(changed_group) > 0])
+    last_change = np.full(group_count, -1, dtype=np.int64)
+    last_change[changed_group[last_in_group]] = changed_position[last_in_group]
+
+    recurring = np.flatnonzero(has_period & (regularity >= MIN_REGULARITY) & (stability >= MIN_AMOUNT_STABILITY))
+    charges = []
+    for group in recurring:
+        last = lasts[group]
+        interval = int(median_gap[group])
+        fixed = bool(stability[group] >= FIXED_AMOUNT_STABILITY)
+        change = int(last_change[group])
+        charges.append({
+            'vendor': history.vendors[vendor[last]],
+            'descriptor': history.descriptors[descriptor_codes[last]],
+            'period': _PERIOD_NAMES[period[group]],
+            'interval_days': interval,
+            'occurrences': int(counts[group]),
+            'amount_cents': int(cents[last]),
+            'average_cents': int(round(total_cents[group] / counts[group])),
+            'amount_stability': round(float(stability[group]), 3),
+            'fixed_amount': fixed,
+            'regularity': round(float(regularity[group]), 3),
+            'first_date': iso_date(days[starts[group]]),
+            'last_date': iso_date(days[last]),
+            'next_date': iso_date(days[last] + interval),
+            'active': bool(as_of - days[last] <= interval + _PERIOD_TOLERANCE[period[group]] * 2),
+            'price_change': {
+                'from_cents': int(cents[change - 1]),
+                'to_cents': int(cents[change]),
+                'date': iso_date(days[change]),
+            } if fixed and change >= 0 else None,
+        })
+    charges.sort(key=lambda charge: charge['amount_cents'], reverse=True)
+    return charges
+
+
+def history_version(conn, user_pk):
+    """
+    Changes whenever any of the user's rows is added, removed or edited: the
+    user's counter in history_versions, bumped by triggers (migration v7), so
+    writes from other connections and processes count too.
+    """
+    row = conn.execute("SELECT version FROM history_versions WHERE user_pk = ?", (user_pk,)).fetchone()
+    return row[0] if row else 0
+
+
+def _latest_category(conn, user_pk, charge):
+    # The latest charge is one row of the UNIQUE(user_pk, date, vendor, amount_cents) index
+    row = conn.execute("""
+        SELECT category FROM transactions
+        WHERE user_pk = ? AND date = ? AND vendor = ? AND amount_cents = ?
+    """, (user_pk, charge['last_date'], charge['descriptor'], charge['amount_cents'])).fetchone()
+    return row[0] if row else None
+
+
+def recurring_charges(conn, user_pk, as_of=None):
+    """
+    detect_recurring() over the user's full history, plus each charge's `category`
+    (that of its latest transaction). Cached until history_version() changes.
+    """
+    as_of = int(time.time() // 86400) if as_of is None else as_of
+    key = (conn.execute("PRAGMA database_list").fetchone()[2], user_pk)
+    version = history_version(conn, user_pk)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version and cached[1] == as_of:
+            return cached[2]
+    charges = detect_recurring(TransactionHistory.load(conn, user_pk), as_of)
+    for charge in charges:
+        charge['category'] = _latest_category(conn, user_pk, charge)
+    with _cache_lock:
+        _cache[key] = (version, as_of, charges)
+    return charges
+
+
+def describe(charge):
+    """Short one-line summary of a recurring charge, e.g. for a prompt hint."""
+    amount = format_cents(charge['amount_cents'])
+    kind = 'usually' if charge['fixed_amount'] else 'averaging'
+    if not charge['fixed_amount']:
+        amount = format_cents(charge['average_cents'])
+    return f"{charge['period']} charge ({charge['occurrences']} so far), {kind} {amount}"
+
+
+def format_report(charges):
+    """Recurring charges as report lines: cadence, amount, next expected date and price changes."""
+    lines = []
+    for charge in charges:
+        status = f"next {charge['next_date']}" if charge['active'] else f"lapsed (last {charge['last_date']})"
+        amount = format_cents(charge['amount_cents']) if charge['fixed_amount'] else f"~{format_cents(charge['average_cents'])}"
+        line = f"{charge['vendor'][:28]:<28} {charge['period']:<10} {amount:>11}  {status}"
+        change = charge['price_change']
+        if change:
+            line += (f"  (price {format_cents(change['from_cents'])} -> {format_cents(change['to_cents'])}"
+                     f" on {change['date']})")
+        lines.append(line)
+    return lines
+
+
+if __name__ == '__main__':
+    from process_email import DB_NAME, USER_MAP, initialize_db
+    from transaction_store import connect_db
+
+    parser = argparse.ArgumentParser(description="Recurring charges and subscriptions found in a user's history.")
+    parser.add_argument('user', help="User ID from USER_MAP (e.g. 'leila').")
+    parser.add_argument('--as-of', help="Judge active/lapsed as of this date (YYYY-MM-DD).")
+    parser.add_argument('--active', action='store_true', help="Only charges that are still active.")
+    args = parser.parse_args()
+
+    if args.user not in USER_MAP:
+        print(f"\nERROR: User ID '{args.user}' is not mapped to a database primary key. Add it to USER_MAP.")
+        sys.exit(1)
+
+    initialize_db()
+    conn = connect_db(DB_NAME)
+    charges = recurring_charges(conn, USER_MAP[args.user], epoch_day(args.as_of) if args.as_of else None)
+    if args.active:
+        charges = [charge for charge in charges if charge['active']]
+    print(f"\n--- Recurring charges for {args.user} ---")
+    print("\n".join(format_report(charges)) or "None found.")
+    conn.close()
@@ -0,0 +1,131 @@
+import argparse
+import sys
+
+# --- Spending Rollups ---
+# monthly_rollups keeps one row per user x month x category (count, total, min, max).
+# SQLite triggers (migration v3 in migrations.py) update it inside the same write
+# transaction as every change to `transactions`, so reports read
+# O(months x categories) rows instead of rescanning every transaction.
+
+# Only ISO-dated rows are rolled up (the v2 migration may keep unparseable dates as-is).
+_ISO_DATE = "'[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+
+
+def rebuild_rollups(conn):
+    """Recomputes every rollup from scratch (e.g. after a manual edit with triggers disabled)."""
+    conn.execute("DELETE FROM monthly_rollups")
+    conn.execute(f"""
+        INSERT INTO monthly_rollups (user_pk, month, category, txn_count, total_cents, min_cents, max_cents)
+        SELECT user_pk, substr(date, 1, 7), category, count(*), sum(amount_cents), min(amount_cents), max(amount_cents)
+        FROM transactions
+        WHERE date GLOB {_ISO_DATE}
+        GROUP BY user_pk, substr(date, 1, 7), category
+    """)
+
+
+# --- Query API ---
+
+def category_breakdown(conn, user_pk, start_month=None, end_month=None):
+    """
+    Totals per category over an inclusive YYYY-MM range.
+
+    Returns:
+        List of (category, txn_count, total_cents) ordered by total spend, largest first.
+    """
+    return conn.execute("""
+        SELECT category, sum(txn_count), sum(total_cents)
+        FROM monthly_rollups
+        WHERE user_pk = ? AND month BETWEEN ? AND ?
+        GROUP BY category
+        ORDER BY sum(total_cents) DESC
+    """, (user_pk, start_month or '0000-00', end_month or '9999-99')).fetchall()
+
+
+def month_over_month(conn, user_pk, category=None, start_month=None, end_month=None):
+    """
+    Monthly totals (optionally for one category) with the change from the previous month.
+
+    Returns:
+        List of (month, total_cents, delta_cents) in month order; delta is None for the first month.
+    """
+    rows = conn.execute(f"""
+        SELECT month, sum(total_cents)
+        FROM monthly_rollups
+        WHERE user_pk = ? AND month BETWEEN ? AND ? {'AND category = ?' if category else ''}
+        GROUP BY month
+        ORDER BY month
+    """, (user_pk, start_month or '0000-00', end_month or '9999-99', *([category] if category else []))).fetchall()
+
+    result = []
+    previous = None
+    for month, total in rows:
+        result.append((month, total, None if previous is None else total - previous))
+        previous = total
+    return result
+
+
+def spent(conn, user_pk, category=None, year=None):
+    """Total cents spent (optionally in one category / calendar year), read from the rollups."""
+    start, end = (f"{year}-01", f"{year}-12") if year else (None, None)
+    if category:
+        rows = conn.execute("""
+            SELECT coalesce(sum(total_cents), 0) FROM monthly_rollups
+            WHERE user_pk = ? AND category = ? AND month BETWEEN ? AND ?
+        """, (user_pk, category, start or '0000-00', end or '9999-99')).fetchone()
+        return rows[0]
+    return sum(total for _category, _count, total in category_breakdown(conn, user_pk, start, end))
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return f"{sign}${abs(cents) / 100:,.2f}"
+
+
+if __name__ == '__main__':
+    from process_email import DB_NAME, USER_MAP, initialize_db
+    from transaction_store import connect_db
+
+    parser = argparse.ArgumentParser(description="Spending rollups: category breakdowns and month-over-month totals.")
+    parser.add_argument('user', nargs='?', help="User ID from USER_MAP (e.g. 'leila').")
+    parser.add_argument('--from', dest='start_month', help="First month, YYYY-MM.")
+    parser.add_argument('--to', dest='end_month', help="Last month, YYYY-MM.")
+    parser.add_argument('--year', type=int, help="Restrict to one calendar year.")
+    parser.add_argument('--category', help="Month-over-month for a single category.")
+    parser.add_argument('--rebuild', action='store_true', help="Recompute all rollups from the transactions table.")
+    args = parser.parse_args()
+
+    initialize_db()
+    conn = connect_db(DB_NAME)
+
+    if args.rebuild:
+        with conn:
+            rebuild_rollups(conn)
+        print("Rollups rebuilt.")
+
+    if args.user:
+        if args.user not in USER_MAP:
+            print(f"\nERROR: User ID '{args.user}' is not mapped to a database primary key. Add it to USER_MAP.")
+            sys.exit(1)
+        user_pk = USER_MAP[args.user]
+        start_month, end_month = args.start_month, args.end_month
+        if args.year:
+            start_month, end_month = f"{args.year}-01", f"{args.year}-12"
+
+        print(f"\n--- Category breakdown for {args.user} ({start_month or 'start'} to {end_month or 'now'}) ---")
+        for category, count, total in category_breakdown(conn, user_pk, start_month, end_month):
+            print(f"{category:<28} {count:>6} txns  {format_cents(total):>12}")
+
+        print(f"\n--- Month over month{' for ' + args.category if args.category else ''} ---")
+        for month, total, delta in month_over_month(conn, user_pk, args.category, start_month, end_month):
+            change = '' if delta is None else f"  ({'+' if delta >= 0 else ''}{format_cents(delta)})"
+            print(f"{month}  {format_cents(total):>12}{change}")
+
+        # Active subscriptions and other recurring charges, with upcoming dates and price changes
+        from recurring import format_report, recurring_charges
+        charges = [charge for charge in recurring_charges(conn, user_pk) if charge['active']]
+        print("\n--- Recurring charges ---")
+        print("\n".join(format_report(charges)) or "None found.")
+    elif not args.rebuild:
+        parser.print_usage()
+
+    conn.close()
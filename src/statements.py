@@ -0,0 +1,341 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+from category_rules import canonical_vendor
+from rollups import format_cents
+
+logger = logging.getLogger(__name__)
+
+# --- Monthly Statements ---
+# One HTML and/or PDF statement per user x month: category totals against the
+# previous month, and the top vendors. Triggers on `transactions` (migration v5
+# in migrations.py) note every (user, month) a write touches in
+# statement_changes; a run only looks at those months (plus the month after
+# each, whose deltas move) and at months never rendered with the current templates. Each statement's input data is hashed, so
+# a month whose numbers came out the same is not rendered again.
+STATEMENTS_DIR = Path(__file__).resolve().parents[1] / 'statements'
+TEMPLATES_DIR = Path(__file__).resolve().parent / 'templates'
+STATEMENT_TEMPLATE = 'statement.html'
+LAYOUT_VERSION = 1        # bump when the statement data or the PDF layout changes
+FORMATS = ('html', 'pdf')
+TOP_VENDORS = 10
+RENDER_WORKERS = os.cpu_count() or 1
+PARALLEL_MIN_JOBS = 8     # fewer statements than this render in-process (a pool costs more to start)
+
+
+def previous_month(month):
+    year, number = map(int, month.split('-'))
+    return f"{year - 1}-12" if number == 1 else f"{year}-{number - 1:02d}"
+
+
+def next_month(month):
+    year, number = map(int, month.split('-'))
+    return f"{year + 1}-01" if number == 12 else f"{year}-{number + 1:02d}"
+
+
+def month_label(month):
+    """'2025-03' -> 'March 2025'."""
+    year, number = map(int, month.split('-'))
+    return date(year, number, 1).strftime('%B %Y')
+
+
+def statement_data(conn, user_pk, month):
+    """
+    Everything a statement shows, as plain JSON-able values (amounts in cents).
+
+    Returns:
+        Dict, or None when the month has no transactions.
+    """
+    previous = previous_month(month)
+    totals = {}  # category -> [count, cents this month, cents previous month]
+    for row_month, category, count, cents in conn.execute("""
+        SELECT month, category, txn_count, total_cents FROM monthly_rollups
+        WHERE user_pk = ? AND month IN (?, ?)
+    """, (user_pk, month, previous)):
+        entry = totals.setdefault(category, [0, 0, 0])
+        if row_month == month:
+            entry[0], entry[1] = count, cents
+        else:
+            entry[2] = cents
+    if not any(count for count, _cents, _previous in totals.values()):
+        return None
+
+    # Card descriptors of one merchant ("SQ *JOES #12", "JOES 4411") are folded together
+    vendors = {}  # canonical name -> [count, cents, {descriptor: cents}]
+    for vendor, count, cents in conn.execute("""
+        SELECT vendor, count(*), sum(amount_cents) FROM transactions
+        WHERE user_pk = ? AND date BETWEEN ? AND ?
+        GROUP BY vendor
+    """, (user_pk, f"{month}-01", f"{month}-31")):
+        entry = vendors.setdefault(canonical_vendor(vendor) or vendor, [0, 0, {}])
+        entry[0] += count
+        entry[1] += cents
+        entry[2][vendor] = cents
+    top_vendors = sorted(vendors.values(), key=lambda entry: -entry[1])[:TOP_VENDORS]
+
+    categories = [
+        {'category': category, 'count': count, 'total_cents': cents,
+         'previous_cents': previous_cents, 'delta_cents': cents - previous_cents}
+        for category, (count, cents, previous_cents) in sorted(totals.items(), key=lambda item: (-item[1][1], item[0]))
+        if count
+    ]
+    total = sum(row['total_cents'] for row in categories)
+    previous_total = sum(previous_cents for _count, _cents, previous_cents in totals.values())
+    has_previous = any(previous_cents for _count, _cents, previous_cents in totals.values())
+    return {
+        'user_pk': user_pk,
+        'month': month,
+        'label': month_label(month),
+        'previous_label': month_label(previous),
+        'count': sum(row['count'] for row in categories),
+        'total_cents': total,
+        'previous_total_cents': previous_total,
+        'delta_cents': total - previous_total if has_previous else None,
+        'categories': categories,
+        'top_vendors': [
+            {'vendor': max(descriptors, key=descriptors.get), 'count': count, 'total_cents': cents}
+            for count, cents, descriptors in top_vendors
+        ],
+    }
+
+
+@lru_cache(maxsize=None)
+def render_hash(formats):
+    """Hash of the template source, LAYOUT_VERSION and the output formats."""
+    digest = hashlib.sha256(f"{LAYOUT_VERSION}|{','.join(formats)}|".encode())
+    digest.update((TEMPLATES_DIR / STATEMENT_TEMPLATE).read_bytes())
+    return digest.hexdigest()
+
+
+def content_hash(data, formats):
+    return hashlib.sha256(
+        (render_hash(formats) + json.dumps(data, sort_keys=True, separators=(',', ':'))).encode()
+    ).hexdigest()
+
+
+# --- Rendering ---
+
+def format_delta(cents):
+    if cents is None:
+        return '—'
+    return ('+' if cents > 0 else '') + format_cents(cents)
+
+
+@lru_cache(maxsize=None)
+def _template():
+    # Compiled once per process; jinja2 is only needed when something is rendered
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    environment = Environment(loader=FileSystemLoader(TEMPLATES_DIR), autoescape=select_autoescape(['html']),
+                              trim_blocks=True, lstrip_blocks=True)
+    environment.filters['cents'] = format_cents
+    environment.filters['delta'] = format_delta
+    return environment.get_template(STATEMENT_TEMPLATE)
+
+
+def render_html(data, path):
+    Path(path).write_text(_template().render(**data), encoding='utf-8')
+
+
+def render_pdf(data, path):
+    """The same statement as a one-page PDF (reportlab platypus)."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f3f3')),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('LINEBELOW', (0, 0), (-1, -1), 0.25, colors.HexColor('#dddddd')),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ])
+    summary = f"{data['count']} transactions, {format_cents(data['total_cents'])} spent"
+    if data['delta_cents'] is not None:
+        summary += f" ({format_delta(data['delta_cents'])} vs {data['previous_label']})"
+
+    categories = [['Category', 'Txns', 'Total', data['previous_label'], 'Change']]
+    categories += [[row['category'], row['count'], format_cents(row['total_cents']),
+                    format_cents(row['previous_cents']), format_delta(row['delta_cents'])]
+                   for row in data['categories']]
+    categories.append(['Total', data['count'], format_cents(data['total_cents']),
+                       format_cents(data['previous_total_cents']), format_delta(data['delta_cents'])])
+    vendors = [['Vendor', 'Txns', 'Total']]
+    vendors += [[row['vendor'], row['count'], format_cents(row['total_cents'])] for row in data['top_vendors']]
+
+    category_table = Table(categories, colWidths=[2.6 * inch, 0.6 * inch, 1.1 * inch, 1.2 * inch, 1.1 * inch])
+    category_table.setStyle(table_style)
+    category_table.setStyle([('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold')])
+    vendor_table = Table(vendors, colWidths=[4.4 * inch, 0.6 * inch, 1.1 * inch])
+    vendor_table.setStyle(table_style)
+
+    # invariant: no timestamps or random IDs, so unchanged data gives an identical file
+    document = SimpleDocTemplate(str(path), pagesize=letter, title=f"Statement {data['label']}", invariant=True)
+    document.build([
+        Paragraph(data['label'], styles['Title']),
+        Paragraph(summary, styles['Normal']),
+        Spacer(1, 0.25 * inch),
+        Paragraph('Spending by category', styles['Heading2']),
+        category_table,
+        Spacer(1, 0.25 * inch),
+        Paragraph('Top vendors', styles['Heading2']),
+        vendor_table,
+    ])
+
+
+RENDERERS = {'html': render_html, 'pdf': render_pdf}
+
+
+def statement_paths(out_dir, user_pk, month, formats):
+    return {fmt: Path(out_dir) / str(user_pk) / f"{month}.{fmt}" for fmt in formats}
+
+
+def render_statement(job):
+    """Writes one statement in every requested format; job is (data, {format: path})."""
+    data, paths = job
+    for fmt, path in paths.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        RENDERERS[fmt](data, path)
+    return data['user_pk'], data['month']
+
+
+def _warm_worker():
+    _template()
+
+
+# --- Incremental Generation ---
+
+def changed_months(conn, formats, user_pks=None, force=False):
+    """
+    (user_pk, month) pairs that may need a new statement, and the statement_changes
+    rows they came from ({(user_pk, month): changes}).
+    """
+    where, params = '', []
+    if user_pks is not None:
+        where, params = f"user_pk IN ({', '.join('?' * len(user_pks))})", list(user_pks)
+
+    changes = {(user_pk, month): count for user_pk, month, count in conn.execute(
+        f"SELECT user_pk, month, changes FROM statement_changes {'WHERE ' + where if where else ''}", params)}
+    candidates = set()
+    for user_pk, month in changes:
+        if len(month) == 7 and month[4] == '-' and month.replace('-', '').isdigit():
+            candidates.update([(user_pk, month), (user_pk, next_month(month))])
+
+    # Months never rendered, or rendered with other templates or formats
+    stale = "" if force else "AND (s.render_hash IS NULL OR s.render_hash != ?)"
+    candidates.update(conn.execute(f"""
+        SELECT DISTINCT r.user_pk, r.month
+        FROM monthly_rollups r LEFT JOIN statements s ON s.user_pk = r.user_pk AND s.month = r.month
+        WHERE 1 {stale} {'AND r.' + where if where else ''}
+    """, ([] if force else [render_hash(formats)]) + params).fetchall())
+    return sorted(candidates), changes
+
+
+def generate_statements(conn, user_pks=None, formats=FORMATS, out_dir=STATEMENTS_DIR, force=False,
+                        workers=RENDER_WORKERS):
+    """
+    Brings the statements under `out_dir` up to date with the database.
+
+    Only months touched since the last run (or never rendered with the current
+    templates) are looked at, and of those only months whose statement data
+    changed are rendered, in parallel across users and months. A month that lost
+    all its transactions has its statement removed.
+
+    Returns:
+        Dict of counts: checked, rendered, unchanged, removed.
+    """
+    formats = tuple(formats)
+    candidates, changes = changed_months(conn, formats, user_pks, force)
+    stored = {}
+    if candidates:
+        stored = {(user_pk, month): digest for user_pk, month, digest in conn.execute(f"""
+            SELECT user_pk, month, content_hash FROM statements
+            WHERE user_pk IN ({', '.join('?' * len({user_pk for user_pk, _month in candidates}))})
+        """, sorted({user_pk for user_pk, _month in candidates}))}
+
+    jobs, hashes, removed, unchanged = [], {}, [], 0
+    for user_pk, month in candidates:
+        data = statement_data(conn, user_pk, month)
+        if data is None:
+            if (user_pk, month) in stored:
+                removed.append((user_pk, month))
+            continue
+        digest = content_hash(data, formats)
+        paths = statement_paths(out_dir, user_pk, month, formats)
+        if not force and stored.get((user_pk, month)) == digest and all(path.exists() for path in paths.values()):
+            unchanged += 1
+            continue
+        jobs.append((data, paths))
+        hashes[(user_pk, month)] = digest
+
+    start = time.perf_counter()
+    if len(jobs) >= PARALLEL_MIN_JOBS and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker) as executor:
+            list(executor.map(render_statement, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        for job in jobs:
+            render_statement(job)
+    elapsed = time.perf_counter() - start
+
+    for user_pk, month in removed:
+        for path in statement_paths(out_dir, user_pk, month, FORMATS).values():
+            path.unlink(missing_ok=True)
+
+    now = time.time()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO statements (user_pk, month, render_hash, content_hash, rendered_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(user_pk, month, render_hash(formats), digest, now) for (user_pk, month), digest in hashes.items()])
+        conn.executemany("DELETE FROM statements WHERE user_pk = ? AND month = ?", removed)
+        # A write that landed during the run bumped `changes`, so its row survives for the next run
+        conn.executemany("DELETE FROM statement_changes WHERE user_pk = ? AND month = ? AND changes = ?",
+                         [(user_pk, month, count) for (user_pk, month), count in changes.items()])
+
+    counts = {'checked': len(candidates), 'rendered': len(jobs),
+              'unchanged': unchanged, 'removed': len(removed)}
+    logger.info("Statements: %d months checked, %d rendered in %.2fs, %d unchanged, %d removed.",
+                counts['checked'], counts['rendered'], elapsed, counts['unchanged'], counts['removed'],
+                extra={**counts, 'seconds': round(elapsed, 3)})
+    return counts
+
+
+if __name__ == '__main__':
+    from log_config import LOG_FORMATS, configure_logging
+    from process_email import DB_NAME, USER_MAP, initialize_db
+    from transaction_store import connect_db
+
+    parser = argparse.ArgumentParser(description="Render monthly HTML/PDF spending statements (only what changed).")
+    parser.add_argument('users', nargs='*', help="User IDs from USER_MAP (default: every user).")
+    parser.add_argument('--format', dest='formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--out', type=Path, default=STATEMENTS_DIR, help="Output directory (one folder per user PK).")
+    parser.add_argument('--force', action='store_true', help="Re-render every month.")
+    parser.add_argument('--workers', type=int, default=RENDER_WORKERS, help="Rendering processes.")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper)
+    parser.add_argument('--log-format', default='text', choices=LOG_FORMATS, help="'json' emits one object per line.")
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+
+    unknown = [user_id for user_id in args.users if user_id not in USER_MAP]
+    if unknown:
+        logger.error("User ID(s) %s not mapped to a database primary key. Add them to USER_MAP.", ', '.join(unknown))
+        sys.exit(1)
+
+    initialize_db()
+    conn = connect_db(DB_NAME)
+    try:
+        generate_statements(conn, [USER_MAP[user_id] for user_id in args.users] or None, args.formats,
+                            args.out, force=args.force, workers=args.workers)
+    finally:
+        conn.close()
@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import threading
+import time
+
+from googleapiclient.errors import HttpError
+
+from metrics import METRICS
+from transaction_store import connect_db
+
+logger = logging.getLogger(__name__)
+
+# Re-list a small window before the watermark in case Gmail's internalDate and
+# indexing disagree; anything already seen is dropped by the processed ledger.
+WATERMARK_OVERLAP_SECONDS = 3600
+
+
+class SyncLedger:
+    """
+    Per-user sync state kept next to the transactions table.
+
+    - `sync_state` holds the last Gmail historyId and an internalDate watermark.
+    - `processed_messages` records every Gmail message ID already handled, so
+      re-runs never re-download, re-parse or re-categorize the same mail.
+
+    `is_processed` may be called from the fetch thread while the writer marks
+    and flushes, so access to the connection is serialized. sync_state is only
+    written by finish(): Gmail lists newest first, so a watermark saved part way
+    through a listing would hide the older mail it had not reached yet.
+    """
+
+    def __init__(self, db_name, user_pk):
+        self.user_pk = user_pk
+        self._lock = threading.Lock()
+        self.conn = connect_db(db_name)
+
+        row = self.conn.execute(
+            "SELECT history_id, watermark FROM sync_state WHERE user_pk = ?", (user_pk,)
+        ).fetchone()
+        self.history_id, self.watermark = row if row else (None, None)
+        self._pending = []
+
+    def is_processed(self, message_id):
+        """True if this message ID was handled by a previous (or the current) run."""
+        with self._lock:
+            if message_id in self._pending:
+                return True
+            return self.conn.execute(
+                "SELECT 1 FROM processed_messages WHERE user_pk = ? AND message_id = ?",
+                (self.user_pk, message_id)
+            ).fetchone() is not None
+
+    def mark_processed(self, message_id, internal_date_ms=None):
+        """Queues a message ID for the ledger and advances the watermark."""
+        with self._lock:
+            self._pending.append(message_id)
+        if internal_date_ms:
+            seconds = int(internal_date_ms) // 1000
+            if self.watermark is None or seconds > self.watermark:
+                self.watermark = seconds
+
+    def flush(self, save_state=False):
+        """Writes queued message IDs (and, with `save_state`, the historyId and watermark) in one transaction."""
+        now = int(time.time())
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_messages (user_pk, message_id, processed_at) VALUES (?, ?, ?)",
+                [(self.user_pk, message_id, now) for message_id in self._pending]
+            )
+            if save_state:
+                self._save_state(now)
+            self._pending = []
+
+    def finish(self, history_id):
+        """
+        Flushes the ledger and records the historyId the run started from, with the
+        watermark. Call only once the whole listing has been processed.
+        """
+        self.history_id = history_id
+        self.flush(save_state=True)
+
+    def close(self):
+        self.conn.close()
+
+    def _save_state(self, now):
+        self.conn.execute("""
+            INSERT INTO sync_state (user_pk, history_id, watermark, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_pk) DO UPDATE SET
+                history_id = excluded.history_id,
+                watermark = excluded.watermark,
+                updated_at = excluded.updated_at
+        """, (self.user_pk, self.history_id, self.watermark, now))
+
+    def query_with_watermark(self, query):
+        """Narrows a Gmail search to mail newer than the watermark, if one is known."""
+        if self.watermark is None:
+            return query
+        return f"{query} after:{self.watermark - WATERMARK_OVERLAP_SECONDS}"
+
+
+class BackfillCheckpoints:
+    """
+    The window plan of a user's parallel backfill (see backfill.py) and which
+    windows are done, so an interrupted backfill resumes with the windows left.
+
+    A plan belongs to one user and one search query (a hash of it), and keeps the
+    historyId captured when it was made: the sync picks up from there once every
+    window is done, covering mail that arrived while the backfill ran.
+    """
+
+    def __init__(self, db_name, user_pk, query):
+        self.user_pk = user_pk
+        self.query_hash = hashlib.sha1(query.encode()).hexdigest()
+        self._lock = threading.Lock()
+        self.conn = connect_db(db_name)
+
+    def load(self):
+        """
+        The saved plan: (history_id, [(after, before, estimate, done), ...] in time
+        order), or None if there is none.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT history_id FROM backfill_plans WHERE user_pk = ? AND query_hash = ?",
+                                    (self.user_pk, self.query_hash)).fetchone()
+            if row is None:
+                return None
+            windows = self.conn.execute("""
+                SELECT after, before, estimate, messages IS NOT NULL FROM backfill_windows
+                WHERE user_pk = ? AND query_hash = ? ORDER BY after
+            """, (self.user_pk, self.query_hash)).fetchall()
+        return row[0], [(after, before, estimate, bool(done)) for after, before, estimate, done in windows]
+
+    def save(self, history_id, windows):
+        """Replaces the plan with `windows` ([(after, before, estimate), ...]), none of them done."""
+        key = (self.user_pk, self.query_hash)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM backfill_windows WHERE user_pk = ? AND query_hash = ?", key)
+            self.conn.execute("""
+                INSERT OR REPLACE INTO backfill_plans (user_pk, query_hash, history_id, created_at)
+                VALUES (?, ?, ?, ?)
+            """, (*key, history_id, int(time.time())))
+            self.conn.executemany("""
+                INSERT INTO backfill_windows (user_pk, query_hash, after, before, estimate)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(*key, after, before, estimate) for after, before, estimate in windows])
+
+    def complete(self, after, messages):
+        """Marks the window starting at `after` done; call once its messages are saved and in the ledger."""
+        with self._lock, self.conn:
+            self.conn.execute("""
+                UPDATE backfill_windows SET messages = ?, completed_at = ?
+                WHERE user_pk = ? AND query_hash = ? AND after = ?
+            """, (messages, int(time.time()), self.user_pk, self.query_hash, after))
+
+    def close(self):
+        self.conn.close()
+
+
+def get_current_history_id(service):
+    """Returns the mailbox's current historyId (captured before listing so nothing is missed)."""
+    METRICS.inc('gmail_api_calls_total', call='profile')
+    return service.users().getProfile(userId='me').execute()['historyId']
+
+
+def check_for_new_messages(service, start_history_id):
+    """
+    Uses users.history.list to check whether any message was added since
+    `start_history_id`. One cheap call answers "nothing to do" regardless of
+    mailbox size, and its response carries the mailbox's current historyId, so
+    an unchanged mailbox needs no getProfile call either.
+
+    Returns:
+        (has_new, history_id): history_id is the current historyId when the
+        mailbox is unchanged, else None. has_new is True when the history is
+        unavailable (expired IDs return 404), so the caller falls back to the
+        watermark query.
+    """
+    METRICS.inc('gmail_api_calls_total', call='history')
+    try:
+        results = service.users().history().list(
+            userId='me',
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded'],
+            maxResults=1
+        ).execute()
+    except HttpError as error:
+        logger.warning("History lookup failed (%s). Falling back to watermark query.", error)
+        return True, None
+
+    # An empty page that still has a next page token is not proof of "unchanged"
+    if results.get('history') or results.get('nextPageToken'):
+        return True, None
+    return False, results.get('historyId', start_history_id)
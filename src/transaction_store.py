@@ -0,0 +1,161 @@
+import logging
+import sqlite3
+import threading
+from collections import Counter
+
+from category_queue import enqueue
+from category_rules import PENDING_CATEGORY
+from metrics import METRICS
+from migrations import to_cents, to_iso_date
+
+logger = logging.getLogger(__name__)
+
+# --- Store Configuration ---
+BUSY_TIMEOUT_SECONDS = 30  # wait this long for another process's write lock
+FLUSH_SIZE = 200           # buffered rows per write transaction
+# Rows per multi-row INSERT; 6 bound parameters each stays under SQLite's
+# conservative 999-variable limit.
+ROWS_PER_STATEMENT = 150
+
+TRANSACTION_COLUMNS = ('user_pk', 'bank', 'date', 'vendor', 'amount_cents', 'category')
+
+
+def transaction_row(transaction_data):
+    """
+    Converts an extracted transaction dict (alert-style date, dollar string) into a
+    row for the typed schema: ISO-8601 date and integer cents.
+    """
+    return (
+        transaction_data['user_pk'],
+        transaction_data['bank'],
+        to_iso_date(transaction_data['date']),
+        transaction_data['vendor'],
+        to_cents(transaction_data['dollar_amount']),
+        transaction_data['category'],
+    )
+
+
+def connect_db(db_name):
+    """
+    Opens a connection configured for concurrent use of the shared database:
+    WAL journaling (readers never block the writer) and a busy timeout, so several
+    process_email.py processes can share chatmate_transactions.db without
+    "database is locked" errors.
+    """
+    conn = sqlite3.connect(db_name, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # safe with WAL; fsync at checkpoints only
+    return conn
+
+
+class TransactionStore:
+    """
+    Single-connection, buffered writer for the `transactions` table.
+
+    Rows are collected with `add()` and written by `flush()` in one
+    BEGIN IMMEDIATE transaction using multi-row INSERT OR IGNORE ... RETURNING,
+    so duplicates are skipped by SQLite instead of via IntegrityError and a
+    backfill costs one commit per FLUSH_SIZE rows instead of one per row.
+    Inserted rows still in PENDING_CATEGORY are added to the categorization
+    queue in the same transaction, so a row is never saved without its queue entry.
+
+    One store can be shared by several users' pipelines in the same process;
+    it keeps per-user counts so each run can report its own results.
+    """
+
+    def __init__(self, db_name, flush_size=FLUSH_SIZE):
+        self.flush_size = flush_size
+        self.conn = connect_db(db_name)
+        self.conn.isolation_level = None  # transactions are managed explicitly
+        self._buffer = []
+        self._lock = threading.RLock()
+        self.inserted = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.queued = 0
+        self.added_by_user = Counter()
+        self.inserted_by_user = Counter()
+
+    def add(self, transaction_data):
+        """Buffers one categorized transaction; flushes automatically when the buffer is full."""
+        try:
+            row = transaction_row(transaction_data)
+        except ValueError as e:
+            logger.error("Not saving transaction for %s: %s", transaction_data['vendor'], e,
+                         extra={'vendor': transaction_data['vendor']})
+            METRICS.inc('transactions_rejected_total')
+            with self._lock:
+                self.rejected += 1
+            return
+        with self._lock:
+            self._buffer.append(row)
+            self.added_by_user[row[0]] += 1
+            if len(self._buffer) >= self.flush_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered rows in one transaction.
+
+        Returns:
+            (inserted, skipped) counts for this flush.
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0, 0
+            rows, self._buffer = self._buffer, []
+            return self._write(rows)
+
+    def _write(self, rows):
+        inserted_rows = []
+        # IMMEDIATE takes the write lock up front, so concurrent processes queue on
+        # the busy timeout instead of failing on a read->write lock upgrade.
+        with METRICS.stage('db_write'):
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(rows), ROWS_PER_STATEMENT):
+                    chunk = rows[start:start + ROWS_PER_STATEMENT]
+                    placeholders = ", ".join(["(?, ?, ?, ?, ?, ?)"] * len(chunk))
+                    params = [value for row in chunk for value in row]
+                    inserted_rows += self.conn.execute(f"""
+                        INSERT OR IGNORE INTO transactions ({', '.join(TRANSACTION_COLUMNS)})
+                        VALUES {placeholders}
+                        RETURNING id, user_pk, category
+                    """, params).fetchall()
+                pending = [row_id for row_id, _user_pk, category in inserted_rows if category == PENDING_CATEGORY]
+                if pending:
+                    enqueue(self.conn, pending)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        inserted = len(inserted_rows)
+        skipped = len(rows) - inserted
+        self.inserted_by_user.update(user_pk for _row_id, user_pk, _category in inserted_rows)
+        self.inserted += inserted
+        self.skipped += skipped
+        self.queued += len(pending)
+        METRICS.inc('transactions_saved_total', inserted)
+        METRICS.inc('duplicates_skipped_total', skipped)
+        logger.info("Flushed transactions: %d saved, %d duplicates skipped", inserted, skipped,
+                    extra={'saved': inserted, 'duplicates': skipped})
+        return inserted, skipped
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def user_counts(self, user_pk):
+        """(saved, duplicates skipped) so far for one user; call after flush()."""
+        with self._lock:
+            saved = self.inserted_by_user[user_pk]
+            return saved, self.added_by_user[user_pk] - saved
+
+    def report(self):
+        report = f"Transactions: {self.inserted} saved, {self.skipped} duplicates skipped"
+        if self.queued:
+            report += f", {self.queued} queued for categorization"
+        if self.rejected:
+            report += f", {self.rejected} rejected"
+        return report
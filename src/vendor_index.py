@@ -0,0 +1,119 @@
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from category_rules import CATEGORIES, canonical_vendor, is_amount_sensitive
+
+# --- Vendor Index Configuration ---
+NGRAM = 3  # character n-gram length
+DIMENSIONS = 512  # hashed feature space (a 10k-vendor index is 20 MB of float32)
+MIN_CONFIDENCE = 0.8  # similarity x category agreement needed to reuse a category
+INITIAL_CAPACITY = 256  # vendor rows allocated up front; doubled when full
+_CATEGORY_SET = set(CATEGORIES)
+
+
+def ngram_features(name):
+    """
+    Sparse, L2-normalized character n-gram vector for a canonical vendor name,
+    as (feature indexes, weights). The name is padded with spaces so word
+    starts and ends count as n-grams of their own.
+    """
+    padded = f" {name} "
+    counts = Counter(
+        zlib.crc32(padded[i:i + NGRAM].encode('utf-8')) % DIMENSIONS
+        for i in range(max(1, len(padded) - NGRAM + 1))
+    )
+    indexes = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+    weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return indexes, weights / np.linalg.norm(weights)
+
+
+class VendorIndex:
+    """
+    In-memory similarity index over already-categorized vendors.
+
+    Each canonical vendor name is one column of a (DIMENSIONS x capacity) float32
+    matrix of n-gram vectors, with a tally of the categories its transactions were
+    given. A lookup scores the query against every known vendor using only the
+    rows of the query's own n-grams (a dozen or so), so it costs microseconds
+    for thousands of vendors. refresh() folds in only the `transactions` rows
+    written since the previous refresh, so the index grows with the table
+    instead of being rebuilt. Safe to share between threads.
+    """
+
+    def __init__(self, min_confidence=MIN_CONFIDENCE, capacity=INITIAL_CAPACITY):
+        self.min_confidence = min_confidence
+        self.last_row_id = 0
+        self._vectors = np.zeros((DIMENSIONS, capacity), dtype=np.float32)
+        self._names = []
+        self._rows = {}  # canonical name -> column
+        self._votes = []  # column -> Counter of categories
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, vendor, category, count=1):
+        """Records `count` transactions of `vendor` categorized as `category`."""
+        if category not in _CATEGORY_SET or is_amount_sensitive(vendor):
+            return
+        name = canonical_vendor(vendor)
+        with self._lock:
+            row = self._rows.get(name)
+            if row is None:
+                row = len(self._names)
+                if row == self._vectors.shape[1]:
+                    grown = np.zeros((DIMENSIONS, row * 2), dtype=np.float32)
+                    grown[:, :row] = self._vectors
+                    self._vectors = grown
+                indexes, weights = ngram_features(name)
+                self._vectors[indexes, row] = weights
+                self._names.append(name)
+                self._votes.append(Counter())
+                self._rows[name] = row
+            self._votes[row][category] += count
+
+    def lookup(self, vendor):
+        """
+        Category of the most similar known vendor, if it clears min_confidence.
+
+        Confidence is the cosine similarity of the canonical names times the share
+        of that vendor's transactions in its majority category, so a merchant the
+        history disagrees about needs a closer match.
+
+        Returns:
+            (category, confidence, matched canonical name), or None.
+        """
+        name = canonical_vendor(vendor)
+        with self._lock:
+            if not self._names:
+                return None
+            row = self._rows.get(name)
+            if row is not None:
+                similarity = 1.0
+            else:
+                indexes, weights = ngram_features(name)
+                scores = weights @ self._vectors[indexes, :len(self._names)]
+                row = int(scores.argmax())
+                similarity = float(scores[row])
+            votes = self._votes[row]
+            category, count = votes.most_common(1)[0]
+            confidence = similarity * count / sum(votes.values())
+            matched = self._names[row]
+        if confidence < self.min_confidence:
+            return None
+        return category, round(confidence, 3), matched
+
+    def refresh(self, conn):
+        """Adds transactions rows written since the last refresh (by id); returns how many were read."""
+        rows = conn.execute("""
+            SELECT MAX(id), vendor, category, COUNT(*) FROM transactions
+            WHERE id > ?
+            GROUP BY vendor, category
+        """, (self.last_row_id,)).fetchall()
+        for row_id, vendor, category, count in rows:
+            self.add(vendor, category, count)
+            self.last_row_id = max(self.last_row_id, row_id)
+        return sum(row[3] for row in rows)
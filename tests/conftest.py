@@ -0,0 +1,130 @@
+import socket
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# Modules in src/ import each other as top-level modules; benchmarks/ has the fake Gmail and corpora
+sys.path[:0] = [str(ROOT / 'src'), str(ROOT / 'benchmarks')]
+
+from stub_gemini import _TRANSACTION, StubGemini  # noqa: E402
+
+
+class ScriptedGemini(StubGemini):
+    """
+    StubGemini that plays queued `replies` before answering like the stub. A reply
+    is a callable taking the prompt's (index, merchant) pairs and returning
+    (status, headers, body). `sent` records each request's indexes, `bodies` its body.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.replies = []
+        self.sent = []
+        self.bodies = []
+        self._connections = []
+        accept = self._server.get_request
+
+        def get_request():
+            connection, address = accept()
+            self._connections.append(connection)
+            return connection, address
+
+        self._server.get_request = get_request
+
+    def disconnect(self):
+        """Shuts the keep-alive connections still open, so their handler threads exit."""
+        for connection in self._connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:  # already closed by the server
+                pass
+        self._connections = []
+
+    def respond(self, body):
+        transactions = _TRANSACTION.findall(body['contents'][0]['parts'][0]['text'] + '\n')
+        self.sent.append(sorted(int(index) for index, _merchant in transactions if index))
+        self.bodies.append(body)
+        if not self.replies:
+            return super().respond(body)
+        self.requests += 1
+        return self.replies.pop(0)(transactions)
+
+    @staticmethod
+    def text(text):
+        """A reply answering with `text`."""
+        return lambda transactions: (200, {}, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]})
+
+    @staticmethod
+    def error(status, retry_after=None):
+        """A reply failing with `status` (and a Retry-After header, if given)."""
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        return lambda transactions: (status, headers, {'error': {'code': status, 'message': 'Scripted error.'}})
+
+
+@pytest.fixture
+def db_name(tmp_path, monkeypatch):
+    """A migrated scratch database, installed as process_email.DB_NAME."""
+    import process_email
+    path = str(tmp_path / 'cashmate.db')
+    monkeypatch.setattr(process_email, 'DB_NAME', path)
+    process_email.initialize_db()
+    return path
+
+
+@pytest.fixture
+def conn(db_name):
+    """A connect_db() connection to the scratch database."""
+    from transaction_store import connect_db
+    conn = connect_db(db_name)
+    yield conn
+    conn.close()
+
+
+def _insert_transactions(conn, rows, bank='pnc'):
+    """Inserts (user_pk, date, vendor, amount_cents, category) rows and commits; returns their ids."""
+    with conn:
+        return [conn.execute("""
+            INSERT INTO transactions (user_pk, bank, date, vendor, amount_cents, category) VALUES (?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (user_pk, bank, date, vendor, cents, category)).fetchone()[0]
+            for user_pk, date, vendor, cents, category in rows]
+
+
+@pytest.fixture
+def insert_transactions():
+    """_insert_transactions(conn, rows, bank='pnc'), for tests and fixtures that add rows."""
+    return _insert_transactions
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Skips the sleeps between Gmail batch retries."""
+    import gmail_fetch
+    monkeypatch.setattr(gmail_fetch.time, 'sleep', lambda seconds: None)
+
+
+@pytest.fixture(scope='session')
+def gemini_server():
+    with ScriptedGemini() as server:
+        yield server
+
+
+@pytest.fixture
+def gemini(gemini_server, monkeypatch):
+    """The scripted Gemini stub with no replies queued, installed as process_email.LLM_CLIENT's endpoint."""
+    import process_email
+    from llm_client import LLMClient
+    gemini_server.replies, gemini_server.sent, gemini_server.bodies = [], [], []
+    running = set(threading.enumerate())
+    client = LLMClient(url=gemini_server.url)
+    monkeypatch.setattr(process_email, 'LLM_CLIENT', client)
+    yield gemini_server
+    client.close()
+    # A response kept alive (e.g. by a captured log record) keeps its connection open;
+    # end them all here, so their threads don't exit during a later test that counts threads
+    gemini_server.disconnect()
+    for thread in set(threading.enumerate()) - running:
+        thread.join(timeout=5)
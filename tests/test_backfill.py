@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import process_email
+from backfill import MIN_WINDOW_SECONDS, backfill_user_inbox, format_duration, plan_windows, window_query
+from corpus import synthetic_corpus
+from fake_gmail import FakeGmailService
+from gmail_fetch import gmail_limiter
+from sync_state import BackfillCheckpoints, SyncLedger
+
+START = int(datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp())
+END = int(datetime(2026, 6, 1, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.fixture(scope='module')
+def service():
+    return FakeGmailService(synthetic_corpus(3000))
+
+
+def test_window_query_overlaps_by_one_second():
+    assert window_query('from:x', 100, 200) == 'from:x after:99 before:200'
+
+
+@pytest.mark.parametrize('target', [200, 1000, 10_000])
+def test_plan_covers_every_message_in_sized_windows(service, target):
+    query = process_email.PARSERS.query()
+    windows = plan_windows(service, query, START, END, target=target)
+    total = len(service._query_matches(query))
+
+    assert sum(estimate for _after, _before, estimate in windows) == total
+    for after, before, estimate in windows:
+        assert estimate <= target or before - after <= MIN_WINDOW_SECONDS
+        assert estimate == len(service._query_matches(window_query(query, after, before)))
+    assert all(earlier[1] <= later[0] for earlier, later in zip(windows, windows[1:]))
+    # Sparse neighbours are merged: no two adjacent windows would fit in one
+    assert all(earlier[2] + later[2] > target for earlier, later in zip(windows, windows[1:]))
+
+
+def test_window_with_dropped_message_is_left_to_do(db_name, monkeypatch):
+    records = synthetic_corpus(300)
+    query = process_email.PARSERS.query()
+    dropped = sorted(FakeGmailService(records)._query_matches(query))[0]
+
+    limiter = gmail_limiter(2, units_per_second=1_000_000)
+    monkeypatch.setattr(limiter.bucket, 'pause', lambda seconds: None)
+
+    assert backfill_user_inbox(lambda: FakeGmailService(records, errors={dropped: 500}), 0,
+                               since='2023-01-01', workers=2, limiter=limiter) is None
+    checkpoints = BackfillCheckpoints(db_name, 0, query)
+    _history_id, windows = checkpoints.load()
+    assert [done for _after, _before, _estimate, done in windows].count(False) == 1
+    ledger = SyncLedger(db_name, 0)
+    assert (ledger.history_id, ledger.watermark) == (None, None)
+    assert not ledger.is_processed(dropped)
+    ledger.close()
+
+    # The resumed backfill only runs the open window and only fetches the dropped message
+    assert backfill_user_inbox(lambda: FakeGmailService(records), 0, since='2023-01-01', workers=2, limiter=limiter) == 1
+    _history_id, windows = checkpoints.load()
+    assert all(done for _after, _before, _estimate, done in windows)
+    checkpoints.close()
+
+
+def test_empty_mailbox_plans_nothing():
+    assert plan_windows(FakeGmailService([]), 'from:x', START, END) == []
+
+
+@pytest.mark.parametrize('seconds, text', [(None, '?'), (59, '0m59s'), (3725, '1h02m')])
+def test_format_duration(seconds, text):
+    assert format_duration(seconds) == text
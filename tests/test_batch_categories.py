@@ -0,0 +1,52 @@
+import json
+
+import process_email
+from pipeline import RateLimiter
+from stub_gemini import stub_category
+
+
+def answer(pick):
+    """A reply whose JSON array holds pick(transactions) -> [(index, category), ...]."""
+    def reply(transactions):
+        text = json.dumps([{'index': index, 'category': category} for index, category in pick(transactions)])
+        return 200, {}, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}}]}
+    return reply
+
+
+TRANSACTIONS = [{'vendor': vendor, 'dollar_amount': '12.00', 'date': '2025-03-01'}
+                for vendor in ('CORNER CAFE', 'SHELL OIL 5531', 'NETFLIX.COM')]
+EXPECTED = [stub_category(transaction['vendor']) for transaction in TRANSACTIONS]
+
+
+def categorize(errors=None):
+    return process_email.request_batch_categories(TRANSACTIONS, limiter=RateLimiter(rate=100, burst=100), errors=errors)
+
+
+def test_answers_are_matched_by_index_and_missing_ones_resent(gemini):
+    gemini.replies = [answer(lambda transactions: [(2, EXPECTED[2]), (0, EXPECTED[0])])]  # out of order, 1 missing
+    assert categorize() == EXPECTED
+    assert gemini.sent == [[0, 1, 2], [1]]
+
+
+def test_categories_outside_the_list_are_resent(gemini):
+    gemini.replies = [answer(lambda transactions: [
+        (0, 'Groceries and More'), (1, EXPECTED[1].upper()), (2, EXPECTED[2])
+    ])]
+    assert categorize() == EXPECTED  # case differences are accepted
+    assert gemini.sent == [[0, 1, 2], [0]]
+
+
+def test_gives_up_after_the_last_round(gemini):
+    gemini.replies = [answer(lambda transactions: [(0, 'Snacks')]) for _round in range(3)]
+    errors = {}
+    assert categorize(errors) == [None] * 3
+    assert len(gemini.sent) == process_email.LLM_CLIENT.max_retries + 1
+    assert errors == {index: "answer missing or not in the category list" for index in range(3)}
+
+
+def test_rate_limited_request_is_retried(gemini):
+    gemini.replies = [gemini.error(429, retry_after=0)]
+    errors = {}
+    assert categorize(errors) == EXPECTED
+    assert errors == {}
+    assert gemini.sent == [[0, 1, 2], [0, 1, 2]]
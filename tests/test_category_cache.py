@@ -0,0 +1,75 @@
+import pytest
+
+from category_cache import CategoryCache, cache_key
+
+
+def transaction(vendor, amount='12.34'):
+    return {'vendor': vendor, 'dollar_amount': amount}
+
+
+@pytest.fixture
+def cache(db_name):
+    cache = CategoryCache(db_name, 'prompt v1')
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize('vendor, amount, key', [
+    ('SQ *BAHALA KA MAI LLC', '40.00', 'bahala ka mai'),
+    ('Bahala Ka Mai #2 Orlando FL', '55.00', 'bahala ka mai'),
+    ('Cashapp*Yaniel', '200.00', 'cashapp yaniel|200.00'),  # an amount-predicated rule covers it
+])
+def test_cache_key(vendor, amount, key):
+    assert cache_key(transaction(vendor, amount)) == key
+
+
+def test_descriptor_variants_share_an_entry_across_runs(db_name):
+    cache = CategoryCache(db_name, 'prompt v1')
+    assert cache.get(transaction('SQ *BAHALA KA MAI LLC')) is None
+    cache.put(transaction('SQ *BAHALA KA MAI LLC'), 'Hair')
+    cache.close()
+
+    reopened = CategoryCache(db_name, 'prompt v1')
+    assert reopened.get(transaction('Bahala Ka Mai #2 Orlando FL')) == 'Hair'
+    assert reopened.get(transaction('NEW PLACE')) is None
+    assert (reopened.hits, reopened.misses) == (1, 1)
+    reopened.close()
+
+
+def test_amount_sensitive_entries_are_keyed_by_amount(cache):
+    cache.put(transaction('Cashapp*Yaniel', '200.00'), 'Personal Training')
+    assert cache.get(transaction('Cashapp*Yaniel', '200.00')) == 'Personal Training'
+    assert cache.get(transaction('Cashapp*Yaniel', '35.00')) is None
+
+
+def test_prompt_change_drops_old_answers(db_name):
+    cache = CategoryCache(db_name, 'prompt v1')
+    cache.put(transaction('NETFLIX.COM'), 'Subscriptions')
+    cache.close()
+
+    changed = CategoryCache(db_name, 'prompt v2')
+    assert changed.get(transaction('NETFLIX.COM')) is None
+    assert changed.conn.execute("SELECT count(*) FROM category_cache").fetchone()[0] == 0
+    changed.close()
+
+
+def test_expired_entries_miss(db_name):
+    cache = CategoryCache(db_name, 'prompt v1')
+    cache.put(transaction('NETFLIX.COM'), 'Subscriptions')
+    cache.close()
+
+    expired = CategoryCache(db_name, 'prompt v1', ttl_seconds=0)
+    assert expired.get(transaction('NETFLIX.COM')) is None
+    expired.close()
+
+
+def test_flush_evicts_least_recently_used(db_name):
+    cache = CategoryCache(db_name, 'prompt v1', max_entries=2)
+    for vendor in ('ALPHA', 'BRAVO', 'CHARLIE'):
+        cache.put(transaction(vendor), 'Dining')
+    with cache.conn:
+        cache.conn.execute("UPDATE category_cache SET last_used_at = 0 WHERE cache_key = 'bravo'")
+    cache.flush()
+    keys = {row[0] for row in cache.conn.execute("SELECT cache_key FROM category_cache")}
+    assert keys == {'alpha', 'charlie'}
+    cache.close()
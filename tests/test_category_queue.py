@@ -0,0 +1,92 @@
+import pytest
+
+from category_queue import CategoryQueue, enqueue, format_amount, retry_delay, RETRY_BASE_SECONDS
+from category_rules import PENDING_CATEGORY
+
+
+@pytest.fixture(autouse=True)
+def queued(conn, insert_transactions):
+    """Five Pending transactions (ids 1-5), queued."""
+    ids = insert_transactions(conn, [(0, '2025-01-%02d' % day, f'VENDOR {day}', 1000 + day, PENDING_CATEGORY)
+                                     for day in range(1, 6)])
+    with conn:
+        enqueue(conn, ids)
+
+
+def ids(transactions):
+    return sorted(transaction['id'] for transaction in transactions)
+
+
+def test_lease_hands_out_each_entry_once(conn):
+    queue = CategoryQueue(conn)
+    first = queue.lease(3, 'a')
+    second = queue.lease(3, 'b')
+    assert ids(first) == [1, 2, 3]
+    assert ids(second) == [4, 5]
+    assert queue.lease(3, 'c') == []
+    assert first[0] == {'id': 1, 'user_pk': 0, 'date': '2025-01-01', 'vendor': 'VENDOR 1',
+                        'dollar_amount': '10.01', 'attempts': 1}
+    assert queue.stats() == {'ready': 0, 'leased': 5, 'retrying': 0, 'parked': 0}
+
+
+def test_complete_writes_categories_and_retires_entries(conn):
+    queue = CategoryQueue(conn)
+    leased = queue.lease(5, 'a')
+    queue.complete({transaction['id']: 'Dining' for transaction in leased[:2]})
+    assert conn.execute("SELECT count(*) FROM transactions WHERE category = 'Dining'").fetchone()[0] == 2
+    assert conn.execute("SELECT count(*) FROM category_queue").fetchone()[0] == 3
+
+
+def test_expired_lease_is_leased_again_and_late_answer_is_ignored(conn):
+    queue = CategoryQueue(conn, lease_seconds=0)
+    stale = queue.lease(5, 'dead-worker')
+    fresh = queue.lease(5, 'b')
+    assert ids(stale) == ids(fresh) == [1, 2, 3, 4, 5]
+    assert {transaction['attempts'] for transaction in fresh} == {2}
+
+    queue.complete({1: 'Gas'})
+    queue.complete({1: 'Dining'})  # the first worker finally answers
+    assert conn.execute("SELECT category FROM transactions WHERE id = 1").fetchone()[0] == 'Gas'
+
+
+def test_failed_entries_back_off_then_park(conn):
+    queue = CategoryQueue(conn, max_attempts=2)
+    leased = queue.lease(1, 'a')
+    queue.fail(leased, {1: 'HTTP 503'}, 'a')
+    assert queue.stats()['retrying'] == 1
+    assert ids(queue.lease(5, 'a')) == [2, 3, 4, 5]
+
+    conn.execute("UPDATE category_queue SET available_at = 0 WHERE transaction_id = 1")
+    conn.commit()
+    leased = queue.lease(1, 'b')
+    assert leased[0]['attempts'] == 2
+    queue.fail(leased, {}, 'b')
+    assert queue.stats()['parked'] == 1
+    assert queue.errors() == [(1, 'VENDOR 1', 2, 'no answer')]
+
+    assert queue.requeue_parked() == 1
+    assert queue.lease(1, 'c')[0]['attempts'] == 1
+
+
+def test_fail_from_a_lost_lease_changes_nothing(conn):
+    queue = CategoryQueue(conn, lease_seconds=0)
+    stale = queue.lease(5, 'a')
+    queue.lease(5, 'b')
+    queue.fail(stale, {1: 'timeout'}, 'a')
+    assert conn.execute("SELECT lease_owner, last_error FROM category_queue WHERE transaction_id = 1").fetchone() == ('b', None)
+
+
+def test_release_returns_entries_without_spending_an_attempt(conn):
+    queue = CategoryQueue(conn)
+    queue.release(queue.lease(2, 'a'), 'a')
+    assert [transaction['attempts'] for transaction in queue.lease(2, 'b')] == [1, 1]
+
+
+@pytest.mark.parametrize('attempts, seconds', [(1, RETRY_BASE_SECONDS), (3, RETRY_BASE_SECONDS * 4), (30, 6 * 3600)])
+def test_retry_delay(attempts, seconds):
+    assert retry_delay(attempts) == seconds
+
+
+@pytest.mark.parametrize('cents, text', [(123450, '1234.50'), (5, '0.05'), (-250, '-2.50')])
+def test_format_amount(cents, text):
+    assert format_amount(cents) == text
@@ -0,0 +1,43 @@
+import pytest
+
+from category_rules import canonical_vendor, match_rule_category
+
+
+@pytest.mark.parametrize('vendor, amount, expected', [
+    ('7-ELEVEN 34412', '12.50', 'Gas'),
+    ('7 Eleven #1021 Orlando FL', '3.10', 'Gas'),
+    ('7/11 STORE 2231', '40.00', 'Gas'),
+    ('7-11 #447', '22.00', 'Gas'),
+    ('7ELE 1190', '9.99', 'Gas'),
+    ('WAWA 5120', '31.00', 'Gas'),
+    ('T-MOBILE USA *AUTOPAY', '85.00', 'Phone'),
+    ('SUNPASS*ACC123', '10.00', 'Transportation/Tolls'),
+    ('EZSUNPASS TOLL', '10.00', 'Transportation/Tolls'),
+    ('CASH APP*CASHAPP', '200.00', 'Personal Training'),
+    ('CASHAPP', '50.00', None),
+    # Short patterns inside store numbers, addresses or longer words
+    ('PUBLIX #711', '54.20', None),
+    ('WALGREENS #7110', '8.15', None),
+    ('SHOP 7 11TH AVE', '19.00', None),
+    ('KROGER 7-11 PLAZA', '61.40', None),
+    ('HOME DEPOT 7ELEMENTS', '120.00', None),
+    ('WAWAX', '4.00', None),
+    ('TERMINIXPRO', '99.00', None),
+])
+def test_match_rule_category(vendor, amount, expected):
+    assert match_rule_category({'vendor': vendor, 'dollar_amount': amount}) == expected
+
+
+@pytest.mark.parametrize('vendor, expected', [
+    ('SQ *BAHALA KA MAI LLC', 'bahala ka mai'),
+    ('Bahala Ka Mai #2 Orlando FL', 'bahala ka mai'),
+    ('AMZN Mktp US*2K4L09I2', 'amzn mktp us'),
+    ('TST* TACO BAR - DOWNTOWN', 'taco bar downtown'),
+    ('PAYPAL *NETFLIX.COM', 'netflix'),
+    ('SHELL OIL 57444218 TAMPA FL', 'shell oil'),
+    ('WWW.AMAZON.COM', 'amazon'),
+    ('DUKE ENERGY CO', 'duke energy'),
+    ('1234', '1234'),  # nothing left after stripping: falls back to the normalized descriptor
+])
+def test_canonical_vendor(vendor, expected):
+    assert canonical_vendor(vendor) == expected
@@ -0,0 +1,99 @@
+import csv
+import itertools
+import json
+
+import pytest
+
+from category_queue import CategoryQueue, enqueue
+from category_rules import PENDING_CATEGORY
+from export import COLUMNS, export_transactions, part_path
+
+
+@pytest.fixture
+def add(conn, insert_transactions):
+    """add(count, category='Dining', user_pk=0) inserts rows (queued if Pending) and returns their ids."""
+    numbers = itertools.count()
+
+    def add(count, category='Dining', user_pk=0):
+        ids = insert_transactions(conn, [(user_pk, f'2025-03-{number % 28 + 1:02d}', f'VENDOR {number}', 100 + number,
+                                          category) for number in itertools.islice(numbers, count)])
+        if category == PENDING_CATEGORY:
+            with conn:
+                enqueue(conn, ids)
+        return ids
+    return add
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(COLUMNS)
+    return [(int(row[0]), row[6]) for row in rows[1:]]
+
+
+def test_full_export_includes_pending_rows(conn, add, tmp_path):
+    add(3)
+    add(2, PENDING_CATEGORY)
+    add(3)
+    result = export_transactions(conn, tmp_path / 'tx.csv')
+    assert result['rows'] == 8
+    assert [category for _id, category in read_csv(tmp_path / 'tx.csv')].count(PENDING_CATEGORY) == 2
+
+
+def test_incremental_export_waits_for_queued_rows(conn, add, tmp_path):
+    path = tmp_path / 'tx.csv'
+    add(3)
+    pending = add(2, PENDING_CATEGORY)
+    add(3)
+    assert export_transactions(conn, path, incremental=True)['last_id'] == 3
+
+    CategoryQueue(conn).complete({transaction_id: 'Gas' for transaction_id in pending})
+    add(1)
+    result = export_transactions(conn, path, incremental=True)
+    assert (result['first_id'], result['last_id'], result['rows']) == (4, 9, 6)
+    rows = read_csv(path)
+    assert [row_id for row_id, _category in rows] == list(range(1, 10))
+    assert PENDING_CATEGORY not in {category for _id, category in rows}
+
+    assert export_transactions(conn, path, incremental=True)['rows'] == 0
+
+
+def test_parked_rows_do_not_hold_back_incremental_exports(conn, add, tmp_path):
+    add(2)
+    add(1, PENDING_CATEGORY)
+    add(2)
+    queue = CategoryQueue(conn, max_attempts=1)
+    queue.fail(queue.lease(1, 'worker'), {}, 'worker')
+    assert queue.stats()['parked'] == 1
+
+    result = export_transactions(conn, tmp_path / 'tx.jsonl', incremental=True)
+    assert result['rows'] == 5
+    with open(tmp_path / 'tx.jsonl', encoding='utf-8') as f:
+        assert [json.loads(line)['category'] for line in f][2] == PENDING_CATEGORY
+
+
+def test_queued_rows_outside_the_filter_do_not_hold_back(conn, add, tmp_path):
+    add(2, user_pk=0)
+    add(1, PENDING_CATEGORY, user_pk=1)
+    add(2, user_pk=0)
+    result = export_transactions(conn, tmp_path / 'tx.csv', incremental=True, users=[0])
+    assert (result['rows'], result['last_id']) == (4, 5)
+
+
+def test_incremental_export_must_keep_its_filters(conn, add, tmp_path):
+    add(2)
+    export_transactions(conn, tmp_path / 'tx.csv', categories=['Dining'])
+    with pytest.raises(ValueError, match='filters'):
+        export_transactions(conn, tmp_path / 'tx.csv', incremental=True, categories=['Gas'])
+
+
+def test_incremental_parquet_writes_part_files(conn, add, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'tx.parquet'
+    add(4)
+    export_transactions(conn, path, incremental=True, chunk_size=3)
+    add(2)
+    result = export_transactions(conn, path, incremental=True)
+    assert result['path'] == str(part_path(path, 5, 6))
+    assert pq.read_table(path).num_rows == 4
+    assert pq.read_table(result['path']).column('id').to_pylist() == [5, 6]
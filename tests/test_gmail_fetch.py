@@ -0,0 +1,34 @@
+import pytest
+
+import process_email
+from corpus import synthetic_corpus
+from fake_gmail import FakeGmailService
+from gmail_fetch import MAX_BATCH_RETRIES, fetch_messages_batch, iter_routed_messages
+
+
+@pytest.fixture(scope='module')
+def records():
+    return synthetic_corpus(60)
+
+
+def test_fetch_reports_messages_it_gave_up_on(records, no_backoff):
+    ids = [record['id'] for record in records[:5]]
+    service = FakeGmailService(records, errors={ids[1]: 500, ids[3]: 403})
+    fetched, failed = fetch_messages_batch(service, ids, msg_format='metadata')
+    assert sorted(fetched) == sorted(ids[:1] + ids[2:3] + ids[4:])
+    assert sorted(failed) == sorted([ids[1], ids[3]])
+    assert service.calls['batch'] == MAX_BATCH_RETRIES  # only the 500 is retried
+
+
+@pytest.mark.parametrize('status', [500, 404])
+def test_routed_messages_record_dropped_ids(records, status, no_backoff):
+    query = process_email.PARSERS.query()
+    expected = FakeGmailService(records)._query_matches(query)
+    dropped = expected[len(expected) // 2]
+
+    failed = set()
+    service = FakeGmailService(records, errors={dropped: status})
+    seen = [message_id for message_id, _message, _handler in iter_routed_messages(
+        service, query, process_email.PARSERS.match, process_email.METADATA_HEADERS, batch_size=7, failed=failed)]
+    assert seen == [message_id for message_id in expected if message_id != dropped]
+    assert failed == {dropped}
@@ -0,0 +1,91 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+import llm_client
+from llm_client import LLMClient, LLMError, backoff_delay, retry_after_seconds
+from metrics import METRICS
+from pipeline import RateLimiter
+
+CONFIG = {'model': 'gemini-test', 'max_tokens': 64, 'temperature': 0.1, 'top_p': 0.5, 'max_retries': 2}
+
+
+@pytest.fixture
+def client(gemini):
+    client = LLMClient(CONFIG, url=gemini.url)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays the client slept for, instead of sleeping."""
+    delays = []
+    monkeypatch.setattr(llm_client, 'time', SimpleNamespace(sleep=delays.append, time=time.time))
+    return delays
+
+
+def test_payload_comes_from_the_config():
+    payload = LLMClient(CONFIG, url='http://unused').payload('hi', system='rules', max_tokens=500, json_response=True)
+    assert payload['generationConfig'] == {'maxOutputTokens': 500, 'temperature': 0.1, 'topP': 0.5,
+                                           'candidateCount': 1, 'responseMimeType': 'application/json'}
+    assert payload['systemInstruction'] == {'parts': [{'text': 'rules'}]}
+    assert 'responseMimeType' not in LLMClient(CONFIG, url='http://unused').payload('hi')['generationConfig']
+
+
+def test_requests_share_one_connection(gemini, client):
+    connections = METRICS.value('llm_connections_total')
+    gemini.replies = [gemini.text(answer) for answer in ('Gas', 'Dining', 'Home')]
+    assert [client.generate(f'question {number}') for number in range(3)] == ['Gas', 'Dining', 'Home']
+    assert METRICS.value('llm_connections_total') - connections == 1
+
+
+def test_retryable_error_honors_retry_after(gemini, client, sleeps):
+    gemini.replies = [gemini.error(429, retry_after=7), gemini.text('Gas')]
+    assert client.generate('question') == 'Gas'
+    assert len(sleeps) == 1 and sleeps[0] >= 7
+
+
+def test_shared_limiter_paces_retries_instead_of_sleeping(gemini, client, sleeps):
+    gemini.replies = [gemini.error(503, retry_after=0), gemini.text('Gas')]
+    assert client.generate('question', limiter=RateLimiter(rate=100, burst=100)) == 'Gas'
+    assert sleeps == []
+
+
+def test_non_retryable_status_fails_at_once(gemini, client, sleeps):
+    gemini.replies = [gemini.error(400)]
+    with pytest.raises(LLMError) as error:
+        client.generate('question')
+    assert (error.value.status, len(gemini.bodies)) == (400, 1)
+
+
+def test_gives_up_after_max_retries(gemini, client, sleeps):
+    gemini.replies = [gemini.error(500)] * 3
+    with pytest.raises(LLMError) as error:
+        client.generate('question')
+    assert (error.value.status, len(gemini.bodies), len(sleeps)) == (500, 3, 2)
+
+
+def test_unusable_response(gemini, client):
+    gemini.replies = [lambda transactions: (200, {}, {'candidates': []})]
+    with pytest.raises(LLMError, match='unusable'):
+        client.generate('question')
+
+
+@pytest.mark.parametrize('value, expected', [(None, None), ('12', 12.0), ('-3', 0.0), ('soon', None)])
+def test_retry_after_seconds(value, expected):
+    headers = {} if value is None else {'Retry-After': value}
+    assert retry_after_seconds(SimpleNamespace(headers=headers)) == expected
+
+
+def test_retry_after_http_date():
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after_seconds(SimpleNamespace(headers={'Retry-After': when})) <= 30
+
+
+def test_backoff_delay_is_capped_and_respects_retry_after():
+    assert all(0 <= backoff_delay(attempt) <= llm_client.RETRY_MAX_SECONDS for attempt in range(20))
+    assert backoff_delay(0, retry_after=5) >= 5
@@ -0,0 +1,111 @@
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import migrations
+from migrations import MIGRATIONS, SCHEMA_VERSION, get_schema_version, migrate, to_cents, to_iso_date
+from rollups import rebuild_rollups
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def rollups(conn):
+    return conn.execute("SELECT * FROM monthly_rollups ORDER BY user_pk, month, category").fetchall()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('November 21, 2025', '2025-11-21'),
+    ('Nov 1, 2025', '2025-11-01'),
+    ('11/21/2025', '2025-11-21'),
+    ('2025-11-21', '2025-11-21'),
+])
+def test_to_iso_date(text, expected):
+    assert to_iso_date(text) == expected
+
+
+@pytest.mark.parametrize('amount, expected', [('1,234.50', 123450), ('$0.99', 99), ('12', 1200)])
+def test_to_cents(amount, expected):
+    assert to_cents(amount) == expected
+
+
+def test_fresh_database_reaches_current_version(conn):
+    assert get_schema_version(conn) == SCHEMA_VERSION == len(MIGRATIONS)
+    assert migrate(conn) == (SCHEMA_VERSION, SCHEMA_VERSION)
+
+
+def test_v1_rows_are_converted():
+    conn = sqlite3.connect(':memory:')
+    MIGRATIONS[0](conn)
+    conn.executemany("INSERT INTO transactions (user_pk, bank, date, vendor, dollar_amount, category) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", [
+                         (0, 'pnc', 'November 21, 2025', 'PUBLIX', '1,234.50', 'Grocery'),
+                         (0, 'pnc', 'Nov 22, 2025', 'WAWA', '4.10', 'Gas'),
+                         (0, 'pnc', 'sometime', 'ODD', '1.00', 'Merchandise'),
+                     ])
+    conn.commit()
+
+    assert migrate(conn) == (1, SCHEMA_VERSION)
+    assert conn.execute("SELECT date, amount_cents FROM transactions ORDER BY id").fetchall() == [
+        ('2025-11-21', 123450), ('2025-11-22', 410), ('sometime', 100)]
+    # The v3 backfill rolls up ISO-dated rows only
+    assert rollups(conn) == [(0, '2025-11', 'Gas', 1, 410, 410, 410), (0, '2025-11', 'Grocery', 1, 123450, 123450, 123450)]
+
+
+def test_rollup_triggers_match_a_rebuild(conn, insert_transactions):
+    insert_transactions(conn, [
+        (0, '2025-01-05', 'A', 500, 'Dining'),
+        (0, '2025-01-09', 'B', 900, 'Dining'),
+        (0, '2025-02-01', 'C', 300, 'Gas'),
+        (1, '2025-01-03', 'D', 700, 'Dining'),
+    ])
+    conn.execute("UPDATE transactions SET category = 'Grocery' WHERE vendor = 'B'")
+    conn.execute("UPDATE transactions SET date = '2025-03-01', amount_cents = 350 WHERE vendor = 'C'")
+    conn.execute("DELETE FROM transactions WHERE vendor = 'D'")
+    maintained = rollups(conn)
+
+    rebuild_rollups(conn)
+    assert maintained == rollups(conn)
+    assert (1, '2025-01', 'Dining', 1, 700, 700, 700) not in maintained
+
+
+def test_queue_entry_retired_by_category_or_delete(conn, insert_transactions):
+    insert_transactions(conn, [(0, '2025-01-05', 'A', 500, 'Pending'), (0, '2025-01-06', 'B', 600, 'Pending')])
+    conn.executemany("INSERT INTO category_queue (transaction_id, enqueued_at, available_at) VALUES (?, 0, 0)", [(1,), (2,)])
+    conn.execute("UPDATE transactions SET category = 'Pending' WHERE id = 1")
+    assert conn.execute("SELECT count(*) FROM category_queue").fetchone()[0] == 2
+
+    conn.execute("UPDATE transactions SET category = 'Dining' WHERE id = 1")
+    conn.execute("DELETE FROM transactions WHERE id = 2")
+    assert conn.execute("SELECT count(*) FROM category_queue").fetchone()[0] == 0
+
+
+def test_statement_changes_count_both_months_of_a_move(conn, insert_transactions):
+    insert_transactions(conn, [(0, '2025-01-05', 'A', 500, 'Dining')])
+    conn.execute("UPDATE transactions SET date = '2025-02-05'")
+    assert conn.execute("SELECT month, changes FROM statement_changes ORDER BY month").fetchall() == [
+        ('2025-01', 2), ('2025-02', 1)]
+
+
+def test_v8_keeps_tables_made_before_it(conn):
+    conn.execute("PRAGMA user_version = 7")
+    conn.execute("INSERT INTO sync_state (user_pk, history_id, watermark, updated_at) VALUES (0, '42', 1, 0)")
+    conn.commit()
+
+    assert migrate(conn) == (7, SCHEMA_VERSION)
+    assert conn.execute("SELECT history_id FROM sync_state").fetchall() == [('42',)]
+
+
+def test_migrating_does_not_import_reporting_code():
+    code = ("import sys, sqlite3; import migrations; migrations.migrate(sqlite3.connect(':memory:')); "
+            "print(sorted({'rollups', 'statements', 'export', 'category_queue', 'jinja2', 'reportlab'} & set(sys.modules)))")
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(migrations.__file__).parent).stdout
+    assert output.strip() == '[]'
@@ -0,0 +1,57 @@
+import base64
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+import process_email
+from mime_decode import get_message_text, get_mime_text, html_to_text
+
+XHTML = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+         '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">\n'
+         '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>Alert</title></head>'
+         '<body><p>Amount: $4.10</p><p>Merchant: WAWA 5120</p></body></html>')
+
+
+def b64(text):
+    return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+
+
+def html_payload(html):
+    return {'payload': {'mimeType': 'multipart/alternative', 'parts': [
+        {'mimeType': 'text/html', 'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="UTF-8"'}],
+         'body': {'data': b64(html)}},
+    ]}}
+
+
+def test_html_to_text_keeps_block_structure():
+    html = '<html><head><style>p {}</style></head><body><div>Amount:&nbsp;$12.00</div><script>x()</script>' \
+           '<table><tr><td>at</td><td>PUBLIX</td></tr></table></body></html>'
+    assert html_to_text(html) == 'Amount: $12.00\nat PUBLIX'
+
+
+def test_xhtml_with_encoding_declaration():
+    assert html_to_text(XHTML) == 'Amount: $4.10\nMerchant: WAWA 5120'
+    assert html_to_text(XHTML.encode()) == 'Amount: $4.10\nMerchant: WAWA 5120'
+
+
+@pytest.mark.parametrize('html', ['<!-- tracking pixel removed -->', '<?xml version="1.0" encoding="UTF-8"?><!-- -->'])
+def test_markup_without_a_document_has_no_text(html):
+    assert html_to_text(html) is None
+
+
+def test_full_payload_falls_back_to_html():
+    assert get_message_text(html_payload(XHTML)) == 'Amount: $4.10\nMerchant: WAWA 5120'
+
+
+def test_raw_message_prefers_text_plain():
+    message = MIMEMultipart('alternative')
+    message.attach(MIMEText('Amount: $9.99 at NETFLIX.COM', 'plain'))
+    message.attach(MIMEText('<p>ignored</p>', 'html'))
+    assert get_mime_text(message.as_bytes()) == 'Amount: $9.99 at NETFLIX.COM'
+
+
+def test_comment_only_body_is_skipped_not_raised():
+    parser = next(iter(process_email.PARSERS.by_bank.values()))
+    message = html_payload('<!-- -->')
+    assert process_email.extract_message_transaction('m1', message, 0, parser) is None
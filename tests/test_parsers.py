@@ -0,0 +1,63 @@
+import pytest
+
+from parsers import load_parsers
+
+PARSERS = load_parsers()
+
+
+def message(sender, subject, date='Fri, 21 Nov 2025 09:15:00 -0500'):
+    return {'payload': {'headers': [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject},
+                                    {'name': 'Date', 'value': date}]}}
+
+
+def test_query_covers_every_parser():
+    query = PARSERS.query()
+    assert query.startswith('(') and query.endswith(')')
+    assert query.count(' OR ') == len(PARSERS.parsers) - 1
+    assert '(from:pncalerts@pnc.com subject:"debit card purchase")' in query
+
+
+@pytest.mark.parametrize('sender, subject, bank', [
+    ('PNC Alerts <pncalerts@pnc.com>', 'Debit Card Purchase', 'pnc'),
+    ('Capital One <capitalone@notification.capitalone.com>',
+     'A new transaction was charged to your account', 'capital_one'),
+    ('"Amazon.com" <AUTO-CONFIRM@amazon.com>', 'Your Amazon.com order #112-3 has shipped', 'amazon'),
+    ('PNC Alerts <pncalerts@pnc.com>', 'Your statement is ready', None),
+    ('someone@example.com', 'Debit Card Purchase', None),
+])
+def test_match_routes_by_headers(sender, subject, bank):
+    parser = PARSERS.match(message(sender, subject))
+    assert (parser.bank if parser else None) == bank
+
+
+@pytest.mark.parametrize('bank, text, expected', [
+    ('pnc', 'A debit card purchase of $1,234.50 at SQ *CORNER CAFE, ORLANDO FL was made on 11/21/2025.',
+     ('11/21/2025', 'SQ *CORNER CAFE', '1234.50')),
+    ('capital_one', 'We are notifying you that on November 20, 2025, at SHELL OIL 5531, a pending authorization '
+                    'or purchase in the amount of $45.10 was placed or charged on your account.',
+     ('November 20, 2025', 'SHELL OIL 5531', '45.10')),
+    # No vendor or date in the body: the configured vendor and the Date header fill in
+    ('amazon', 'Thanks for your order.\nOrder Total: $23.99\n', ('2025-11-21', 'Amazon', '23.99')),
+])
+def test_extract(bank, text, expected):
+    transaction = PARSERS.by_bank[bank].extract(text, 3, message('x', 'y'))
+    assert (transaction['date'], transaction['vendor'], transaction['dollar_amount']) == expected
+    assert (transaction['user_pk'], transaction['bank']) == (3, bank)
+
+
+def test_extract_rejects_other_text():
+    assert PARSERS.by_bank['pnc'].extract('Your balance is $12.00', 0) is None
+    # Amazon needs the Date header when the body has no date
+    assert PARSERS.by_bank['amazon'].extract('Order Total: $23.99', 0) is None
+
+
+def test_parsers_for_senders_not_allowed_are_skipped(tmp_path):
+    config = tmp_path / 'config.yaml'
+    config.write_text("""
+email_search:
+  senders: ["pnc"]
+  parsers:
+    pnc: {sender: "pncalerts@pnc.com", subject: "Debit Card Purchase", pattern: '\\$(?P<amount>[\\d.]+)'}
+    other: {sender: "alerts@example.com", subject: "Purchase", pattern: '\\$(?P<amount>[\\d.]+)'}
+""", encoding='utf-8')
+    assert list(load_parsers(config).by_bank) == ['pnc']
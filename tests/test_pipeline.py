@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from pipeline import run_pipeline
+
+
+def failing_source(count, fail_at):
+    for number in range(count):
+        if number == fail_at:
+            raise RuntimeError("source failed")
+        yield number
+
+
+def run(source, parse=lambda item: item, categorize=lambda records: ['c'] * len(records), write=None):
+    written = []
+    run_pipeline(source, parse, categorize, write or (lambda item, record, category: written.append(item)),
+                 parse_workers=3, categorize_workers=2, batch_size=7, queue_size=4)
+    return written
+
+
+def test_writes_every_item_in_source_order():
+    assert run(range(500)) == list(range(500))
+
+
+def test_unparsed_items_reach_the_writer():
+    written = []
+    run(range(20), parse=lambda item: item if item % 2 else None,
+        write=lambda item, record, category: written.append((item, category)))
+    assert written == [(item, 'c' if item % 2 else None) for item in range(20)]
+
+
+def raise_on(value, exception):
+    def stage(arg):
+        if arg == value or (isinstance(arg, list) and value in arg):
+            raise exception
+        return arg if not isinstance(arg, list) else ['c'] * len(arg)
+    return stage
+
+
+@pytest.mark.parametrize('stage', ['source', 'parse', 'categorize', 'write'])
+def test_failing_stage_raises_and_leaves_no_threads(stage):
+    error = RuntimeError(f"{stage} failed")
+    kwargs = {}
+    if stage == 'parse':
+        kwargs['parse'] = raise_on(300, error)
+    elif stage == 'categorize':
+        kwargs['categorize'] = raise_on(300, error)
+    elif stage == 'write':
+        def write(item, record, category):
+            if item == 300:
+                raise error
+        kwargs['write'] = write
+
+    before = threading.active_count()
+    for _ in range(5):
+        with pytest.raises(RuntimeError, match=f"{stage} failed"):
+            run(failing_source(1000, 300) if stage == 'source' else range(1000), **kwargs)
+    assert threading.active_count() == before
@@ -0,0 +1,61 @@
+import pytest
+
+from recurring import TransactionHistory, epoch_day, iso_date, recurring_charges
+from transaction_store import connect_db
+
+AS_OF = epoch_day('2025-06-15')
+
+
+@pytest.fixture(autouse=True)
+def history(conn, insert_transactions):
+    # A monthly subscription and some one-off spending, inserted out of date order
+    insert_transactions(conn, [(0, f'2025-{month:02d}-03', 'NETFLIX.COM', 1599, 'Subscriptions')
+                               for month in (5, 1, 3, 2, 4, 6)])
+    insert_transactions(conn, [(0, '2025-02-11', 'CORNER CAFE', 850, 'Dining'),
+                               (0, '2025-01-20', 'CORNER CAFE', 1275, 'Dining'),
+                               (1, '2025-03-03', 'NETFLIX.COM', 999, 'Subscriptions')])
+
+
+def test_load_keeps_each_day_with_its_amount(conn):
+    history = TransactionHistory.load(conn, 0)
+    loaded = sorted((iso_date(day), history.descriptors[code], int(cents))
+                    for day, code, cents in zip(history.days, history.descriptor_codes, history.cents))
+    expected = sorted(conn.execute("SELECT date, vendor, amount_cents FROM transactions WHERE user_pk = 0"))
+    assert loaded == expected
+
+
+def test_empty_history(conn):
+    assert len(TransactionHistory.load(conn, 7)) == 0
+    assert recurring_charges(conn, 7, AS_OF) == []
+
+
+def test_detects_monthly_charge(conn):
+    [charge] = recurring_charges(conn, 0, AS_OF)
+    assert (charge['period'], charge['occurrences'], charge['amount_cents']) == ('monthly', 6, 1599)
+    assert (charge['first_date'], charge['last_date'], charge['active']) == ('2025-01-03', '2025-06-03', True)
+    assert charge['category'] == 'Subscriptions'
+
+
+@pytest.mark.parametrize('edit', [
+    "UPDATE transactions SET category = 'Entertainment' WHERE vendor = 'NETFLIX.COM'",
+    "UPDATE transactions SET vendor = 'NETFLIX' WHERE vendor = 'NETFLIX.COM' AND user_pk = 0",
+    "UPDATE transactions SET date = '2025-06-04' WHERE vendor = 'NETFLIX.COM' AND date = '2025-06-03'",
+])
+def test_cache_notices_edits_that_keep_count_and_total(conn, db_name, edit):
+    before = recurring_charges(conn, 0, AS_OF)
+    assert recurring_charges(conn, 0, AS_OF) is before
+
+    # Written through another connection, so this one's own change counters can't see it
+    other = connect_db(db_name)
+    with other:
+        other.execute(edit)
+    other.close()
+    after = recurring_charges(conn, 0, AS_OF)
+    assert after is not before
+    assert after == recurring_charges(connect_db(db_name), 0, AS_OF)
+
+
+def test_cache_is_per_user(conn, insert_transactions):
+    before = recurring_charges(conn, 0, AS_OF)
+    insert_transactions(conn, [(1, '2025-04-03', 'NETFLIX.COM', 999, 'Subscriptions')])
+    assert recurring_charges(conn, 0, AS_OF) is before
@@ -0,0 +1,57 @@
+import pytest
+
+from statements import generate_statements, statement_paths
+
+
+@pytest.fixture(autouse=True)
+def history(conn, insert_transactions):
+    insert_transactions(conn, [(0, '2025-01-05', 'CORNER CAFE', 1250, 'Dining'),
+                               (0, '2025-01-20', 'SHELL OIL 5531', 4000, 'Gas'),
+                               (0, '2025-02-03', 'CORNER CAFE', 900, 'Dining'),
+                               (0, '2025-03-09', 'PUBLIX #1123', 6120, 'Grocery')])
+
+
+def generate(conn, out_dir, formats=('html',), **kwargs):
+    return generate_statements(conn, formats=formats, out_dir=out_dir, workers=1, **kwargs)
+
+
+def counts(checked=0, rendered=0, unchanged=0, removed=0):
+    return {'checked': checked, 'rendered': rendered, 'unchanged': unchanged, 'removed': removed}
+
+
+def test_up_to_date_run_renders_nothing(conn, tmp_path):
+    # Each month plus the month after it (whose deltas depend on it)
+    assert generate(conn, tmp_path) == counts(checked=4, rendered=3)
+    assert all(path.exists() for month in ('2025-01', '2025-02', '2025-03')
+               for path in statement_paths(tmp_path, 0, month, ('html',)).values())
+    assert generate(conn, tmp_path) == counts()
+
+
+def test_edit_rerenders_its_month_and_the_next(conn, tmp_path):
+    generate(conn, tmp_path)
+    with conn:
+        conn.execute("UPDATE transactions SET amount_cents = 1300 WHERE date = '2025-01-05'")
+    assert generate(conn, tmp_path) == counts(checked=2, rendered=2)
+
+
+def test_write_that_keeps_the_numbers_is_not_rendered(conn, tmp_path):
+    generate(conn, tmp_path)
+    with conn:
+        conn.execute("UPDATE transactions SET category = category WHERE date = '2025-02-03'")
+    assert generate(conn, tmp_path) == counts(checked=2, unchanged=2)
+
+
+def test_emptied_month_is_removed(conn, tmp_path):
+    generate(conn, tmp_path)
+    with conn:
+        conn.execute("DELETE FROM transactions WHERE date = '2025-03-09'")
+    assert generate(conn, tmp_path) == counts(checked=2, removed=1)
+    assert not statement_paths(tmp_path, 0, '2025-03', ('html',))['html'].exists()
+
+
+def test_new_format_or_force_renders_everything(conn, tmp_path):
+    pytest.importorskip('reportlab')
+    generate(conn, tmp_path)
+    assert generate(conn, tmp_path, formats=('html', 'pdf')) == counts(checked=3, rendered=3)
+    assert statement_paths(tmp_path, 0, '2025-02', ('pdf',))['pdf'].read_bytes().startswith(b'%PDF')
+    assert generate(conn, tmp_path, formats=('html', 'pdf'), force=True) == counts(checked=3, rendered=3)
@@ -0,0 +1,86 @@
+import sqlite3
+
+import pytest
+
+import process_email
+from corpus import synthetic_corpus
+from fake_gmail import FakeGmailService, _http_error
+from sync_state import SyncLedger
+
+
+class FailingGmailService(FakeGmailService):
+    """Fails the `fail_at`-th batch request with a 500, like a run cut short mid-listing."""
+
+    def __init__(self, records, fail_at):
+        super().__init__(records)
+        self.fail_at = fail_at
+
+    def count(self, kind):
+        super().count(kind)
+        if kind == 'batch' and self.calls['batch'] == self.fail_at:
+            raise _http_error(500, 'Backend Error')
+
+
+@pytest.fixture(scope='module')
+def records():
+    return synthetic_corpus(1200)
+
+
+def processed_ids(db_name):
+    with sqlite3.connect(db_name) as conn:
+        return {row[0] for row in conn.execute("SELECT message_id FROM processed_messages")}
+
+
+def test_mid_run_flush_does_not_save_watermark(db_name):
+    ledger = SyncLedger(db_name, 0)
+    ledger.mark_processed('a', 1_700_000_000_000)
+    ledger.flush()
+    ledger.close()
+
+    ledger = SyncLedger(db_name, 0)
+    assert ledger.is_processed('a')
+    assert ledger.watermark is None
+    assert ledger.query_with_watermark('q') == 'q'
+    ledger.finish('42')
+    ledger.close()
+
+
+def test_finish_saves_history_id_and_watermark(db_name):
+    ledger = SyncLedger(db_name, 0)
+    ledger.mark_processed('a', 1_700_000_000_000)
+    ledger.finish('42')
+    ledger.close()
+
+    ledger = SyncLedger(db_name, 0)
+    assert (ledger.history_id, ledger.watermark) == ('42', 1_700_000_000)
+    ledger.close()
+
+
+def test_interrupted_first_sync_resumes_older_mail(db_name, records):
+    expected = set(FakeGmailService(records)._query_matches(process_email.PARSERS.query()))
+
+    first = process_email.process_user_inbox(FailingGmailService(records, fail_at=20), 0, parse_workers=1)
+    assert first is None
+    done = processed_ids(db_name)
+    assert 0 < len(done) < len(expected)
+
+    second = process_email.process_user_inbox(FakeGmailService(records), 0, parse_workers=1)
+    assert second == len(expected - done)
+    assert processed_ids(db_name) >= expected
+
+
+def test_sync_with_dropped_message_is_not_finished(db_name, records, no_backoff):
+    expected = set(FakeGmailService(records)._query_matches(process_email.PARSERS.query()))
+    dropped = sorted(expected)[0]
+
+    first = process_email.process_user_inbox(FakeGmailService(records, errors={dropped: 500}), 0, parse_workers=1)
+    assert first is None
+    assert processed_ids(db_name) == expected - {dropped}
+    ledger = SyncLedger(db_name, 0)
+    assert (ledger.history_id, ledger.watermark) == (None, None)
+    ledger.close()
+
+    # The error has cleared: the next run lists the mailbox again instead of short-circuiting
+    second = process_email.process_user_inbox(FakeGmailService(records), 0, parse_workers=1)
+    assert second == 1
+    assert processed_ids(db_name) == expected
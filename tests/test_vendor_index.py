@@ -0,0 +1,65 @@
+import pytest
+
+from vendor_index import INITIAL_CAPACITY, MIN_CONFIDENCE, VendorIndex
+
+
+@pytest.fixture
+def index():
+    index = VendorIndex()
+    index.add('SQ *BAHALA KA MAI LLC', 'Hair', 4)
+    index.add('CORNER CAFE #12 ORLANDO FL', 'Dining', 3)
+    index.add('CORNER CAFE 0031', 'Grocery', 2)
+    return index
+
+
+def test_same_merchant_under_another_descriptor(index):
+    assert index.lookup('Bahala Ka Mai #2 Orlando FL') == ('Hair', 1.0, 'bahala ka mai')
+
+
+def test_close_name_clears_the_threshold(index):
+    category, confidence, matched = index.lookup('BAHALA KA MAI SALON')
+    assert (category, matched) == ('Hair', 'bahala ka mai')
+    assert MIN_CONFIDENCE <= confidence < 1.0
+
+
+def test_unrelated_name_is_not_matched(index):
+    assert index.lookup('DUKE ENERGY') is None
+
+
+def test_disagreeing_history_lowers_confidence(index):
+    # An exact name match, but only 3 of its 5 transactions agree
+    assert index.lookup('CORNER CAFE') is None
+    lenient = VendorIndex(min_confidence=0.6)
+    lenient.add('CORNER CAFE', 'Dining', 3)
+    lenient.add('CORNER CAFE', 'Grocery', 2)
+    assert lenient.lookup('CORNER CAFE') == ('Dining', 0.6, 'corner cafe')
+
+
+@pytest.mark.parametrize('vendor, category', [
+    ('NEW PLACE', 'Pending'),           # not a real category
+    ('Cashapp*Yaniel', 'Personal Training'),  # depends on the amount
+])
+def test_ignored_answers(vendor, category):
+    index = VendorIndex()
+    index.add(vendor, category)
+    assert len(index) == 0
+
+
+def test_grows_past_initial_capacity():
+    index = VendorIndex()
+    names = [f'SHOP Q{chr(65 + number // 26)}{chr(65 + number % 26)}' for number in range(INITIAL_CAPACITY + 20)]
+    for name in names:
+        index.add(name, 'Home')
+    assert len(index) == len(names)
+    assert index.lookup(names[-1]) == ('Home', 1.0, names[-1].lower())
+
+
+def test_refresh_reads_only_new_rows(conn, insert_transactions):
+    index = VendorIndex()
+    insert_transactions(conn, [(0, '2025-01-02', 'NETFLIX.COM', 1599, 'Subscriptions'),
+                               (0, '2025-02-02', 'NETFLIX.COM', 1599, 'Subscriptions')])
+    assert index.refresh(conn) == 2
+    assert index.refresh(conn) == 0
+    insert_transactions(conn, [(0, '2025-03-02', 'NETFLIX.COM', 1599, 'Subscriptions')])
+    assert index.refresh(conn) == 1
+    assert index.lookup('PAYPAL *NETFLIX.COM') == ('Subscriptions', 1.0, 'netflix')